@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки чистых функций, которые выполняются на каждое сообщение
+Нормализация города, определение намерений и извлечение города/местоположения, разбор RSS,
+формирование новостного контекста, дедупликация и оформление результатов мультипоиска, промпты моделей.
+
+Результаты (мкс на вызов, лучшая из нескольких серий) сравниваются с сохранённым baseline.json:
+если функция стала медленнее больше чем в --threshold раз, скрипт завершается с ошибкой.
+Общая скорость машины (частота, соседи по виртуалке) учитывается калибровочным циклом, который
+измеряется вперемешку с каждым бенчмарком: сравнивается время функции в единицах калибровки.
+После смены версии Python сохраните baseline заново.
+
+Запуск: python benchmarks/bench_hotpath.py [--filter rss] [--threshold 1.5]
+        python benchmarks/bench_hotpath.py --save-baseline
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rss_news  # noqa: E402
+from intents import detect_intents, intent_engine, normalize_city_name  # noqa: E402
+from multi_search import MultiSearch  # noqa: E402
+from prompts import build_giga_prompt, build_yandex_messages  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+MESSAGES = [
+    "Какая погода в Москве?",
+    "Где находится Красная площадь?",
+    "Что случилось в России сегодня?",
+    "Расскажи анекдот про программистов",
+    "Напиши стихотворение о весне и о том, как тает снег на крышах домов",
+    "Объясни квантовую физику простыми словами, пожалуйста, без формул",
+    "как добраться до Эрмитажа от Московского вокзала",
+    "Погода в Новосибирске на выходные",
+]
+CITIES = ["Москве", "питере", "Новосибирске", "Самаре", "Лондоне", "Калининграде", "Уфы", "Сочи"]
+# Фиксированная дата: промпты не должны зависеть от момента запуска
+NOW = datetime(2025, 11, 24, 12, 0)
+
+
+def make_feed(items: int = 100) -> bytes:
+    """RSS-лента размером с архив РИА: длинные описания с HTML-разметкой"""
+    entries = "".join(
+        f"<item><title>Новость номер {i}: событие дня</title><link>https://ria.example/news/{i}.html</link>"
+        f"<description>&lt;p&gt;&lt;img src=\"https://ria.example/{i}.jpg\"/&gt;Подробности события {i} "
+        f"&lt;b&gt;в Москве&lt;/b&gt;.&lt;/p&gt;{' Текст описания новости.' * 30}</description>"
+        f"<pubDate>Mon, 24 Nov 2025 12:{i % 60:02d}:00 +0300</pubDate><category>Общество</category></item>"
+        for i in range(items)
+    )
+    return (f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>РИА</title>'
+            f'{entries}</channel></rss>').encode()
+
+
+def make_news_poller() -> rss_news.RssPoller:
+    """Поллер со снимком из трёх лент, как после фонового обновления"""
+    poller = rss_news.RssPoller()
+    for name in poller.feeds:
+        poller._merge(name, rss_news.parse_feed(make_feed(rss_news.RSS_BUFFER_SIZE), name, rss_news.RSS_BUFFER_SIZE))
+    return poller
+
+
+def make_searcher() -> MultiSearch:
+    """Мультипоиск с поисковиками в памяти: результаты частично пересекаются по URL"""
+    searcher = MultiSearch()
+
+    def engine(name: str, offset: int):
+        async def search(query: str, max_results: int = 3) -> List[Dict]:
+            return [
+                {'title': f"{query} — результат {i}", 'body': "Описание результата поиска. " * 20,
+                 'url': f"https://example.com/{i}", 'source': name, 'date': "24.11.2025"}
+                for i in range(offset, offset + max_results)
+            ]
+        return search
+
+    searcher.search_engines = {name: engine(name, offset) for offset, name in enumerate(('mojeek', 'metager', 'brave'))}
+    return searcher
+
+
+def build_cases() -> Dict[str, Tuple[Callable[[], object], int]]:
+    """Название -> (функция без аргументов, сколько вызовов целевой функции она делает)"""
+    feed = make_feed()
+    rss_news._rss_poller = make_news_poller()
+    news_context = rss_news.get_news_context(max_items=5)
+    searcher = make_searcher()
+    loop = asyncio.new_event_loop()
+
+    return {
+        "normalize_city_name": (lambda: [normalize_city_name(city) for city in CITIES], len(CITIES)),
+        "intents.match_keywords": (lambda: [intent_engine.match_intents(m) for m in MESSAGES], len(MESSAGES)),
+        "intents.detect_with_entities": (lambda: [detect_intents(m) for m in MESSAGES], len(MESSAGES)),
+        "rss.parse_feed": (lambda: rss_news.parse_feed(feed, 'ria', 5), 1),
+        "rss.get_news_context": (lambda: rss_news.get_news_context(max_items=5), 1),
+        "multi_search.search_all": (lambda: loop.run_until_complete(searcher.search_all("новости", 3)), 1),
+        "prompts.build_yandex_messages": (
+            lambda: (build_yandex_messages(MESSAGES[0], news_context, NOW), build_yandex_messages(MESSAGES[3], "", NOW)), 2),
+        "prompts.build_giga_prompt": (
+            lambda: (build_giga_prompt(MESSAGES[0], news_context, NOW), build_giga_prompt(MESSAGES[3], "", NOW)), 2),
+    }
+
+
+def series_size(timer: timeit.Timer, duration: float) -> int:
+    """Число вызовов, при котором серия длится около duration секунд"""
+    number, elapsed = timer.autorange()
+    return max(1, int(number * duration / max(elapsed, 1e-9)))
+
+
+def measure(func: Callable[[], object], calls: int, repeat: int) -> Tuple[float, float]:
+    """Лучшее время одного вызова целевой функции и калибровочного цикла, микросекунды"""
+    timer = timeit.Timer(func)
+    calibration_timer = timeit.Timer(calibration_workload)
+    number = series_size(timer, 0.1)
+    calibration_number = series_size(calibration_timer, 0.05)
+    best = calibration_best = float('inf')
+    # Серии чередуются, чтобы функция и калибровка попадали в одни и те же условия машины
+    for _ in range(repeat):
+        calibration_best = min(calibration_best, calibration_timer.timeit(calibration_number) / calibration_number)
+        best = min(best, timer.timeit(number) / (number * calls))
+    return best * 1e6, calibration_best * 1e6
+
+
+def calibration_workload() -> int:
+    """Фиксированная работа на чистом Python: строки, словари и циклы, как в проверяемых функциях"""
+    counts: Dict[str, int] = {}
+    for i in range(200):
+        key = f"слово{i % 17}".lower()
+        counts[key] = counts.get(key, 0) + len(key.split("о"))
+    return sum(counts.values())
+
+
+def machine_info() -> Dict[str, str]:
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'processor': platform.processor() or "unknown",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="запускать только бенчмарки, в названии которых есть подстрока")
+    parser.add_argument("--repeat", type=int, default=7, help="серий измерений на бенчмарк")
+    parser.add_argument("--threshold", type=float, default=1.5, help="допустимое замедление относительно baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="файл baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результаты как новый baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    baseline_results = baseline.get("results", {})
+    if baseline and baseline.get("machine") != machine_info():
+        print(f"⚠️ Baseline снят на другой машине ({baseline.get('machine')}), сравнение приблизительное")
+
+    baseline_relative = baseline.get("relative", {})
+
+    results = {}
+    relative = {}
+    regressions = []
+    for name, (func, calls) in build_cases().items():
+        if args.filter not in name:
+            continue
+        result, calibration = measure(func, calls, args.repeat)
+        results[name] = round(result, 3)
+        relative[name] = round(result / calibration, 5)
+        reference = baseline_results.get(name)
+        if reference and name in baseline_relative:
+            # Отношение времени в единицах калибровки: не зависит от общей скорости машины
+            ratio = relative[name] / baseline_relative[name]
+            mark = "❌" if ratio > args.threshold else "✅"
+            if ratio > args.threshold:
+                regressions.append(name)
+            print(f"{mark} {name:32s} {result:10.2f} мкс   baseline {reference:10.2f} мкс   x{ratio:5.2f} с поправкой")
+        else:
+            print(f"   {name:32s} {result:10.2f} мкс   (нет в baseline)")
+
+    if args.save_baseline:
+        baseline_results.update(results)
+        baseline_relative.update(relative)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                'machine': machine_info(),
+                'saved_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'results': dict(sorted(baseline_results.items())),
+                'relative': dict(sorted(baseline_relative.items())),
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"Baseline сохранён: {args.baseline}")
+    elif regressions:
+        raise SystemExit(f"Замедление больше чем в {args.threshold} раза: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк приёма обновлений Telegram в режимах long polling и webhook
+Поддельный Bot API сервер отдаёт обновления через getUpdates или отправляет их POST-запросами
+во встроенный webhook-сервер бота; измеряется время от первой отправки до обработки последнего обновления
+
+Обновления обрабатывает тот же планировщик, что и в боте: чаты параллельно, один чат — по порядку
+(--workers 1 — последовательная обработка, как раньше); порядок внутри каждого чата проверяется
+
+Запуск: python benchmarks/bench_ingestion.py [--updates 2000] [--chats 50] [--senders 40] [--workers 32] [--delay 0.05]
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from concurrency import ChatOrderedUpdateProcessor  # noqa: E402
+
+TOKEN = "123456:BENCHMARK"
+SECRET = "bench-secret"
+WEBHOOK_PATH = "telegram"
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    """Обновление с текстовым сообщением в формате Bot API"""
+    user = {"id": chat_id, "is_bot": False, "first_name": "Bench"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": user,
+            "text": "Привет, как дела?",
+        },
+    }
+
+
+class FakeBotApi:
+    """Поддельный Bot API: очередь для getUpdates и счётчик отправленных ответов"""
+
+    def __init__(self):
+        self.pending = []
+        self.condition = threading.Condition()
+        self.sent_messages = 0
+        self.get_updates_calls = 0
+
+    def push(self, updates) -> None:
+        with self.condition:
+            self.pending.extend(updates)
+            self.condition.notify_all()
+
+    def get_updates(self, offset: int, limit: int, timeout: float):
+        self.get_updates_calls += 1
+        with self.condition:
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+            if not self.pending:
+                self.condition.wait(timeout)
+            return self.pending[:limit]
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Заголовки и тело уходят отдельными записями — без этого каждый ответ ждёт отложенный ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(raw or b"{}")
+                else:
+                    # python-telegram-bot отправляет параметры формой
+                    params = {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+
+                if method == "getMe":
+                    result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+                elif method == "getUpdates":
+                    result = api.get_updates(int(params.get("offset") or 0), int(params.get("limit") or 100),
+                                             float(params.get("timeout") or 0))
+                elif method in ("sendMessage", "editMessageText"):
+                    api.sent_messages += 1
+                    result = {
+                        "message_id": api.sent_messages,
+                        "date": int(time.time()),
+                        "chat": {"id": int(params.get("chat_id") or 1), "type": "private"},
+                        "text": "ok",
+                    }
+                else:
+                    result = True
+
+                body = json.dumps({"ok": True, "result": result}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Бот остановил long polling, не дождавшись ответа
+                    pass
+
+        return Handler
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_api(api: FakeBotApi) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", free_port()), api.handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_application(api_port: int, done: asyncio.Event, expected: int, stats: dict,
+                      workers: int, delay: float) -> Application:
+    """Приложение с обработчиком, который отвечает на сообщение, как бот"""
+    builder = Application.builder().token(TOKEN).base_url(f"http://127.0.0.1:{api_port}/bot")
+    if workers > 1:
+        builder = builder.concurrent_updates(ChatOrderedUpdateProcessor(max_workers=workers))
+    application = builder.build()
+
+    async def on_message(update: Update, context) -> None:
+        chat_id = update.effective_chat.id
+        # Обновления одного чата должны приходить в обработчик по возрастанию update_id
+        if update.update_id < stats["last_in_chat"].get(chat_id, 0):
+            stats["out_of_order"] += 1
+        stats["last_in_chat"][chat_id] = update.update_id
+        if delay:
+            # Имитация ожидания ответа модели
+            await asyncio.sleep(delay)
+        await update.message.reply_text("ok")
+        stats["handled"] += 1
+        stats["latency"] += time.perf_counter() - stats["sent_at"][update.update_id]
+        if stats["handled"] >= expected:
+            done.set()
+
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_message))
+    return application
+
+
+def post_update(port: int, update: dict, secret: str) -> int:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        connection.request(
+            "POST", f"/{WEBHOOK_PATH}", body=json.dumps(update),
+            headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+        )
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+async def run_mode(mode: str, updates: int, chats: int, senders: int, workers: int, delay: float) -> dict:
+    api = FakeBotApi()
+    server = start_fake_api(api)
+    done = asyncio.Event()
+    stats = {"handled": 0, "latency": 0.0, "sent_at": {}, "last_in_chat": {}, "out_of_order": 0}
+    application = build_application(server.server_address[1], done, updates, stats, workers, delay)
+    batch = [make_update(i + 1, 1000 + i % chats) for i in range(updates)]
+
+    async with application:
+        await application.start()
+        if mode == "polling":
+            await application.updater.start_polling(timeout=10, allowed_updates=Update.ALL_TYPES)
+            started = time.perf_counter()
+            for update in batch:
+                stats["sent_at"][update["update_id"]] = time.perf_counter()
+            api.push(batch)
+        else:
+            port = free_port()
+            await application.updater.start_webhook(
+                listen="127.0.0.1", port=port, url_path=WEBHOOK_PATH,
+                secret_token=SECRET, max_connections=senders,
+            )
+            # Запрос без секрета должен быть отклонён
+            loop = asyncio.get_running_loop()
+            status = await loop.run_in_executor(None, post_update, port, make_update(0, 1), "wrong")
+            assert status == 403, f"webhook принял запрос без секрета (HTTP {status})"
+
+            def send(update):
+                stats["sent_at"][update["update_id"]] = time.perf_counter()
+                return post_update(port, update, SECRET)
+
+            started = time.perf_counter()
+            executor = ThreadPoolExecutor(max_workers=senders)
+            statuses = await asyncio.gather(*(loop.run_in_executor(executor, send, update) for update in batch))
+            executor.shutdown()
+            assert all(status == 200 for status in statuses), "webhook отклонил часть обновлений"
+
+        await asyncio.wait_for(done.wait(), timeout=120)
+        elapsed = time.perf_counter() - started
+        await application.updater.stop()
+        await application.stop()
+
+    server.shutdown()
+    return {
+        "mode": mode,
+        "updates": updates,
+        "elapsed": elapsed,
+        "throughput": updates / elapsed,
+        "latency_ms": stats["latency"] / updates * 1000,
+        "replies": api.sent_messages,
+        "get_updates_calls": api.get_updates_calls,
+        "out_of_order": stats["out_of_order"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000, help="сколько обновлений отправить")
+    parser.add_argument("--chats", type=int, default=50, help="в скольких чатах")
+    parser.add_argument("--senders", type=int, default=40, help="параллельных отправителей webhook (= max_connections)")
+    parser.add_argument("--workers", type=int, default=32, help="одновременных обработчиков (1 — последовательно)")
+    parser.add_argument("--delay", type=float, default=0.0, help="время работы обработчика, секунд")
+    parser.add_argument("--modes", default="polling,webhook", help="режимы через запятую")
+    args = parser.parse_args()
+
+    for mode in args.modes.split(","):
+        result = asyncio.run(run_mode(mode, args.updates, args.chats, args.senders, args.workers, args.delay))
+        assert result["out_of_order"] == 0, f"нарушен порядок обновлений в чате: {result['out_of_order']}"
+        print(
+            f"{result['mode']:8s} {result['updates']} обновлений за {result['elapsed']:.2f} с: "
+            f"{result['throughput']:8.1f} обн/с, средняя задержка {result['latency_ms']:7.1f} мс, "
+            f"ответов {result['replies']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
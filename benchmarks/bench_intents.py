@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк определения намерений
+Сравнивает прежнюю схему (списки ключевых слов в обработчике, lower() и any() на каждую группу,
+импорт re внутри функции) с предсобранным IntentEngine
+
+Запуск: python benchmarks/bench_intents.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intents import detect_intents  # noqa: E402
+
+MESSAGES = [
+    "Какая погода в Москве?",
+    "Где находится Красная площадь?",
+    "Что случилось в России сегодня?",
+    "Расскажи анекдот про программистов",
+    "Напиши стихотворение о весне и о том, как тает снег на крышах домов",
+    "Объясни квантовую физику простыми словами, пожалуйста, без формул",
+    "как добраться до Эрмитажа от Московского вокзала",
+    "Помоги решить задачу: поезд выехал из пункта А со скоростью 60 км/ч",
+]
+
+
+def legacy_detect(user_message: str):
+    """Копия прежней логики из handle_yandex_request/handle_giga_request"""
+    weather_keywords = ['погод', 'температур', 'градус', 'тепло', 'холодно', 'дожд', 'снег']
+    map_keywords = ['карт', 'адрес', 'координат', 'местоположен', 'как добраться', 'где находится', 'где ', 'остановк', 'магазин', 'универмаг']
+    search_keywords = [
+        'сейчас', 'новост', 'актуальн', 'текущ', 'последн',
+        'что там', 'как там', 'что с', 'что происходит',
+        'где', 'когда', 'кто', 'какой', 'какая', 'какие',
+        '2024', '2025', 'год', 'месяц',
+        'президент', 'правительств', 'министр', 'выбор', 'победил',
+        'эмануэль', 'макрон', 'трамп', 'путин', 'байден',
+        'франц', 'росси', 'америк', 'сша', 'украин',
+        'событи', 'ситуаци', 'положени', 'состояни',
+        'подал', 'ушел', 'уволи', 'назначи', 'избра'
+    ]
+
+    needs_weather = any(keyword in user_message.lower() for keyword in weather_keywords)
+    needs_map = any(keyword in user_message.lower() for keyword in map_keywords)
+    needs_search = any(keyword in user_message.lower() for keyword in search_keywords)
+
+    city = location = None
+    if needs_weather:
+        import re
+        city_match = re.search(r'в\s+([А-Яа-яA-Za-z\-]+)', user_message)
+        if not city_match:
+            city_match = re.search(r'погод[аые]\s+([А-Яа-яA-Za-z\-]+)', user_message)
+        if city_match:
+            city = city_match.group(1)
+    if needs_map:
+        import re
+        location_match = re.search(r'(?:карт[аыу]|адрес|координат[ыа]|где находится|как добраться|где)\s+(.+)', user_message, re.IGNORECASE)
+        if location_match:
+            location = location_match.group(1).strip('?!.')
+    return needs_weather, needs_map, needs_search, city, location
+
+
+def check_equivalence() -> None:
+    for message in MESSAGES:
+        result = detect_intents(message)
+        expected = legacy_detect(message)
+        actual = (result.needs_weather, result.needs_map, result.needs_search, result.city, result.location)
+        assert actual == expected, (message, actual, expected)
+
+
+def bench(func, number: int) -> float:
+    """Среднее время обработки одного сообщения, микросекунды"""
+    timer = timeit.Timer(lambda: [func(message) for message in MESSAGES])
+    best = min(timer.repeat(repeat=5, number=number))
+    return best / (number * len(MESSAGES)) * 1e6
+
+
+def main() -> None:
+    check_equivalence()
+    number = 2000
+    legacy = bench(legacy_detect, number)
+    engine = bench(detect_intents, number)
+    print(f"Прежняя схема:  {legacy:7.2f} мкс/сообщение")
+    print(f"IntentEngine:   {engine:7.2f} мкс/сообщение")
+    print(f"Ускорение:      {legacy / engine:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
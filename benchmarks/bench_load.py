@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест бота целиком без доступа в интернет
+Локальные заглушки заменяют Telegram Bot API, RSS-ленты, OpenWeatherMap, Nominatim и GigaChat
+(HTTP-сервер в отдельном процессе); Yandex GPT заменяется заглушкой SDK внутри процесса бота,
+потому что настоящий SDK работает по gRPC. Задержка и доля ошибок задаются для каждого сервиса.
+
+Бот (UnifiedBot) получает обновления через long polling от заглушки Telegram; время ответа —
+от появления обновления до последней правки сообщения-заглушки с кнопкой возврата в меню.
+Результат: сообщений в секунду, перцентили времени ответа, ошибки, пиковая память процесса бота.
+
+Запуск: python benchmarks/bench_load.py [--updates 1000] [--chats 100]
+        [--latency gigachat=0.3,yandex=0.3,weather=0.05,nominatim=0.1,rss=0.05,telegram=0.005]
+        [--errors gigachat=0.02] [--mix chat=4,news=3,weather=2,maps=1] [--json result.json]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TOKEN = "123456:LOADTEST"
+
+DEFAULT_LATENCY = "gigachat=0.3,yandex=0.3,weather=0.05,nominatim=0.1,rss=0.05,telegram=0.005"
+
+# Сообщения по типам запросов: обычный разговор, новости (RSS), погода, карты
+MESSAGES = {
+    'chat': ["Расскажи о Python", "Напиши стихотворение про осень", "Объясни квантовую физику"],
+    'news': ["Что нового сегодня?", "Новости дня"],
+    'weather': ["Какая погода в Москве?", "Погода в Казани", "Какая погода в Новосибирске?"],
+    'maps': ["Где находится Эрмитаж", "Где находится Кремль"],
+}
+
+
+def parse_profile(value: str) -> dict:
+    """Разбирает настройку вида "gigachat=0.3,weather=0.05" """
+    profile = {}
+    for item in (value or "").split(','):
+        name, _, number = item.strip().partition('=')
+        if name and number:
+            profile[name] = float(number)
+    return profile
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# ---------------------------------------------------------------------------
+# Заглушки внешних сервисов (отдельный процесс)
+# ---------------------------------------------------------------------------
+
+def rss_feed(name: str, items: int = 30) -> bytes:
+    entries = "".join(
+        f"<item><title>Новость {name} номер {i}</title><link>https://{name}.example/news/{i}</link>"
+        f"<description>&lt;p&gt;Подробности события {i} &lt;b&gt;из ленты {name}&lt;/b&gt;.&lt;/p&gt;"
+        f"{' Текст описания.' * 20}</description><pubDate>Mon, 01 Jan 2024 12:{i % 60:02d}:00 +0300</pubDate></item>"
+        for i in range(items)
+    )
+    return f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>{name}</title>{entries}</channel></rss>'.encode()
+
+
+class StubUpstreams:
+    """Состояние заглушек: очередь обновлений Telegram, время ответов и счётчики запросов"""
+
+    def __init__(self, latency: dict, errors: dict, seed: int = 1):
+        self.latency = latency
+        self.errors = errors
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.updates = []
+        self.pushed_at = {}
+        # Обновления каждого чата, ещё не получившие сообщение-заглушку (чат обрабатывается по порядку)
+        self.waiting_by_chat = {}
+        self.update_by_message = {}
+        self.latencies = []
+        self.failed = 0
+        self.busy = 0
+        self.unavailable = 0
+        self.cached = 0
+        self.next_message_id = 1
+        self.requests = {}
+        self.feeds = {name: rss_feed(name) for name in ('ria', 'tass', 'interfax')}
+
+    def delay(self, service: str) -> bool:
+        """Имитирует задержку сервиса; возвращает True, если запрос должен завершиться ошибкой"""
+        with self.lock:
+            self.requests[service] = self.requests.get(service, 0) + 1
+            jitter = self.random.uniform(0.5, 1.5)
+            failed = self.random.random() < self.errors.get(service, 0.0)
+        latency = self.latency.get(service, 0.0) * jitter
+        if latency:
+            time.sleep(latency)
+        return failed
+
+    # Telegram
+
+    def push(self, updates) -> None:
+        now = time.perf_counter()
+        with self.condition:
+            for update in updates:
+                self.pushed_at[update["update_id"]] = now
+                chat_id = update["message"]["chat"]["id"]
+                self.waiting_by_chat.setdefault(chat_id, deque()).append(update["update_id"])
+            self.updates.extend(updates)
+            self.condition.notify_all()
+
+    def get_updates(self, offset: int, limit: int, timeout: float):
+        with self.condition:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            if not self.updates:
+                self.condition.wait(timeout)
+            return self.updates[:limit]
+
+    def telegram(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Load", "username": "load_bot"}
+        if method == "getUpdates":
+            return self.get_updates(int(params.get("offset") or 0), int(params.get("limit") or 100),
+                                    float(params.get("timeout") or 0))
+        if method not in ("sendMessage", "editMessageText"):
+            return True
+
+        self.delay("telegram")
+        chat_id = int(params.get("chat_id") or 0)
+        text = params.get("text") or ""
+        with self.lock:
+            if method == "sendMessage":
+                message_id = self.next_message_id
+                self.next_message_id += 1
+                waiting = self.waiting_by_chat.get(chat_id)
+                if waiting and params.get("reply_markup"):
+                    # Модель отключена предохранителем или ответ взят из кэша: бот отвечает сразу, без заглушки
+                    self.latencies.append(time.perf_counter() - self.pushed_at.pop(waiting.popleft()))
+                    if text.startswith("⚡"):
+                        self.unavailable += 1
+                    else:
+                        self.cached += 1
+                elif waiting:
+                    self.update_by_message[message_id] = waiting.popleft()
+            else:
+                message_id = int(params.get("message_id") or 0)
+                # Окончательный ответ (как и сообщение об ошибке) приходит с кнопкой возврата в меню
+                if params.get("reply_markup") and message_id in self.update_by_message:
+                    update_id = self.update_by_message.pop(message_id)
+                    self.latencies.append(time.perf_counter() - self.pushed_at.pop(update_id))
+                    if text.startswith("❌"):
+                        self.failed += 1
+                    elif text.startswith("⏳"):
+                        self.busy += 1
+        return {"message_id": message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": text}
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"answered": len(self.latencies), "failed": self.failed, "busy": self.busy,
+                    "unavailable": self.unavailable, "cached": self.cached,
+                    "latencies": list(self.latencies), "requests": dict(self.requests)}
+
+    # Остальные сервисы
+
+    def weather(self, query: dict):
+        city = query.get("q", [""])[0]
+        return {
+            "main": {"temp": 12.5, "feels_like": 11.0, "humidity": 70, "pressure": 1012},
+            "weather": [{"description": "переменная облачность"}],
+            "wind": {"speed": 3.2},
+            "name": city,
+        }
+
+    def nominatim(self, query: dict):
+        place = query.get("q", [""])[0]
+        return [{"lat": "55.7520", "lon": "37.6175", "display_name": f"{place}, Россия"}]
+
+    def gigachat(self, body: dict, text: str):
+        message = {"role": "assistant", "content": text}
+        return {
+            "choices": [{"message": message, "index": 0, "finish_reason": "stop"}],
+            "created": int(time.time()), "model": "GigaChat", "object": "chat.completion",
+            "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+        }
+
+
+def stub_answer(prompt: str) -> str:
+    return f"Это ответ заглушки на запрос длиной {len(prompt)} символов. " * 4
+
+
+def make_handler(stubs: StubUpstreams):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def reply(self, status: int, body: bytes, content_type: str = "application/json",
+                  headers: dict = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def reply_json(self, data, status: int = 200) -> None:
+            self.reply(status, json.dumps(data, ensure_ascii=False).encode())
+
+        def read_body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/control/stats":
+                self.reply_json(stubs.stats())
+            elif url.path == "/weather":
+                if stubs.delay("weather"):
+                    self.reply_json({"message": "stub error"}, 500)
+                else:
+                    self.reply_json(stubs.weather(query))
+            elif url.path == "/nominatim/search":
+                if stubs.delay("nominatim"):
+                    self.reply_json([], 503)
+                else:
+                    self.reply_json(stubs.nominatim(query))
+            elif url.path.startswith("/rss/"):
+                feed = stubs.feeds.get(url.path.rsplit("/", 1)[-1])
+                if stubs.delay("rss") or feed is None:
+                    self.reply(500, b"error", "text/plain")
+                else:
+                    # Ленты заглушки не меняются: повторный условный запрос получает 304
+                    etag = f'"{zlib.crc32(feed):08x}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.reply(304, b"", "application/rss+xml", {"ETag": etag})
+                    else:
+                        self.reply(200, feed, "application/rss+xml", {"ETag": etag})
+            else:
+                self.reply(404, b"not found", "text/plain")
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            raw = self.read_body()
+            if url.path == "/control/push":
+                stubs.push(json.loads(raw))
+                self.reply_json({"ok": True})
+            elif url.path.startswith(f"/bot{TOKEN}/"):
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(raw or b"{}")
+                else:
+                    params = {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+                result = stubs.telegram(url.path.rsplit("/", 1)[-1], params)
+                self.reply_json({"ok": True, "result": result})
+            elif url.path == "/gigachat/oauth":
+                self.reply_json({"access_token": "stub-token", "expires_at": int((time.time() + 3600) * 1000)})
+            elif url.path == "/gigachat/api/v1/chat/completions":
+                body = json.loads(raw or b"{}")
+                prompt = body.get("messages", [{}])[-1].get("content", "")
+                if body.get("stream"):
+                    self.stream_gigachat(prompt)
+                elif stubs.delay("gigachat"):
+                    self.reply_json({"message": "stub error"}, 500)
+                else:
+                    self.reply_json(stubs.gigachat(body, stub_answer(prompt)))
+            else:
+                self.reply(404, b"not found", "text/plain")
+
+        def stream_gigachat(self, prompt: str) -> None:
+            if stubs.delay("gigachat"):
+                self.reply_json({"message": "stub error"}, 500)
+                return
+            # Задержка сервиса уже выдержана до первого фрагмента; остальные идут без пауз
+            words = stub_answer(prompt).split(" ")
+            chunks = [" ".join(words[i:i + 8]) + " " for i in range(0, len(words), 8)]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for content in chunks:
+                    chunk = {"choices": [{"delta": {"content": content}, "index": 0}],
+                             "created": int(time.time()), "model": "GigaChat", "object": "chat.completion"}
+                    self.write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                self.write_chunk(b"data: [DONE]\n\n")
+                self.write_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def write_chunk(self, data: bytes) -> None:
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    return Handler
+
+
+def serve_stubs(port: int, latency: dict, errors: dict) -> None:
+    """Точка входа процесса заглушек"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(StubUpstreams(latency, errors)))
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    server.serve_forever()
+
+
+def control(port: int, path: str, data=None):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}{path}",
+        data=json.dumps(data).encode() if data is not None else None,
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def wait_for_stubs(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            control(port, "/control/stats")
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+# ---------------------------------------------------------------------------
+# Заглушка Yandex Cloud ML SDK (в процессе бота)
+# ---------------------------------------------------------------------------
+
+class _Alternative:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Result:
+    def __init__(self, text: str):
+        self.alternatives = [_Alternative(text)]
+
+
+class _Status:
+    def __init__(self, running: bool, failed: bool):
+        self.is_running = running
+        self.is_failed = failed
+
+
+class StubYandexOperation:
+    _ids = 0
+
+    def __init__(self, text: str, duration: float, failed: bool):
+        StubYandexOperation._ids += 1
+        self.id = f"op{StubYandexOperation._ids}"
+        self.text = text
+        self.ready_at = time.monotonic() + duration
+        self.failed = failed
+
+    async def get_status(self):
+        return _Status(time.monotonic() < self.ready_at, self.failed)
+
+    async def get_result(self):
+        if self.failed:
+            raise RuntimeError("Операция заглушки Yandex GPT завершилась с ошибкой")
+        return _Result(self.text)
+
+
+class StubYandexModel:
+    """Модель с интерфейсом AsyncYCloudML: отложенные операции и потоковый ответ"""
+
+    # Вызовы всех экземпляров: модель создаётся провайдером лениво, внутри бота
+    calls = 0
+
+    def __init__(self, latency: float, error_rate: float):
+        self.latency = latency
+        self.error_rate = error_rate
+
+    def configure(self, **kwargs):
+        return self
+
+    def _duration(self) -> float:
+        StubYandexModel.calls += 1
+        return self.latency * random.uniform(0.5, 1.5)
+
+    async def run_deferred(self, messages):
+        prompt = messages[-1]["text"] if messages else ""
+        return StubYandexOperation(stub_answer(prompt), self._duration(), random.random() < self.error_rate)
+
+    async def run_stream(self, messages):
+        prompt = messages[-1]["text"] if messages else ""
+        await asyncio.sleep(self._duration())
+        if random.random() < self.error_rate:
+            raise RuntimeError("Заглушка Yandex GPT вернула ошибку")
+        words = stub_answer(prompt).split(" ")
+        for end in range(8, len(words) + 8, 8):
+            yield _Result(" ".join(words[:end]))
+
+
+class StubYCloudML:
+    latency = 0.3
+    error_rate = 0.0
+
+    def __init__(self, folder_id: str, auth: str):
+        self.models = self
+
+    def completions(self, name: str):
+        return StubYandexModel(self.latency, self.error_rate)
+
+
+# ---------------------------------------------------------------------------
+# Прогон
+# ---------------------------------------------------------------------------
+
+def make_updates(count: int, chats: int, mix: dict, seed: int):
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = 10000 + update_id % chats
+        text = rng.choice(MESSAGES[rng.choices(kinds, weights)[0]])
+        updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id, "date": int(time.time()), "text": text,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Load", "username": f"user{chat_id}"},
+            },
+        })
+    return updates
+
+
+def configure_environment(port: int, args) -> None:
+    base = f"http://127.0.0.1:{port}"
+    os.environ.update({
+        "TELEGRAM_TOKEN": TOKEN,
+        "TELEGRAM_API_BASE_URL": f"{base}/bot",
+        "BOT_MODE": "polling",
+        "GIGA_KEY": "stub-credentials",
+        "GIGACHAT_BASE_URL": f"{base}/gigachat/api/v1",
+        "GIGACHAT_AUTH_URL": f"{base}/gigachat/oauth",
+        "YANDEX_FOLDER_ID": "stub-folder",
+        "YANDEX_API_KEY": "stub-api-key",
+        "OPENWEATHER_API_KEY": "stub-key",
+        "OPENWEATHER_API_URL": f"{base}/weather",
+        "NOMINATIM_URL": f"{base}/nominatim/search",
+        "RSS_FEED_URLS": ",".join(f"{name}={base}/rss/{name}" for name in ('ria', 'tass', 'interfax')),
+        "STREAM_RESPONSES": "1" if args.stream else "0",
+        "METRICS_PORT": "0",
+    })
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def drive(bot, port: int, updates, models, timeout: float) -> dict:
+    application = bot.application
+    for index, chat_id in enumerate(sorted({u["message"]["chat"]["id"] for u in updates})):
+        # auto — пользователь не выбирал модель: её выбирает маршрутизатор (и может дублировать запрос)
+        if models[index % len(models)] != "auto":
+            application.user_data[chat_id]['selected_model'] = models[index % len(models)]
+
+    loop = asyncio.get_running_loop()
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        await application.updater.start_polling(timeout=10)
+
+        started = time.perf_counter()
+        await loop.run_in_executor(None, control, port, "/control/push", updates)
+        deadline = started + timeout
+        while True:
+            stats = await loop.run_in_executor(None, control, port, "/control/stats")
+            if stats["answered"] >= len(updates) or time.perf_counter() > deadline:
+                break
+            await asyncio.sleep(0.2)
+        elapsed = time.perf_counter() - started
+
+        await application.updater.stop()
+        await application.stop()
+        await bot.post_shutdown(application)
+    return {"stats": stats, "elapsed": elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=1000, help="сколько сообщений отправить")
+    parser.add_argument("--chats", type=int, default=100, help="в скольких чатах")
+    parser.add_argument("--models", default="yandex,giga", help="модели, распределяемые по чатам (auto — без выбора модели)")
+    parser.add_argument("--latency", default=DEFAULT_LATENCY, help="задержка сервисов, секунд")
+    parser.add_argument("--errors", default="", help="доля ошибок сервисов, например gigachat=0.05")
+    parser.add_argument("--mix", default="chat=4,news=3,weather=2,maps=1", help="доли типов сообщений")
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="без потокового вывода ответов")
+    parser.add_argument("--timeout", type=float, default=300, help="максимальное время прогона, секунд")
+    parser.add_argument("--log-level", default="WARNING", help="уровень логов бота во время прогона")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результат в файл JSON")
+    args = parser.parse_args()
+
+    latency = parse_profile(args.latency)
+    errors = parse_profile(args.errors)
+    models = [model.strip() for model in args.models.split(",") if model.strip()]
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    port = free_port()
+    stubs = multiprocessing.get_context("spawn").Process(target=serve_stubs, args=(port, latency, errors), daemon=True)
+    stubs.start()
+    try:
+        wait_for_stubs(port)
+        configure_environment(port, args)
+
+        # Логи и кэш геокодирования бота — во временном каталоге
+        workdir = tempfile.mkdtemp(prefix="bench_load_")
+        os.chdir(workdir)
+        import logging
+        import unified_bot
+
+        # У логгеров бота свой уровень, поэтому отключаем записи ниже заданного уровня глобально
+        logging.disable(logging.getLevelName(args.log_level.upper()) - 1)
+        StubYCloudML.latency = latency.get("yandex", 0.0)
+        StubYCloudML.error_rate = errors.get("yandex", 0.0)
+        unified_bot.YANDEX_AVAILABLE = True
+        unified_bot.load_yandex_sdk = lambda: StubYCloudML
+
+        bot = unified_bot.UnifiedBot()
+        missing = [model for model in models if model not in bot.providers and model != "auto"]
+        if missing:
+            raise SystemExit(f"Модели не инициализированы: {', '.join(missing)}")
+
+        memory_before = peak_rss_mb()
+        updates = make_updates(args.updates, args.chats, parse_profile(args.mix), args.seed)
+        run = asyncio.run(drive(bot, port, updates, models, args.timeout))
+    finally:
+        stubs.terminate()
+        stubs.join()
+
+    stats, elapsed = run["stats"], run["elapsed"]
+    if bot.yandex_provider:
+        # Заглушка Yandex GPT работает внутри процесса бота — её вызовы считаем здесь
+        stats["requests"]["yandex"] = StubYandexModel.calls
+    latencies = stats["latencies"]
+    result = {
+        "updates": args.updates,
+        "answered": stats["answered"],
+        "failed": stats["failed"],
+        "busy": stats["busy"],
+        "unavailable": stats["unavailable"],
+        "cached": stats["cached"],
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(stats["answered"] / elapsed, 2),
+        "latency_p50_s": round(percentile(latencies, 0.5), 3),
+        "latency_p95_s": round(percentile(latencies, 0.95), 3),
+        "latency_p99_s": round(percentile(latencies, 0.99), 3),
+        "latency_max_s": round(max(latencies, default=0.0), 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rss_before_run_mb": round(memory_before, 1),
+        "upstream_requests": stats["requests"],
+    }
+
+    print(f"Ответов: {result['answered']} из {result['updates']} за {result['elapsed_s']:.2f} с "
+          f"({result['messages_per_s']:.1f} сообщ/с), ошибок {result['failed']}, отклонено {result['busy']}, "
+          f"отключено предохранителем {result['unavailable']}, из кэша ответов {result['cached']}")
+    print(f"Время ответа p50/p95/p99/max: {result['latency_p50_s']:.3f} / {result['latency_p95_s']:.3f} / "
+          f"{result['latency_p99_s']:.3f} / {result['latency_max_s']:.3f} с")
+    print(f"Пиковая память процесса бота: {result['peak_rss_mb']:.1f} МБ "
+          f"(до прогона {result['rss_before_run_mb']:.1f} МБ)")
+    print("Запросы к заглушкам: " + ", ".join(f"{name}={count}" for name, count in sorted(stats["requests"].items())))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if result["answered"] < args.updates:
+        raise SystemExit(f"Не дождались {args.updates - result['answered']} ответов за {args.timeout} с")
+
+
+if __name__ == "__main__":
+    main()
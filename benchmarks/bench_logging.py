@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк накладных расходов логирования в вызывающем потоке (цикле событий)
+Сравнивает прежнюю схему (FileHandler + StreamHandler прямо в вызывающем потоке) с очередью
+и фоновым потоком записи, с прореживанием болтливого логгера и без него.
+Вариант "медленный диск" делает fsync после каждой записи, как при нагруженном или сетевом диске
+
+Запуск: python benchmarks/bench_logging.py [--records 20000]
+"""
+
+import argparse
+import io
+import logging
+import logging.handlers
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logging_setup import DATE_FORMAT, LOG_FORMAT, build_file_handler, setup_queue_logging, stop_queue_logging  # noqa: E402
+
+
+class FsyncFileHandler(logging.FileHandler):
+    """Файловый обработчик, который ждёт сброса каждой записи на диск"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        super().emit(record)
+        self.flush()
+        os.fsync(self.stream.fileno())
+
+
+def make_handlers(directory: str, slow_disk: bool):
+    formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+    path = os.path.join(directory, 'bench.log')
+    file_handler = FsyncFileHandler(path, encoding='utf-8') if slow_disk else build_file_handler(path, "size")
+    # Консоль заменяем буфером в памяти, чтобы не засорять вывод
+    console_handler = logging.StreamHandler(io.StringIO())
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+    return [file_handler, console_handler]
+
+
+def emit_records(records: int) -> float:
+    """Пишет записи, похожие на логи обработки сообщения; возвращает мкс на запись в вызывающем потоке"""
+    api_logger = logging.getLogger('APIRequests')
+    poll_logger = logging.getLogger('llm_providers.poll')
+    started = time.perf_counter()
+    for i in range(records):
+        if i % 2:
+            # Частые записи раундов опроса
+            poll_logger.info(f"Операции Yandex GPT выполняются: {i % 7} из 10 в раунде опроса")
+        else:
+            api_logger.info(f"Получен ответ от GigaChat для пользователя user{i}: {'текст ответа ' * 5}")
+    return (time.perf_counter() - started) / records * 1e6
+
+
+def reset_root() -> logging.Logger:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(logging.INFO)
+    return root
+
+
+def run(variant: str, records: int, slow_disk: bool) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        root = reset_root()
+        handlers = make_handlers(directory, slow_disk)
+        if variant == "direct":
+            for handler in handlers:
+                root.addHandler(handler)
+            result = emit_records(records)
+            reset_root()
+        else:
+            sampling = {'llm_providers.poll': 20} if variant == "queue+sampling" else None
+            setup_queue_logging(handlers, sampling=sampling)
+            result = emit_records(records)
+            stop_queue_logging()
+            reset_root()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000, help="сколько записей писать")
+    args = parser.parse_args()
+
+    for slow_disk in (False, True):
+        records = args.records if not slow_disk else max(1, args.records // 10)
+        title = "медленный диск (fsync)" if slow_disk else "обычный диск"
+        print(f"{title}, {records} записей:")
+        for variant in ("direct", "queue", "queue+sampling"):
+            print(f"  {variant:15s} {run(variant, records, slow_disk):8.2f} мкс/запись в цикле событий")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Время запуска бота без доступа в интернет
+1. Импорт unified_bot в чистом процессе: общее время, самые тяжёлые пакеты (по -X importtime)
+   и проверка, что SDK моделей и поисковиков не загружаются при импорте.
+2. Время до первого обработанного обновления: бот запускается как обычно (python unified_bot.py,
+   long polling) против заглушек из bench_load.py; обновление уже ждёт в очереди Telegram,
+   время считается от старта процесса до окончательного ответа с кнопкой возврата в меню.
+
+Запуск: python benchmarks/bench_startup.py [--repeat 5] [--latency gigachat=0.3] [--json result.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_load import (  # noqa: E402
+    DEFAULT_LATENCY, TOKEN, control, free_port, make_updates, parse_profile, serve_stubs, wait_for_stubs,
+)
+
+# Эти пакеты должны импортироваться только при первом обращении к модели или поиску
+LAZY_MODULES = ("gigachat", "yandex_cloud_ml_sdk", "duckduckgo_search", "multi_search", "urllib3")
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import unified_bot
+elapsed = time.perf_counter() - started
+lazy = {lazy!r}
+print("RESULT " + json.dumps({{"seconds": elapsed, "loaded": [name for name in lazy if name in sys.modules]}}))
+"""
+
+
+def bot_environment(port: int) -> dict:
+    """Окружение бота: все внешние сервисы — заглушки, модель — GigaChat"""
+    base = f"http://127.0.0.1:{port}"
+    env = {key: value for key, value in os.environ.items() if not key.startswith("YANDEX_")}
+    env.update({
+        "TELEGRAM_TOKEN": TOKEN,
+        "TELEGRAM_API_BASE_URL": f"{base}/bot",
+        "BOT_MODE": "polling",
+        "POLLING_TIMEOUT": "1",
+        "GIGA_KEY": "stub-credentials",
+        "GIGACHAT_BASE_URL": f"{base}/gigachat/api/v1",
+        "GIGACHAT_AUTH_URL": f"{base}/gigachat/oauth",
+        "OPENWEATHER_API_KEY": "stub-key",
+        "OPENWEATHER_API_URL": f"{base}/weather",
+        "NOMINATIM_URL": f"{base}/nominatim/search",
+        "RSS_FEED_URLS": ",".join(f"{name}={base}/rss/{name}" for name in ('ria', 'tass', 'interfax')),
+        "STREAM_RESPONSES": "0",
+        "METRICS_PORT": "0",
+        "PYTHONPATH": ROOT,
+    })
+    return env
+
+
+def measure_import(env: dict, workdir: str) -> dict:
+    """Время импорта unified_bot в новом процессе и загруженные при этом тяжёлые пакеты"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE.format(lazy=LAZY_MODULES)],
+        env=env, cwd=workdir, capture_output=True, text=True, check=True,
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def heaviest_imports(env: dict, workdir: str, count: int = 8) -> list:
+    """Самые долгие прямые импорты unified_bot по выводу -X importtime (кумулятивно, мс)"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import unified_bot"],
+        env=env, cwd=workdir, capture_output=True, text=True, check=True,
+    ).stderr
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Вложенность задаётся отступом по два пробела: прямые импорты unified_bot идут с тремя
+        if not cumulative.strip().isdigit() or len(name) - len(name.lstrip()) != 3:
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(cumulative) / 1000
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def measure_first_update(port: int, env: dict, workdir: str, timeout: float) -> float:
+    """Секунды от запуска процесса бота до ответа на обновление, которое уже ждало в очереди"""
+    before = control(port, "/control/stats")["answered"]
+    update = make_updates(1, 1, {'chat': 1}, seed=int(time.time()))
+    update[0]["update_id"] = before + 1
+    # Заглушка считает время от push: обновление отправляется непосредственно перед запуском процесса
+    control(port, "/control/push", update)
+    started = time.perf_counter()
+    bot = subprocess.Popen([sys.executable, os.path.join(ROOT, "unified_bot.py")], env=env, cwd=workdir,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + timeout
+        while True:
+            stats = control(port, "/control/stats")
+            if stats["answered"] > before:
+                return stats["latencies"][-1]
+            if bot.poll() is not None:
+                raise SystemExit(f"Бот завершился с кодом {bot.returncode} до ответа на обновление")
+            if time.perf_counter() > deadline:
+                raise SystemExit(f"Бот не ответил за {timeout} с")
+            time.sleep(0.01)
+    finally:
+        bot.send_signal(signal.SIGINT)
+        try:
+            bot.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+            bot.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="сколько раз повторить каждое измерение")
+    parser.add_argument("--latency", default=DEFAULT_LATENCY, help="задержки заглушек, секунды")
+    parser.add_argument("--timeout", type=float, default=60, help="предельное время ожидания ответа бота")
+    parser.add_argument("--json", help="сохранить результат в JSON-файл")
+    args = parser.parse_args()
+
+    port = free_port()
+    stubs = multiprocessing.get_context("spawn").Process(
+        target=serve_stubs, args=(port, parse_profile(args.latency), {}), daemon=True)
+    stubs.start()
+    # Логи и кэш геокодирования бота — во временном каталоге
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        wait_for_stubs(port)
+        env = bot_environment(port)
+        imports = [measure_import(env, workdir) for _ in range(args.repeat)]
+        heaviest = heaviest_imports(env, workdir)
+        first_update = [measure_first_update(port, env, workdir, args.timeout) for _ in range(args.repeat)]
+    finally:
+        stubs.terminate()
+        stubs.join()
+
+    import_times = sorted(result["seconds"] for result in imports)
+    loaded = sorted({name for result in imports for name in result["loaded"]})
+    result = {
+        "import_min_s": round(import_times[0], 3),
+        "import_median_s": round(import_times[len(import_times) // 2], 3),
+        "heaviest_imports_ms": {name: round(ms, 1) for name, ms in heaviest},
+        "lazy_modules_loaded": loaded,
+        "first_update_min_s": round(min(first_update), 3),
+        "first_update_median_s": round(sorted(first_update)[len(first_update) // 2], 3),
+    }
+
+    print(f"Импорт unified_bot: {result['import_min_s']:.3f} с (медиана {result['import_median_s']:.3f} с)")
+    print("Самые долгие импорты: " + ", ".join(f"{name} {ms:.0f} мс" for name, ms in heaviest))
+    if loaded:
+        print(f"⚠️ При импорте загружены пакеты, которые должны загружаться лениво: {', '.join(loaded)}")
+    else:
+        print(f"✅ Не загружены при импорте: {', '.join(LAZY_MODULES)}")
+    print(f"Первое обновление обработано через {result['first_update_min_s']:.3f} с после запуска процесса "
+          f"(медиана {result['first_update_median_s']:.3f} с)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
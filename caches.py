@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Кэши для внешних запросов бота
+LRU-вытеснение, время жизни записей и объединение одновременных промахов (single-flight);
+кэш в памяти и постоянный кэш в SQLite
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в один"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    @property
+    def inflight(self) -> int:
+        """Число выполняющихся загрузок"""
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Вызывает func; остальные вызовы с тем же ключом ждут её результат"""
+        inflight = self._inflight.get(key)
+        while inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Отменили ведущий вызов, а не ожидающий: повторяем загрузку сами
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                self.coalesced -= 1
+                inflight = self._inflight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        # Ошибку загрузки могут не забрать, если никто больше не ждал этот ключ
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            value = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+
+class TTLCache:
+    """LRU-кэш с временем жизни записей; одновременные промахи по ключу дают один запрос"""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 600, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._flight = SingleFlight()
+        # Счётчики
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Возвращает (найдено, значение) без обращения к источнику"""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            # Запись устарела — удаляем, следующий запрос пойдёт к источнику
+            del self._data[key]
+            self.stale += 1
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def lookup(self, keys: Iterable[Hashable]) -> Tuple[Optional[Hashable], Any]:
+        """Первый найденный из ключей и его значение (None, None — промах); учитывается в счётчиках"""
+        for key in keys:
+            found, value = self.get(key)
+            if found:
+                self.hits += 1
+                return key, value
+        self.misses += 1
+        return None, None
+
+    def set(self, key: Hashable, value: Any, ttl: float = None) -> None:
+        """Сохраняет значение, вытесняя самые давно использованные записи"""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Удаляет запись из кэша"""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Очищает кэш"""
+        self._data.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Возвращает значение из кэша или загружает его; одновременные промахи ждут одну загрузку"""
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            return value
+        return await self._flight.do(key, lambda: self._load_and_store(key, loader))
+
+    async def _load_and_store(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        self.misses += 1
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    @property
+    def coalesced(self) -> int:
+        return self._flight.coalesced
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики кэша для мониторинга"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'name': self.name,
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'hit_ratio': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+class SqliteCache:
+    """Постоянный LRU-кэш в SQLite: переживает перезапуск бота"""
+
+    def __init__(self, path: str, maxsize: int = 10000, ttl: float = 30 * 24 * 3600, name: str = "sqlite"):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        # Счётчики
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    def _get_sync(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None
+            now = time.time()
+            if row[1] <= now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                conn.commit()
+                self.stale += 1
+                return False, None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return True, json.loads(row[0])
+
+    def _set_sync(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + ttl, now),
+            )
+            # Вытесняем самые давно использованные записи
+            count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.maxsize:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (count - self.maxsize,),
+                )
+                self.evictions += count - self.maxsize
+            conn.commit()
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        """Возвращает (найдено, значение); обращение к диску выполняется вне цикла событий"""
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def set(self, key: str, value: Any, ttl: float = None) -> None:
+        """Сохраняет значение (должно сериализоваться в JSON)"""
+        await asyncio.to_thread(self._set_sync, key, value, self.ttl if ttl is None else ttl)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]],
+                          ttl_for: Optional[Callable[[Any], float]] = None) -> Any:
+        """Возвращает значение из кэша или загружает его; одновременные промахи ждут одну загрузку"""
+        found, value = await self.get(key)
+        if found:
+            self.hits += 1
+            return value
+        return await self._flight.do(key, lambda: self._load_and_store(key, loader, ttl_for))
+
+    async def _load_and_store(self, key: str, loader: Callable[[], Awaitable[Any]],
+                              ttl_for: Optional[Callable[[Any], float]]) -> Any:
+        self.misses += 1
+        value = await loader()
+        await self.set(key, value, ttl_for(value) if ttl_for else None)
+        return value
+
+    @property
+    def coalesced(self) -> int:
+        return self._flight.coalesced
+
+    def close(self) -> None:
+        """Закрывает соединение с базой"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики кэша для мониторинга"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'name': self.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'hit_ratio': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
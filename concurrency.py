@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Ограничение одновременной работы бота
+Справедливая очередь к AI моделям: пользователи обслуживаются по кругу, один пользователь не может
+занять всю очередь, а при переполнении запрос сразу отклоняется.
+Планировщик обновлений Telegram: разные чаты обрабатываются параллельно, один чат — строго по порядку
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять, сдвинулась ли позиция ожидающего в очереди (секунды)
+POSITION_UPDATE_INTERVAL = 2.0
+
+
+class QueueFullError(Exception):
+    """Очередь к модели заполнена — запрос отклонён, чтобы не копить заведомо долгие вызовы"""
+
+
+class _Waiter:
+    """Запрос, ожидающий свободного слота"""
+
+    __slots__ = ('user_id', 'future')
+
+    def __init__(self, user_id: Hashable, future: asyncio.Future):
+        self.user_id = user_id
+        self.future = future
+
+
+class FairLimiter:
+    """Ограничитель одновременных запросов с круговой очередью по пользователям"""
+
+    def __init__(self, name: str, max_concurrent: int = 10, max_queue: int = 100, max_per_user: int = 2,
+                 max_wait: Optional[float] = None, update_interval: float = POSITION_UPDATE_INTERVAL):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.max_wait = max_wait
+        self.update_interval = update_interval
+        # Очереди пользователей в порядке обслуживания: первый в словаре получит следующий слот
+        self._queues: "OrderedDict[Hashable, Deque[_Waiter]]" = OrderedDict()
+        # Запросы пользователя в работе и в очереди
+        self._per_user: Dict[Hashable, int] = {}
+        self._active = 0
+        self._queued = 0
+        # Счётчики
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_queued = 0
+
+    @property
+    def active(self) -> int:
+        """Число выполняющихся запросов"""
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """Число запросов в очереди"""
+        return self._queued
+
+    def position(self, waiter: _Waiter) -> int:
+        """Номер запроса в очереди с учётом обслуживания пользователей по кругу (1 — следующий)"""
+        own_queue = self._queues.get(waiter.user_id)
+        if own_queue is None or waiter not in own_queue:
+            return 0
+        index = own_queue.index(waiter)
+        position = index + 1
+        before = True
+        for user_id, queue in self._queues.items():
+            if user_id == waiter.user_id:
+                before = False
+                continue
+            # Пользователи раньше по кругу успевают получить на один слот больше
+            position += min(len(queue), index + 1 if before else index)
+        return position
+
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable, on_position: Optional[Callable[[int], Awaitable[Any]]] = None):
+        """Занимает слот на время блока; on_position вызывается при изменении позиции в очереди"""
+        await self.acquire(user_id, on_position)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    async def acquire(self, user_id: Hashable, on_position: Optional[Callable[[int], Awaitable[Any]]] = None) -> None:
+        """Ждёт свободного слота; при переполнении очереди выбрасывает QueueFullError"""
+        if self._per_user.get(user_id, 0) >= self.max_per_user:
+            self.rejected += 1
+            raise QueueFullError(f"Слишком много одновременных запросов пользователя к {self.name}")
+
+        if self._active < self.max_concurrent and not self._queues:
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            self._active += 1
+            self.admitted += 1
+            return
+
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Очередь к {self.name} заполнена ({self._queued}), запрос отклонён")
+            raise QueueFullError(f"Очередь к {self.name} заполнена")
+
+        waiter = _Waiter(user_id, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        self._queued += 1
+        self.queued_total += 1
+        self.max_queued = max(self.max_queued, self._queued)
+        started = time.monotonic()
+
+        try:
+            last_position = None
+            while not waiter.future.done():
+                if on_position:
+                    position = self.position(waiter)
+                    if position != last_position:
+                        last_position = position
+                        try:
+                            await on_position(position)
+                        except Exception as e:
+                            logger.debug(f"Не удалось показать позицию в очереди: {e}")
+                        continue
+
+                timeout = self.update_interval
+                if self.max_wait is not None:
+                    remaining = self.max_wait - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise QueueFullError(f"Слишком долгое ожидание в очереди к {self.name}")
+                    timeout = min(timeout, remaining)
+                await asyncio.wait((waiter.future,), timeout=timeout)
+        except BaseException:
+            if waiter.future.done():
+                # Слот уже выдан — возвращаем его следующему
+                self.release(user_id)
+            else:
+                self._remove(waiter)
+                self._decrement(user_id)
+            raise
+
+    def release(self, user_id: Hashable) -> None:
+        """Освобождает слот и отдаёт его следующему по кругу пользователю"""
+        self._active -= 1
+        self._decrement(user_id)
+        self._dispatch()
+
+    def _decrement(self, user_id: Hashable) -> None:
+        count = self._per_user.get(user_id, 0) - 1
+        if count > 0:
+            self._per_user[user_id] = count
+        else:
+            self._per_user.pop(user_id, None)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._queues[waiter.user_id]
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrent and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            # Пользователь переходит в конец круга
+            del self._queues[user_id]
+            if queue:
+                self._queues[user_id] = queue
+            self._queued -= 1
+            self._active += 1
+            self.admitted += 1
+            waiter.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики очереди для мониторинга"""
+        return {
+            'name': self.name,
+            'active': self._active,
+            'queued': self._queued,
+            'admitted': self.admitted,
+            'queued_total': self.queued_total,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'max_queued': self.max_queued,
+        }
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления разных чатов параллельно, а обновления одного чата — по порядку"""
+
+    def __init__(self, max_workers: int = 32, max_pending: int = 1024):
+        # Семафор базового класса ограничивает число принятых в работу обновлений (вместе с ожидающими),
+        # а число одновременно выполняющихся обработчиков ограничивает отдельный семафор
+        super().__init__(max_pending)
+        self.max_workers = max_workers
+        self._workers = asyncio.Semaphore(max_workers)
+        # Блокировка на каждый чат; asyncio.Lock пропускает ожидающих в порядке очереди (FIFO)
+        self._chat_locks: Dict[Hashable, asyncio.Lock] = {}
+        self._chat_pending: Dict[Hashable, int] = {}
+        # Счётчики
+        self.accepted = 0
+        self.active = 0
+        self.processed = 0
+
+    @property
+    def pending(self) -> int:
+        """Число принятых обновлений, которые ждут своей очереди в чате или свободного обработчика"""
+        return self.accepted - self.active
+
+    @property
+    def busy_chats(self) -> int:
+        """Число чатов, в которых сейчас есть необработанные обновления"""
+        return len(self._chat_pending)
+
+    @staticmethod
+    def chat_key(update: object) -> Optional[Hashable]:
+        """Ключ очереди: чат, а для обновлений без чата (inline-запросы) — пользователь"""
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return ('user', update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        self.accepted += 1
+        try:
+            await self._process_in_order(self.chat_key(update), coroutine)
+        finally:
+            self.accepted -= 1
+
+    async def _process_in_order(self, key: Optional[Hashable], coroutine: Awaitable[Any]) -> None:
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        lock = self._chat_locks.get(key)
+        if lock is None:
+            lock = self._chat_locks[key] = asyncio.Lock()
+        self._chat_pending[key] = self._chat_pending.get(key, 0) + 1
+        try:
+            # Сначала очередь чата, потом обработчик: ожидающие в занятом чате не держат обработчики
+            async with lock:
+                await self._run(coroutine)
+        finally:
+            count = self._chat_pending[key] - 1
+            if count:
+                self._chat_pending[key] = count
+            else:
+                del self._chat_pending[key]
+                del self._chat_locks[key]
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        async with self._workers:
+            self.active += 1
+            try:
+                await coroutine
+            finally:
+                self.active -= 1
+                self.processed += 1
+
+    async def initialize(self) -> None:
+        """Ресурсы не требуются"""
+
+    async def shutdown(self) -> None:
+        """Ресурсы не требуются"""
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики планировщика для мониторинга"""
+        return {
+            'workers': self.max_workers,
+            'active': self.active,
+            'pending': self.pending,
+            'busy_chats': self.busy_chats,
+            'processed': self.processed,
+        }
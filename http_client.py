@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Общий асинхронный HTTP-клиент бота
+Пул keep-alive соединений, переиспользование TLS-сессий и таймауты для каждого хоста
+"""
+
+import asyncio
+import logging
+import ssl
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import certifi
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10.0
+
+# Таймауты (в секундах) для отдельных хостов
+HOST_TIMEOUTS = {
+    'api.openweathermap.org': 5.0,
+    'nominatim.openstreetmap.org': 5.0,
+    'api.mojeek.com': 5.0,
+    'metager.org': 5.0,
+    'ria.ru': 10.0,
+    'tass.ru': 10.0,
+    'www.interfax.ru': 10.0,
+}
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов (token bucket); ожидающие обслуживаются по очереди"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        # asyncio.Lock отдаёт блокировку в порядке очереди (FIFO)
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Ждёт, пока появится токен, и забирает его"""
+        self.waiting += 1
+        try:
+            async with self._lock:
+                self._refill()
+                if self._tokens < 1:
+                    await asyncio.sleep((1 - self._tokens) / self.rate)
+                    self._refill()
+                self._tokens -= 1
+        finally:
+            self.waiting -= 1
+
+
+class AsyncHttpClient:
+    """Асинхронный HTTP-клиент с общим пулом соединений для всех запросов бота"""
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 60.0,
+        default_timeout: float = DEFAULT_TIMEOUT,
+        host_timeouts: Optional[Dict[str, float]] = None,
+    ):
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.default_timeout = default_timeout
+        self.host_timeouts = dict(HOST_TIMEOUTS)
+        if host_timeouts:
+            self.host_timeouts.update(host_timeouts)
+        # Отдельные пулы для запросов с проверкой сертификатов и без неё
+        self._clients: Dict[bool, httpx.AsyncClient] = {}
+        # Один SSL-контекст на все соединения, чтобы TLS-сессии переиспользовались
+        self._ssl_context = ssl.create_default_context(cafile=certifi.where())
+
+    def _client(self, verify: bool) -> httpx.AsyncClient:
+        client = self._clients.get(verify)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=self._limits,
+                verify=self._ssl_context if verify else False,
+                timeout=self.default_timeout,
+                follow_redirects=True,
+            )
+            self._clients[verify] = client
+        return client
+
+    def timeout_for(self, url: str) -> float:
+        """Возвращает таймаут для хоста из URL"""
+        host = urlsplit(url).hostname or ''
+        return self.host_timeouts.get(host, self.default_timeout)
+
+    async def get(
+        self,
+        url: str,
+        *,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        timeout: Optional[float] = None,
+        verify: bool = True,
+    ) -> httpx.Response:
+        """GET-запрос через общий пул соединений"""
+        if timeout is None:
+            timeout = self.timeout_for(url)
+        return await self._client(verify).get(url, params=params, headers=headers, timeout=timeout)
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        url: str,
+        *,
+        headers: Optional[dict] = None,
+        timeout: Optional[float] = None,
+        verify: bool = True,
+    ) -> AsyncIterator[httpx.Response]:
+        """Потоковый GET-запрос: тело читается по частям, чтение можно прервать, не скачивая ответ целиком"""
+        if timeout is None:
+            timeout = self.timeout_for(url)
+        async with self._client(verify).stream("GET", url, headers=headers, timeout=timeout) as response:
+            yield response
+
+    async def post(
+        self,
+        url: str,
+        *,
+        json: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        timeout: Optional[float] = None,
+        verify: bool = True,
+    ) -> httpx.Response:
+        """POST-запрос с JSON-телом через общий пул соединений"""
+        if timeout is None:
+            timeout = self.timeout_for(url)
+        return await self._client(verify).post(url, json=json, headers=headers, timeout=timeout)
+
+    async def aclose(self) -> None:
+        """Закрывает все открытые соединения"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+_shared_client: Optional[AsyncHttpClient] = None
+
+
+def get_http_client() -> AsyncHttpClient:
+    """Возвращает общий для всего бота HTTP-клиент"""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = AsyncHttpClient()
+    return _shared_client
+
+
+async def close_http_client() -> None:
+    """Закрывает общий HTTP-клиент (вызывается при остановке бота)"""
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
+        logger.info("Общий HTTP-клиент закрыт")
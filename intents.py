@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Определение типа запроса пользователя
+Все ключевые слова собраны в одно регулярное выражение (префиксное дерево),
+которое строится один раз при импорте и находит все намерения за один проход по тексту
+"""
+
+import re
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+# Ключевые слова для каждого намерения
+WEATHER_KEYWORDS = ['погод', 'температур', 'градус', 'тепло', 'холодно', 'дожд', 'снег']
+MAP_KEYWORDS = ['карт', 'адрес', 'координат', 'местоположен', 'как добраться', 'где находится', 'где ', 'остановк', 'магазин', 'универмаг']
+# Расширенный список для веб-поиска - включаем больше случаев
+SEARCH_KEYWORDS = [
+    'сейчас', 'новост', 'актуальн', 'текущ', 'последн',
+    'что там', 'как там', 'что с', 'что происходит',
+    'где', 'когда', 'кто', 'какой', 'какая', 'какие',
+    '2024', '2025', 'год', 'месяц',
+    'президент', 'правительств', 'министр', 'выбор', 'победил',
+    'эмануэль', 'макрон', 'трамп', 'путин', 'байден',
+    'франц', 'росси', 'америк', 'сша', 'украин',
+    'событи', 'ситуаци', 'положени', 'состояни',
+    'подал', 'ушел', 'уволи', 'назначи', 'избра'
+]
+
+INTENT_KEYWORDS = {
+    'weather': WEATHER_KEYWORDS,
+    'map': MAP_KEYWORDS,
+    'search': SEARCH_KEYWORDS,
+}
+
+# Извлечение сущностей: "в [город]" или "погода [город]"
+CITY_PATTERNS = (
+    re.compile(r'в\s+([А-Яа-яA-Za-z\-]+)'),
+    re.compile(r'погод[аые]\s+([А-Яа-яA-Za-z\-]+)'),
+)
+LOCATION_PATTERN = re.compile(r'(?:карт[аыу]|адрес|координат[ыа]|где находится|как добраться|где)\s+(.+)', re.IGNORECASE)
+# Пунктуация, которая не влияет на смысл вопроса (ключ объединения одинаковых запросов к модели)
+QUESTION_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]+")
+
+
+class IntentResult(NamedTuple):
+    """Намерения и сущности, найденные в сообщении"""
+    intents: FrozenSet[str]
+    city: Optional[str] = None
+    location: Optional[str] = None
+
+    @property
+    def needs_weather(self) -> bool:
+        return 'weather' in self.intents
+
+    @property
+    def needs_map(self) -> bool:
+        return 'map' in self.intents
+
+    @property
+    def needs_search(self) -> bool:
+        return 'search' in self.intents
+
+
+def build_trie_pattern(words: Iterable[str]) -> str:
+    """Строит регулярное выражение из префиксного дерева слов (быстрее плоской альтернативы)"""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def to_pattern(node: Dict) -> str:
+        ends_here = '' in node
+        branches = [re.escape(char) + to_pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        # Длинные совпадения важнее коротких, поэтому конец слова — последняя альтернатива
+        if len(branches) == 1 and not ends_here:
+            return branches[0]
+        body = '(?:' + '|'.join(branches) + ')'
+        return body + '?' if ends_here else body
+
+    return to_pattern(trie)
+
+
+class IntentEngine:
+    """Определяет все намерения сообщения за один проход по тексту"""
+
+    def __init__(self, intent_keywords: Dict[str, List[str]] = INTENT_KEYWORDS):
+        keyword_intents: Dict[str, set] = {}
+        for intent, keywords in intent_keywords.items():
+            for keyword in keywords:
+                keyword_intents.setdefault(keyword, set()).add(intent)
+
+        # Найденное ключевое слово включает и все ключевые слова, которые в нём содержатся
+        self._intents_for: Dict[str, FrozenSet[str]] = {}
+        for keyword in keyword_intents:
+            intents = set()
+            for other, other_intents in keyword_intents.items():
+                if other in keyword:
+                    intents |= other_intents
+            self._intents_for[keyword] = frozenset(intents)
+
+        self.all_intents = frozenset(intent_keywords)
+        # Просмотр вперёд даёт самое длинное совпадение в каждой позиции текста
+        self._pattern = re.compile('(?=(' + build_trie_pattern(keyword_intents) + '))')
+
+    def match_intents(self, text: str) -> FrozenSet[str]:
+        """Возвращает множество намерений, ключевые слова которых есть в тексте"""
+        intents = set()
+        intents_for = self._intents_for
+        for match in self._pattern.finditer(text.lower()):
+            intents |= intents_for[match.group(1)]
+            if len(intents) == len(self.all_intents):
+                break
+        return frozenset(intents)
+
+    def detect(self, text: str) -> IntentResult:
+        """Находит намерения и извлекает город и местоположение"""
+        intents = self.match_intents(text)
+
+        city = None
+        if 'weather' in intents:
+            for pattern in CITY_PATTERNS:
+                city_match = pattern.search(text)
+                if city_match:
+                    city = city_match.group(1)
+                    break
+
+        location = None
+        if 'map' in intents:
+            location_match = LOCATION_PATTERN.search(text)
+            if location_match:
+                location = location_match.group(1).strip('?!.')
+
+        return IntentResult(intents, city, location)
+
+
+# Общий экземпляр, собирается один раз при импорте
+intent_engine = IntentEngine()
+
+
+def detect_intents(text: str) -> IntentResult:
+    """Определяет намерения сообщения общим движком"""
+    return intent_engine.detect(text)
+
+
+# Частые города с вариантами написания (падежные формы) -> название для OpenWeatherMap
+CITY_VARIATIONS = {
+    'москве': 'Moscow',
+    'москвы': 'Moscow',
+    'москву': 'Moscow',
+    'москва': 'Moscow',
+    'петербурге': 'Saint Petersburg',
+    'питере': 'Saint Petersburg',
+    'питер': 'Saint Petersburg',
+    'новосибирске': 'Novosibirsk',
+    'новосибирска': 'Novosibirsk',
+    'новосибирск': 'Novosibirsk',
+    'екатеринбурге': 'Yekaterinburg',
+    'екатеринбург': 'Yekaterinburg',
+    'казани': 'Kazan',
+    'казань': 'Kazan',
+    'нижнем': 'Nizhny Novgorod',
+    'красноярске': 'Krasnoyarsk',
+    'красноярск': 'Krasnoyarsk',
+    'лондоне': 'London',
+    'лондон': 'London',
+    'париже': 'Paris',
+    'париж': 'Paris',
+    'берлине': 'Berlin',
+    'берлин': 'Berlin',
+    'нью-йорке': 'New York',
+    'вашингтоне': 'Washington',
+    'вашингтон': 'Washington',
+    'токио': 'Tokyo',
+    'пекине': 'Beijing',
+    'пекин': 'Beijing',
+}
+
+
+def normalize_city_name(city: str) -> str:
+    """
+    Нормализует название города, убирая падежные окончания
+
+    Args:
+        city: Название города (может быть в любом падеже)
+
+    Returns:
+        Нормализованное название города в именительном падеже
+    """
+    city_lower = city.lower().strip()
+
+    # Проверяем словарь
+    if city_lower in CITY_VARIATIONS:
+        return CITY_VARIATIONS[city_lower]
+
+    # Для неизвестных городов пробуем убрать типичные окончания
+    # Предложный падеж: -е, -ске
+    if city_lower.endswith('ске'):
+        return city[:-2]  # новосибирск
+    elif city_lower.endswith('не'):
+        return city[:-1]  # лондон
+    elif city_lower.endswith('е') and len(city) > 3:
+        # Проверяем, не заканчивается ли на -ие (в таких случаях -е не убираем)
+        if not city_lower.endswith('ие'):
+            return city[:-1]
+
+    # Родительный падеж: -ы, -а
+    if city_lower.endswith('ы') and len(city) > 3:
+        return city[:-1]
+
+    # Возвращаем как есть, если не смогли нормализовать
+    return city
+
+
+def normalize_location(location: str) -> str:
+    """Приводит строку местоположения к ключу кэша геокодирования"""
+    return " ".join(location.lower().split())
+
+
+def normalize_question(text: str) -> str:
+    """Приводит вопрос к ключу объединения запросов: регистр, пунктуация и лишние пробелы не важны"""
+    return " ".join(QUESTION_PUNCTUATION_PATTERN.sub(" ", text.lower().replace("ё", "е")).split())
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Асинхронные провайдеры AI моделей
+GigaChat вызывается через асинхронный API библиотеки с общим пулом соединений,
+Yandex GPT — через асинхронный SDK с адаптивным опросом отложенных операций.
+SDK моделей импортируются при первом обращении к клиенту, а не при загрузке модуля
+"""
+
+import asyncio
+import logging
+import math
+import time
+from functools import cache, cached_property
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+import httpx
+
+from prompts import build_giga_prompt, build_yandex_messages
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+# Отдельный логгер для раундов опроса: эти записи частые, их можно прореживать (LOG_SAMPLING)
+poll_logger = logging.getLogger(f"{__name__}.poll")
+
+
+@cache
+def pooled_gigachat_class() -> type:
+    """Импортирует gigachat и возвращает класс клиента с общим пулом соединений"""
+    from gigachat import GigaChat
+    from gigachat.client import _get_kwargs
+
+    class PooledGigaChat(GigaChat):
+        """GigaChat с настраиваемым пулом keep-alive соединений для асинхронных запросов"""
+
+        def __init__(self, *args, max_connections: int = 20, max_keepalive_connections: int = 10, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._limits = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            )
+
+        @cached_property
+        def _aclient(self) -> httpx.AsyncClient:
+            # Один AsyncClient на весь бот: соединения и TLS-сессии переиспользуются
+            return httpx.AsyncClient(**_get_kwargs(self._settings), limits=self._limits)
+
+    return PooledGigaChat
+
+
+def __getattr__(name: str):
+    # PooledGigaChat доступен как атрибут модуля, но gigachat импортируется только при обращении к нему
+    if name == "PooledGigaChat":
+        return pooled_gigachat_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class LazyClient:
+    """Клиент SDK модели, который создаётся при первом обращении
+
+    preload выполняется в отдельном потоке (импорт тяжёлого SDK не задерживает цикл событий),
+    factory — уже в цикле событий, где клиент потом и используется.
+    """
+
+    def __init__(self, factory: Callable[[], Any], preload: Optional[Callable[[], Any]] = None):
+        self.factory = factory
+        self.preload = preload
+        self.client: Optional[Any] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.client is not None
+
+    async def get(self) -> Any:
+        if self.client is None:
+            async with self._lock:
+                if self.client is None:
+                    started = time.perf_counter()
+                    if self.preload:
+                        await asyncio.to_thread(self.preload)
+                    self.client = self.factory()
+                    logger.info(f"Клиент модели создан за {time.perf_counter() - started:.2f} с")
+        return self.client
+
+
+class LLMProvider:
+    """Общий интерфейс AI модели: запрос строит сама модель, ответ — всегда текст"""
+
+    # Короткое имя (ключ выбора модели и счётчиков), название и эмодзи для ответов
+    name = ""
+    label = ""
+    emoji = ""
+
+    def build_request(self, user_message: str, username: str, web_context: str = "") -> Any:
+        """Формирует запрос к модели в её собственном формате"""
+        raise NotImplementedError
+
+    async def complete(self, request: Any) -> str:
+        """Возвращает полный текст ответа"""
+        raise NotImplementedError
+
+    def stream(self, request: Any) -> AsyncIterator[str]:
+        """Возвращает накопленный текст ответа по мере генерации"""
+        raise NotImplementedError
+
+    async def warm_up(self) -> None:
+        """Заранее создаёт клиент модели, чтобы первый запрос не ждал импорта SDK"""
+
+    async def health_check(self) -> None:
+        """Проверка модели при запуске бота; исключение — модель недоступна"""
+        await self.warm_up()
+
+    async def aclose(self) -> None:
+        """Освобождает ресурсы провайдера"""
+
+
+class GigaChatProvider(LLMProvider):
+    """Неблокирующий провайдер GigaChat с ограничением одновременных запросов"""
+
+    name = "giga"
+    label = "GigaChat"
+    emoji = "🟢"
+
+    def __init__(self, client_factory: Callable[[], Any], max_concurrent: int = 10, timeout: float = 60):
+        # Клиент GigaChat создаётся при первом запросе или прогреве: импорт gigachat занимает заметное время
+        self._client = LazyClient(client_factory, preload=pooled_gigachat_class)
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def chat(self, prompt: str):
+        """Отправляет промпт в GigaChat, не блокируя цикл событий"""
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                client = await self._client.get()
+                with tracer.span("gigachat.chat"):
+                    return await asyncio.wait_for(client.achat(prompt), timeout=self.timeout)
+            finally:
+                self.in_flight -= 1
+
+    def build_request(self, user_message: str, username: str, web_context: str = "") -> str:
+        return build_giga_prompt(user_message, web_context)
+
+    async def complete(self, prompt: str) -> str:
+        response = await self.chat(prompt)
+        return response.choices[0].message.content if response and response.choices else ""
+
+    async def stream(self, prompt: str):
+        """Потоковый ответ GigaChat: возвращает накопленный текст после каждого фрагмента"""
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                client = await self._client.get()
+                text = ""
+                started = time.perf_counter()
+                async with asyncio.timeout(self.timeout):
+                    async for chunk in client.astream(prompt):
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if not text:
+                                tracer.record("gigachat.first_chunk", started)
+                            text += chunk.choices[0].delta.content
+                            yield text
+            finally:
+                self.in_flight -= 1
+
+    async def warm_up(self) -> None:
+        await self._client.get()
+
+    async def health_check(self) -> None:
+        """Кроме создания клиента делает тестовый запрос: проверяет ключ и сертификаты"""
+        await self.warm_up()
+        await self.chat("тест")
+
+    async def aclose(self) -> None:
+        """Закрывает пул соединений клиента"""
+        if not self._client.ready:
+            return
+        try:
+            await self._client.client.aclose()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии клиента GigaChat: {e}")
+
+
+# Адаптивное расписание опроса отложенных операций Yandex GPT (в секундах):
+# сначала часто, затем реже; последний интервал повторяется до завершения
+YANDEX_POLL_SCHEDULE = (0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0)
+# Фиксированный интервал опроса, который использовался раньше
+LEGACY_POLL_INTERVAL = 5.0
+
+
+def poll_delays(schedule=YANDEX_POLL_SCHEDULE):
+    """Генерирует интервалы между опросами статуса операции"""
+    yield from schedule
+    while True:
+        yield schedule[-1]
+
+
+def legacy_poll_latency(first_poll: float, elapsed: float, interval: float = LEGACY_POLL_INTERVAL) -> float:
+    """Когда операция была бы замечена при опросе с фиксированным интервалом"""
+    return first_poll + math.ceil((elapsed - first_poll) / interval) * interval
+
+
+class _TrackedOperation:
+    """Операция Yandex GPT, ожидающая завершения"""
+
+    __slots__ = ('operation', 'future', 'delays', 'next_poll')
+
+    def __init__(self, operation, future: asyncio.Future, delays, next_poll: float):
+        self.operation = operation
+        self.future = future
+        self.delays = delays
+        self.next_poll = next_poll
+
+
+class YandexOperationPoller:
+    """Единый фоновый опрос всех незавершённых отложенных операций Yandex GPT"""
+
+    def __init__(self, schedule=YANDEX_POLL_SCHEDULE, max_batch: int = 50, max_parallel_calls: int = 10,
+                 min_round_interval: float = 0.2):
+        self.schedule = schedule
+        self.max_batch = max_batch
+        self.min_round_interval = min_round_interval
+        self._call_limit = asyncio.Semaphore(max_parallel_calls)
+        self._operations: Dict[str, _TrackedOperation] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Статистика опроса
+        self.rounds = 0
+        self.status_calls = 0
+
+    @property
+    def pending(self) -> int:
+        """Число операций, ожидающих завершения"""
+        return len(self._operations)
+
+    async def wait(self, operation):
+        """Ставит операцию на опрос и ждёт её завершения, возвращает итоговый статус"""
+        loop = asyncio.get_running_loop()
+        delays = poll_delays(self.schedule)
+        tracked = _TrackedOperation(operation, loop.create_future(), delays, loop.time() + next(delays))
+        self._operations[operation.id] = tracked
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="yandex-operation-poller")
+        self._wakeup.set()
+        try:
+            return await tracked.future
+        finally:
+            self._operations.pop(operation.id, None)
+
+    async def stop(self) -> None:
+        """Останавливает фоновый опрос"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            if not self._operations:
+                await self._wakeup.wait()
+                continue
+
+            now = loop.time()
+            due = sorted(
+                (tracked for tracked in self._operations.values() if tracked.next_poll <= now),
+                key=lambda tracked: tracked.next_poll,
+            )[:self.max_batch]
+            if not due:
+                # Спим до ближайшего опроса или до появления новой операции
+                next_poll = min(tracked.next_poll for tracked in self._operations.values())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=next_poll - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._poll_round(due)
+            await asyncio.sleep(self.min_round_interval)
+
+    async def _poll_round(self, due) -> None:
+        self.rounds += 1
+        statuses = await asyncio.gather(*(self._get_status(tracked) for tracked in due), return_exceptions=True)
+        now = asyncio.get_running_loop().time()
+        still_running = 0
+        for tracked, status in zip(due, statuses):
+            if tracked.future.done():
+                # Обработчик уже не ждёт (таймаут или отмена)
+                self._operations.pop(tracked.operation.id, None)
+            elif isinstance(status, BaseException):
+                tracked.future.set_exception(status)
+            elif status.is_running:
+                tracked.next_poll = now + next(tracked.delays)
+                still_running += 1
+            else:
+                tracked.future.set_result(status)
+        if still_running:
+            poll_logger.info(f"Операции Yandex GPT выполняются: {still_running} из {len(due)} в раунде опроса")
+
+    async def _get_status(self, tracked: _TrackedOperation):
+        async with self._call_limit:
+            self.status_calls += 1
+            return await tracked.operation.get_status()
+
+
+class YandexGPTProvider(LLMProvider):
+    """Асинхронный провайдер Yandex GPT с адаптивным опросом отложенных операций"""
+
+    name = "yandex"
+    label = "Yandex GPT"
+    emoji = "🔵"
+
+    def __init__(self, model_factory: Callable[[], Any], temperature: float = 0.5, max_concurrent: int = 10,
+                 timeout: float = 120, poller: Optional[YandexOperationPoller] = None,
+                 preload: Optional[Callable[[], Any]] = None):
+        # Модель из AsyncYCloudML: run_deferred и get_status не блокируют цикл событий.
+        # SDK импортируется в preload при первом запросе или прогреве
+        self._model = LazyClient(lambda: model_factory().configure(temperature=temperature), preload=preload)
+        # Статусы всех операций проверяет один общий поллер
+        self.poller = poller or YandexOperationPoller()
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        # Статистика опроса
+        self.completed_operations = 0
+        self.poll_time_saved = 0.0
+        # Статистика потоковых ответов: они идут мимо поллера
+        self.streamed_responses = 0
+        self.first_chunk_seconds = 0.0
+
+    def build_request(self, user_message: str, username: str, web_context: str = ""):
+        return build_yandex_messages(user_message, web_context)
+
+    async def complete(self, messages) -> str:
+        """Отправляет сообщения в Yandex GPT и дожидается текста ответа"""
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                result = await asyncio.wait_for(self._run(messages), timeout=self.timeout)
+            finally:
+                self.in_flight -= 1
+        return result.alternatives[0].text if result.alternatives else ""
+
+    async def stream(self, messages):
+        """Потоковый ответ Yandex GPT: возвращает накопленный текст по мере генерации
+
+        run_stream не использует отложенные операции, поэтому адаптивный опрос здесь не участвует
+        """
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                first_chunk = True
+                started = time.perf_counter()
+                model = await self._model.get()
+                async with asyncio.timeout(self.timeout):
+                    async for result in model.run_stream(messages):
+                        if result.alternatives:
+                            if first_chunk:
+                                first_chunk = False
+                                tracer.record("yandex.first_chunk", started)
+                                self.streamed_responses += 1
+                                self.first_chunk_seconds += time.perf_counter() - started
+                            yield result.alternatives[0].text
+            finally:
+                self.in_flight -= 1
+
+    async def _run(self, messages):
+        model = await self._model.get()
+        started = time.monotonic()
+        with tracer.span("yandex.run_deferred"):
+            operation = await model.run_deferred(messages)
+        first_poll = time.monotonic() - started
+
+        with tracer.span("yandex.poll_wait", operation=operation.id):
+            status = await self.poller.wait(operation)
+        if status.is_failed:
+            logger.warning(f"Операция Yandex GPT {operation.id} завершилась с ошибкой")
+
+        elapsed = time.monotonic() - started
+        self._record_completion(first_poll, elapsed)
+        with tracer.span("yandex.get_result"):
+            return await operation.get_result()
+
+    def _record_completion(self, first_poll: float, elapsed: float) -> None:
+        saved = max(0.0, legacy_poll_latency(first_poll, elapsed) - elapsed)
+        self.completed_operations += 1
+        self.poll_time_saved += saved
+        logger.info(f"Операция Yandex GPT завершена за {elapsed:.2f} с (экономия на опросе {saved:.2f} с)")
+
+    @property
+    def average_first_chunk(self) -> float:
+        """Среднее время до первого фрагмента потокового ответа"""
+        if not self.streamed_responses:
+            return 0.0
+        return self.first_chunk_seconds / self.streamed_responses
+
+    @property
+    def average_time_saved(self) -> float:
+        """Средняя экономия задержки на один запрос"""
+        if not self.completed_operations:
+            return 0.0
+        return self.poll_time_saved / self.completed_operations
+
+    async def warm_up(self) -> None:
+        await self._model.get()
+
+    async def aclose(self) -> None:
+        """Останавливает общий поллер операций"""
+        await self.poller.stop()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Логирование вне цикла событий
+Записи попадают в очередь, а в файлы и консоль их пишет фоновый поток (QueueListener);
+ротация файлов по размеру или по времени, JSON Lines и прореживание болтливых логгеров
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+# Формат логов с временными метками
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON (JSON Lines)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """Постановка записи в очередь внутри процесса: сообщение и трассировку форматирует фоновый поток
+
+    Стандартный QueueHandler форматирует запись (вместе с трассировкой) ещё в потоке цикла событий
+    и сбрасывает exc_info — тогда JsonFormatter не может вынести трассировку в отдельное поле
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы подставляем сразу: изменяемые объекты могут поменяться, пока запись ждёт в очереди.
+        # exc_info оставляем как есть — очередь в памяти, сериализация не нужна
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только каждую N-ю запись выбранных логгеров; предупреждения и ошибки — всегда"""
+
+    def __init__(self, every: Dict[str, int], max_level: int = logging.INFO):
+        super().__init__()
+        self.every = {name: n for name, n in every.items() if n > 1}
+        self.max_level = max_level
+        self._counters: Dict[str, int] = {}
+        self.dropped = 0
+
+    def _rate_for(self, name: str) -> int:
+        # Настройка для логгера действует и на его дочерние логгеры
+        while name:
+            if name in self.every:
+                return self.every[name]
+            name = name.rpartition('.')[0]
+        return 1
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.every or record.levelno > self.max_level:
+            return True
+        rate = self._rate_for(record.name)
+        if rate == 1:
+            return True
+        count = self._counters.get(record.name, 0)
+        self._counters[record.name] = count + 1
+        if count % rate == 0:
+            return True
+        self.dropped += 1
+        return False
+
+
+def parse_sampling(value: str) -> Dict[str, int]:
+    """Разбирает настройку вида "llm_providers.poll=20,APIRequests=2" """
+    every = {}
+    for item in (value or "").split(','):
+        name, _, rate = item.strip().partition('=')
+        if name and rate:
+            every[name] = int(rate)
+    return every
+
+
+def build_file_handler(path: str, rotation: str = "size", max_bytes: int = 10 * 1024 * 1024,
+                       backup_count: int = 7, when: str = "midnight") -> logging.Handler:
+    """Файловый обработчик с ротацией по размеру (size), по времени (time) или без неё (none)"""
+    if rotation == "size":
+        return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                    encoding='utf-8')
+    if rotation == "time":
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count,
+                                                         encoding='utf-8')
+    return logging.FileHandler(path, encoding='utf-8')
+
+
+def setup_queue_logging(handlers: Iterable[logging.Handler], level: int = logging.INFO,
+                        sampling: Optional[Dict[str, int]] = None) -> logging.handlers.QueueListener:
+    """Подключает к корневому логгеру очередь; записи из неё пишет фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LocalQueueHandler(log_queue)
+    if sampling:
+        # Прореживаем до постановки в очередь: отброшенные записи не форматируются и не пишутся
+        queue_handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # При выходе дописываем всё, что осталось в очереди
+    atexit.register(stop_queue_logging)
+    return _listener
+
+
+def stop_queue_logging() -> None:
+    """Останавливает фоновый поток, записав оставшиеся записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
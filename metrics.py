@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Метрики бота в формате Prometheus
+Счётчики, измерители и гистограммы задержек, HTTP-эндпоинт /metrics на asyncio
+и измерение задержки цикла событий; перцентили для /status считаются по тем же гистограммам
+"""
+
+import asyncio
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек (секунды): от быстрых этапов до долгой генерации ответа
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание и значения по наборам меток"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labelvalues: Sequence[str]) -> LabelValues:
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получено {labelvalues}")
+        return tuple(str(value) for value in labelvalues)
+
+    def set_function(self, func: Callable[[], float], *labelvalues: str) -> None:
+        """Значение берётся из функции в момент чтения (например, из счётчиков кэша)"""
+        self._functions[self._key(labelvalues)] = func
+
+    def get(self, *labelvalues: str) -> float:
+        """Текущее значение для набора меток"""
+        key = self._key(labelvalues)
+        if key in self._functions:
+            return float(self._functions[key]())
+        return self._values.get(key, 0.0)
+
+    def total(self) -> float:
+        """Сумма значений по всем наборам меток"""
+        return sum(self._values.values()) + sum(float(func()) for func in self._functions.values())
+
+    def samples(self) -> Iterator[Tuple[str, LabelValues, Optional[Tuple[str, str]], float]]:
+        for key, value in self._values.items():
+            yield self.name, key, None, value
+        for key, func in self._functions.items():
+            try:
+                yield self.name, key, None, float(func())
+            except Exception as e:
+                logger.debug(f"Не удалось получить значение метрики {self.name}: {e}")
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик"""
+
+    type_name = "counter"
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        key = self._key(labelvalues)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Значение, которое может расти и уменьшаться"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self._values[self._key(labelvalues)] = float(value)
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами; по ней же оцениваются перцентили"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        key = self._key(labelvalues)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * len(self.buckets)
+            self._sums[key] = 0.0
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        """Измеряет время выполнения блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        return sum(self._counts.get(self._key(labelvalues), ()))
+
+    def label_sets(self) -> List[LabelValues]:
+        """Наборы меток, для которых есть наблюдения"""
+        return list(self._counts)
+
+    def quantile(self, q: float, *labelvalues: str) -> Optional[float]:
+        """Оценка перцентиля линейной интерполяцией внутри корзины (как histogram_quantile в Prometheus)"""
+        counts = self._counts.get(self._key(labelvalues))
+        if not counts:
+            return None
+        total = sum(counts)
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, counts):
+            if count and cumulative + count >= rank:
+                if bound == math.inf:
+                    # Выше последней границы точнее оценить нельзя
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            if bound != math.inf:
+                lower = bound
+        return lower
+
+    def samples(self):
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield self.name + "_bucket", key, ("le", _format_value(bound)), cumulative
+            yield self.name + "_sum", key, None, self._sums[key]
+            yield self.name + "_count", key, None, cumulative
+
+
+class Registry:
+    """Набор метрик, который отдаётся на /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (версия 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class MetricsServer:
+    """Минимальный HTTP-сервер на asyncio, отдающий метрики по GET /metrics (и дополнительные пути)"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9108, registry: Registry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        # Путь -> (Content-Type, функция, возвращающая тело ответа)
+        self.routes: Dict[str, Tuple[str, Callable[[], str]]] = {
+            "/metrics": ("text/plain; version=0.0.4; charset=utf-8", registry.render),
+        }
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def add_route(self, path: str, content_type: str, render: Callable[[], str]) -> None:
+        """Отдаёт по GET path результат render() (например, трассы в JSON)"""
+        self.routes[path] = (content_type, render)
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны — дочитываем до пустой строки
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            route = self.routes.get(parts[1].split("?")[0]) if len(parts) >= 2 and parts[0] == "GET" else None
+            if route:
+                content_type, render = route
+                try:
+                    status, body = "200 OK", render().encode()
+                except Exception as e:
+                    # Сбой функции метрики (например, при запуске или остановке бота) — ответ 500, а не обрыв соединения
+                    logger.error(f"Ошибка формирования ответа {parts[1]}: {e}", exc_info=True)
+                    status, content_type, body = "500 Internal Server Error", "text/plain; charset=utf-8", b"internal error\n"
+            else:
+                status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug(f"Ошибка запроса метрик: {e}")
+        finally:
+            writer.close()
+
+
+class EventLoopLagMonitor:
+    """Измеряет, насколько позже запланированного просыпается задача в цикле событий"""
+
+    def __init__(self, histogram: Histogram, gauge: Gauge, interval: float = 0.5):
+        self.histogram = histogram
+        self.gauge = gauge
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled)
+            self.histogram.observe(lag)
+            self.gauge.set(lag)
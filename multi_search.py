@@ -4,18 +4,38 @@
 Без регистрации и API ключей
 """
 
-import requests
+import asyncio
 import json
-import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import List, Dict, Optional
 import logging
 
+from http_client import get_http_client
+
 logger = logging.getLogger(__name__)
 
+# Дедлайны поисковиков (в секундах)
+ENGINE_DEADLINES = {
+    'duckduckgo': 6.0,
+    'mojeek': 5.0,
+    'metager': 5.0,
+    'brave': 2.0,
+}
+DEFAULT_ENGINE_DEADLINE = 5.0
+
+# Синхронные поисковики (DuckDuckGo) работают в своём ограниченном пуле потоков: отменить поток нельзя,
+# и зависший поиск не должен занимать общий пул цикла событий (asyncio.to_thread, DNS)
+SYNC_ENGINE_WORKERS = 4
+_sync_engine_executor = ThreadPoolExecutor(max_workers=SYNC_ENGINE_WORKERS, thread_name_prefix="multi-search")
+
 class MultiSearch:
     """Класс для поиска через несколько поисковиков одновременно"""
     
-    def __init__(self):
+    def __init__(self, engine_deadlines: Optional[Dict[str, float]] = None):
+        self.engine_deadlines = dict(ENGINE_DEADLINES)
+        if engine_deadlines:
+            self.engine_deadlines.update(engine_deadlines)
         self.search_engines = {
             'duckduckgo': self.search_duckduckgo,
             'mojeek': self.search_mojeek,
@@ -61,7 +81,7 @@ class MultiSearch:
             logger.error(f"Ошибка DuckDuckGo: {e}")
             return []
     
-    def search_mojeek(self, query: str, max_results: int = 3) -> List[Dict]:
+    async def search_mojeek(self, query: str, max_results: int = 3) -> List[Dict]:
         """Поиск через Mojeek API"""
         try:
             # Mojeek API endpoint
@@ -72,7 +92,7 @@ class MultiSearch:
                 'count': max_results
             }
             
-            response = requests.get(url, params=params, timeout=5)
+            response = await get_http_client().get(url, params=params)
             if response.status_code == 200:
                 data = response.json()
                 results = []
@@ -96,7 +116,7 @@ class MultiSearch:
             logger.error(f"Ошибка Mojeek: {e}")
             return []
     
-    def search_metager(self, query: str, max_results: int = 3) -> List[Dict]:
+    async def search_metager(self, query: str, max_results: int = 3) -> List[Dict]:
         """Поиск через MetaGer API"""
         try:
             # MetaGer API endpoint
@@ -109,7 +129,7 @@ class MultiSearch:
                 'num': max_results
             }
             
-            response = requests.get(url, params=params, timeout=5)
+            response = await get_http_client().get(url, params=params)
             if response.status_code == 200:
                 # MetaGer возвращает HTML, нужно парсить
                 # Это упрощенная версия
@@ -135,67 +155,106 @@ class MultiSearch:
             logger.error(f"Ошибка Brave: {e}")
             return []
     
-    def search_all(self, query: str, max_results: int = 3) -> str:
-        """Поиск через все доступные поисковики"""
-        all_results = []
-        
-        # Запускаем поиск параллельно
-        for engine_name, search_func in self.search_engines.items():
-            try:
-                results = search_func(query, max_results)
-                all_results.extend(results)
-                time.sleep(0.1)  # Небольшая задержка между запросами
-            except Exception as e:
-                logger.error(f"Ошибка в {engine_name}: {e}")
-        
-        # Убираем дубликаты по URL
-        unique_results = []
-        seen_urls = set()
-        
-        for result in all_results:
+    async def _run_engine(self, engine_name: str, query: str, max_results: int) -> List[Dict]:
+        """Запускает один поисковик с собственным дедлайном"""
+        search_func = self.search_engines[engine_name]
+        deadline = self.engine_deadlines.get(engine_name, DEFAULT_ENGINE_DEADLINE)
+        try:
+            if asyncio.iscoroutinefunction(search_func):
+                coro = search_func(query, max_results)
+            else:
+                # Синхронные библиотеки (DuckDuckGo) выполняем вне цикла событий, в отдельном пуле
+                coro = asyncio.get_running_loop().run_in_executor(
+                    _sync_engine_executor, partial(search_func, query, max_results))
+            return await asyncio.wait_for(coro, timeout=deadline)
+        except asyncio.TimeoutError:
+            logger.warning(f"{engine_name} не уложился в {deadline} с")
+            return []
+        except Exception as e:
+            logger.error(f"Ошибка в {engine_name}: {e}")
+            return []
+    
+    @staticmethod
+    def add_unique(results: List[Dict], unique_results: List[Dict], seen_urls: set) -> None:
+        """Добавляет результаты, убирая дубликаты по URL"""
+        for result in results:
             url = result.get('url', '')
             if url and url not in seen_urls:
                 seen_urls.add(url)
                 unique_results.append(result)
+    
+    @staticmethod
+    def format_results(unique_results: List[Dict], max_results: int = 3) -> str:
+        """Формирует итоговый текст для промпта"""
+        if not unique_results:
+            return ""
         
-        # Формируем итоговый текст
-        if unique_results:
-            context = "\n🔍 РЕЗУЛЬТАТЫ ПОИСКА:\n"
+        context = "\n🔍 РЕЗУЛЬТАТЫ ПОИСКА:\n"
+        
+        for i, result in enumerate(unique_results[:max_results], 1):
+            title = result.get('title', 'Без названия')
+            body = result.get('body', '')
+            url = result.get('url', '')
+            source = result.get('source', 'Неизвестно')
+            date = result.get('date', '')
             
-            for i, result in enumerate(unique_results[:max_results], 1):
-                title = result.get('title', 'Без названия')
-                body = result.get('body', '')
-                url = result.get('url', '')
-                source = result.get('source', 'Неизвестно')
-                date = result.get('date', '')
-                
-                context += f"\n{i}. **{title}**"
-                if date:
-                    context += f" ({date})"
-                context += f" - {source}\n"
-                
-                if body:
-                    body_text = body[:300] + "..." if len(body) > 300 else body
-                    context += f"   {body_text}\n"
-                
-                if url:
-                    context += f"   🔗 {url}\n"
+            context += f"\n{i}. **{title}**"
+            if date:
+                context += f" ({date})"
+            context += f" - {source}\n"
             
-            context += "\n⚠️ ВАЖНО: Используй ЭТУ информацию для ответа!\n"
+            if body:
+                body_text = body[:300] + "..." if len(body) > 300 else body
+                context += f"   {body_text}\n"
+            
+            if url:
+                context += f"   🔗 {url}\n"
+        
+        context += "\n⚠️ ВАЖНО: Используй ЭТУ информацию для ответа!\n"
+        return context
+    
+    async def search_all(self, query: str, max_results: int = 3) -> str:
+        """Поиск через все доступные поисковики
+        
+        Невостребованные поисковики отменяются; синхронный поиск в потоке отменить нельзя — он
+        дорабатывает в фоне, но занимает только свой ограниченный пул
+        """
+        unique_results = []
+        seen_urls = set()
+        
+        # Запускаем поиск параллельно, у каждого поисковика свой дедлайн
+        pending = {
+            asyncio.create_task(self._run_engine(engine_name, query, max_results), name=engine_name)
+            for engine_name in self.search_engines
+        }
+        try:
+            # Выходим, как только набрали достаточно уникальных результатов
+            while pending and len(unique_results) < max_results:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    self.add_unique(task.result(), unique_results, seen_urls)
+        finally:
+            # Медленные поисковики больше не нужны: отменяем и дожидаемся завершения задач
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.info(f"Отменены медленные поисковики: {', '.join(task.get_name() for task in pending)}")
+        
+        if unique_results:
             logger.info(f"Мультипоиск вернул {len(unique_results)} уникальных результатов")
-            return context
         else:
             logger.warning("Мультипоиск не вернул результатов")
-            return ""
+        return self.format_results(unique_results, max_results)
 
 # Функция для интеграции в основной бот
-def search_web_multi(query: str, max_results: int = 3) -> str:
+async def search_web_multi(query: str, max_results: int = 3) -> str:
     """Мультипоиск для интеграции в unified_bot.py"""
     searcher = MultiSearch()
-    return searcher.search_all(query, max_results)
+    return await searcher.search_all(query, max_results)
 
 if __name__ == "__main__":
     # Тестирование
     searcher = MultiSearch()
-    results = searcher.search_all("новости 2025", 3)
+    results = asyncio.run(searcher.search_all("новости 2025", 3))
     print(results)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Промпты для AI моделей и разбор их ответов
+Чистые функции без сетевых вызовов: одинаково используются всеми провайдерами
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Фразы, по которым видно, что модель отказалась отвечать (цензура)
+REFUSAL_PHRASES = (
+    "не могу обсуждать",
+    "не могу помочь с этим",
+    "не могу ответить",
+    "не буду обсуждать",
+    "давайте поговорим о чём-нибудь",
+)
+
+# Максимальная длина ответа модели, который отправляем в Telegram
+MAX_RESPONSE_CHARS = 4000
+
+
+def build_yandex_messages(user_message: str, web_context: str = "", now: Optional[datetime] = None) -> List[Dict[str, str]]:
+    """Формирует сообщения для Yandex GPT с актуальной датой и найденным контекстом"""
+    now = now or datetime.now()
+    current_date = now.strftime("%Y-%m-%d")
+    current_year = now.year
+
+    system_prompt = f"Ты — профессиональный умный помощник. Сейчас {current_date} ({current_year} год). Отвечай кратко и понятно."
+
+    if web_context:
+        system_prompt += f"\n\n📰 АКТУАЛЬНАЯ ИНФОРМАЦИЯ ИЗ ИНТЕРНЕТА (24 ноября 2025 года):\n{web_context}\n\n🎯 КРИТИЧЕСКИ ВАЖНО:\n"
+        system_prompt += "1. Выше — САМЫЕ СВЕЖИЕ новости на 24 ноября 2025 года из реального интернета\n"
+        system_prompt += "2. Твои знания устарели (2023 год). Используй ТОЛЬКО информацию выше\n"
+        system_prompt += "3. ОБЯЗАТЕЛЬНО отвечай на основе этих новостей, игнорируй свои старые данные\n"
+        system_prompt += "4. Укажи источники и даты из данных выше\n"
+        system_prompt += "5. Если в новостях нет ответа на вопрос — честно скажи об этом\n"
+        system_prompt += "6. Отвечай кратко, максимум 500 символов\n"
+    else:
+        system_prompt += "\n\n⚠️ ВАЖНО: Твои знания ограничены 2023 годом. Для актуальных новостей 2024-2025 года рекомендуй проверить достоверные источники (РИА, ТАСС, Коммерсантъ)."
+
+    return [
+        {
+            "role": "system",
+            "text": system_prompt,
+        },
+        {
+            "role": "user",
+            "text": user_message,
+        },
+    ]
+
+
+def build_giga_prompt(user_message: str, web_context: str = "", now: Optional[datetime] = None) -> str:
+    """Формирует промпт для GigaChat с актуальной датой и найденным контекстом
+
+    Имя пользователя в промпт не попадает: одинаковые вопросы разных пользователей дают один промпт
+    """
+    now = now or datetime.now()
+    current_date = now.strftime("%Y-%m-%d")
+    current_year = now.year
+
+    if web_context:
+        return f"""Текущая дата: {current_date} ({current_year} год)
+
+📰 АКТУАЛЬНАЯ ИНФОРМАЦИЯ ИЗ ИНТЕРНЕТА (24 ноября 2025 года):
+{web_context}
+
+🎯 КРИТИЧЕСКИ ВАЖНО:
+1. Пользователь спросил: "{user_message}"
+2. Выше — САМЫЕ СВЕЖИЕ новости на 24 ноября 2025 года из реального интернета
+3. Твои знания устарели (2023 год). Используй ТОЛЬКО информацию выше
+4. ОБЯЗАТЕЛЬНО отвечай на основе этих новостей, игнорируй свои старые данные
+5. Укажи источники и даты из данных выше
+6. Если в новостях нет ответа — честно скажи об этом
+7. Добавь эмодзи для лучшего восприятия
+
+Максимум 600 символов. Отвечай кратко и по делу!
+"""
+
+    return f"""Текущая дата: {current_date} ({current_year} год)
+
+Ты умный помощник в Telegram-боте. Пользователь написал: "{user_message}"
+
+⚠️ ВАЖНЫЕ ПРАВИЛА:
+✅ Сейчас {current_year} год - учитывай это при ответах
+✅ Твои знания ограничены 2023 годом
+✅ Для актуальных новостей 2024-2025 рекомендуй проверить РИА, ТАСС, Коммерсантъ
+✅ Используй эмодзи для лучшего восприятия
+
+Ответь дружелюбно. Максимум 500 символов.
+"""
+
+
+def is_refusal(response_text: str) -> bool:
+    """Проверяет, не отказалась ли модель отвечать"""
+    lowered = response_text.lower()
+    return any(phrase in lowered for phrase in REFUSAL_PHRASES)
+
+
+def render_response(emoji: str, label: str, response_text: str, web_context: str = "") -> str:
+    """Готовит ответ модели к отправке: префикс модели, обрезка и замена отказа на найденные данные"""
+    # Если AI отказался и у нас есть контекст с новостями - показываем их напрямую
+    if web_context and is_refusal(response_text):
+        return f"{emoji} **Актуальная информация:**\n\n{web_context}\n\n_AI отказался обрабатывать этот запрос, поэтому показаны найденные данные напрямую._"
+
+    # Обрезаем ответ если он слишком длинный
+    if len(response_text) > MAX_RESPONSE_CHARS:
+        response_text = response_text[:MAX_RESPONSE_CHARS] + "..."
+
+    # Добавляем префикс модели
+    return f"{emoji} **{label}:**\n\n{response_text}"
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Маршрутизация запросов между AI моделями
+Для каждой модели — скользящее окно последних вызовов (время ответа и ошибки) и предохранитель:
+если модель часто падает или не укладывается в таймаут, запросы к ней временно не отправляются,
+а пользователь сразу получает ответ или переключается на исправную модель.
+Дублирование (hedging): если основная модель не ответила за свой p90, тот же запрос уходит во вторую,
+используется первый ответ; доля дублей ограничена бюджетом
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Состояния предохранителя
+CLOSED = "closed"        # Запросы идут как обычно
+OPEN = "open"            # Модель считается неисправной, запросы не отправляются
+HALF_OPEN = "half_open"  # Пауза прошла: пропускаем один пробный запрос
+
+# Политики переключения на другую модель (LLM_FAILOVER)
+FAILOVER_POLICIES = ("ask", "auto", "off")
+
+
+class CircuitBreaker:
+    """Скользящая статистика вызовов модели и предохранитель по доле ошибок"""
+
+    def __init__(self, name: str, window: float = 60.0, error_threshold: float = 0.5, min_requests: int = 5,
+                 cooldown: float = 30.0, max_samples: int = 200):
+        self.name = name
+        self.window = window
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        # (время завершения, длительность, успех) последних вызовов
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=max_samples)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        # Счётчики
+        self.opened_total = 0
+        self.rejected = 0
+
+    def _trim(self, now: float) -> None:
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+    def record(self, duration: float, ok: bool) -> None:
+        """Учитывает завершившийся вызов модели"""
+        now = time.monotonic()
+        self._samples.append((now, duration, ok))
+        self._trim(now)
+        if self.state == HALF_OPEN:
+            self._probe_started = None
+            if ok:
+                self.state = CLOSED
+                # Старые ошибки не должны сразу снова разомкнуть предохранитель
+                self._samples.clear()
+                self._samples.append((now, duration, ok))
+                logger.info(f"Предохранитель {self.name} замкнут: пробный запрос успешен")
+            else:
+                self._open(now)
+        elif self.state == CLOSED and not ok and self.requests >= self.min_requests \
+                and self.error_rate >= self.error_threshold:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.opened_total += 1
+        logger.warning(f"Предохранитель {self.name} разомкнут: ошибок {self.error_rate:.0%} "
+                       f"из {self.requests} запросов, пауза {self.cooldown:.0f} с")
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос сейчас; в полуоткрытом состоянии пропускает один пробный"""
+        now = time.monotonic()
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self._probe_started = None
+        if self.state == HALF_OPEN:
+            # Пробный запрос, результат которого так и не пришёл (например, отклонён очередью), повторяем после паузы
+            if self._probe_started is None or now - self._probe_started >= self.cooldown:
+                self._probe_started = now
+                return True
+        if self.state == CLOSED:
+            return True
+        self.rejected += 1
+        return False
+
+    @property
+    def available(self) -> bool:
+        """Пропустит ли предохранитель запрос (без занятия пробного запроса)"""
+        if self.state == CLOSED:
+            return True
+        return time.monotonic() - (self._probe_started or self.opened_at) >= self.cooldown
+
+    @property
+    def retry_after(self) -> float:
+        """Через сколько секунд модель снова получит запрос"""
+        if self.available:
+            return 0.0
+        return self.cooldown - (time.monotonic() - (self._probe_started or self.opened_at))
+
+    @property
+    def requests(self) -> int:
+        self._trim(time.monotonic())
+        return len(self._samples)
+
+    @property
+    def error_rate(self) -> float:
+        self._trim(time.monotonic())
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, _, ok in self._samples if not ok) / len(self._samples)
+
+    def latency(self, q: float = 0.5) -> Optional[float]:
+        """Квантиль времени успешных ответов в окне, секунды"""
+        self._trim(time.monotonic())
+        durations = sorted(duration for _, duration, ok in self._samples if ok)
+        if not durations:
+            return None
+        return durations[min(len(durations) - 1, int(q * len(durations)))]
+
+
+class LatencyRouter:
+    """Выбор модели: исправная и самая быстрая по скользящей медиане времени ответа"""
+
+    def __init__(self, names: Iterable[str], policy: str = "ask", **breaker_options):
+        if policy not in FAILOVER_POLICIES:
+            raise ValueError(f"Неизвестная политика переключения {policy!r}, ожидается одна из {FAILOVER_POLICIES}")
+        self.policy = policy
+        # Порядок имён — приоритет среди моделей без статистики
+        self.breakers: Dict[str, CircuitBreaker] = {name: CircuitBreaker(name, **breaker_options) for name in names}
+        self.failovers = 0
+
+    def record(self, name: str, duration: float, ok: bool) -> None:
+        if name in self.breakers:
+            self.breakers[name].record(duration, ok)
+
+    def ranked(self, exclude: Optional[str] = None) -> List[str]:
+        """Модели с исправным предохранителем, от самой быстрой к самой медленной"""
+        order = list(self.breakers)
+
+        def key(name: str):
+            latency = self.breakers[name].latency()
+            # Модели без статистики в окне идут первыми, в порядке приоритета: так маршрутизатор
+            # узнаёт время ответа каждой модели и периодически перепроверяет более медленную
+            return (latency is not None, latency or 0.0, order.index(name))
+
+        return sorted((name for name, breaker in self.breakers.items() if name != exclude and breaker.available), key=key)
+
+    def choose(self, exclude: Optional[str] = None) -> Optional[str]:
+        """Самая быстрая модель, которая сейчас принимает запросы; None — все отключены предохранителями"""
+        for name in self.ranked(exclude):
+            if self.breakers[name].allow():
+                return name
+        return None
+
+    def allow(self, name: str) -> bool:
+        """Пропускает ли предохранитель запрос к выбранной пользователем модели"""
+        return self.breakers[name].allow()
+
+    def alternative(self, name: str) -> Optional[str]:
+        """Исправная модель, на которую можно переключиться с name (не занимает пробный запрос)"""
+        ranked = self.ranked(exclude=name)
+        return ranked[0] if ranked else None
+
+    def retry_after(self) -> float:
+        """Через сколько секунд хотя бы одна модель снова примет запрос"""
+        return min((breaker.retry_after for breaker in self.breakers.values()), default=0.0)
+
+
+class HedgeBudget:
+    """Общий бюджет дублирующих запросов: каждый запрос добавляет ratio жетона, дубль тратит один"""
+
+    def __init__(self, ratio: float = 0.1, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.requests = 0
+        self.hedged = 0
+        self.denied = 0
+
+    def on_request(self) -> None:
+        self.requests += 1
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            self.hedged += 1
+            return True
+        self.denied += 1
+        return False
+
+
+class HedgedCall:
+    """Основной вызов и дубль во вторую модель после задержки; побеждает тот, кто первым заявит ответ
+
+    Попытка — корутина, которой передаётся этот объект: при потоковом ответе она вызывает claim()
+    на первом фрагменте, без потока победителем становится первая завершившаяся с непустым ответом.
+    Непустой ли ответ, решает succeeded (по умолчанию — истинность результата попытки).
+    Проигравшая попытка отменяется сразу после claim().
+    """
+
+    def __init__(self, delay: float, allow_hedge: Callable[[], bool], succeeded: Callable[[Any], bool] = bool):
+        self.delay = delay
+        self.allow_hedge = allow_hedge
+        self.succeeded = succeeded
+        self.winner: Optional[str] = None
+        self.hedged = False
+        self._tasks: Dict[asyncio.Task, str] = {}
+
+    def claim(self, name: str) -> bool:
+        """Попытка name хочет показать ответ; True — она победила (остальные отменяются)"""
+        if self.winner is None:
+            self.winner = name
+            for task, task_name in self._tasks.items():
+                if task_name != name:
+                    task.cancel()
+        return self.winner == name
+
+    async def run(self, primary: Tuple[str, Callable[["HedgedCall"], Awaitable[Any]]],
+                  secondary: Tuple[str, Callable[["HedgedCall"], Awaitable[Any]]]) -> Tuple[str, Any]:
+        """Возвращает (имя победившей попытки, её результат); если обе неудачны — ошибку основной"""
+        primary_task = asyncio.create_task(primary[1](self))
+        self._tasks[primary_task] = primary[0]
+        try:
+            await asyncio.wait({primary_task}, timeout=self.delay)
+            primary_ok = primary_task.done() and not primary_task.cancelled() \
+                and primary_task.exception() is None and self.succeeded(primary_task.result())
+            # Основная модель не ответила за отведённое время (или уже упала) — дублируем запрос
+            if self.winner is None and not primary_ok and self.allow_hedge():
+                self.hedged = True
+                self._tasks[asyncio.create_task(secondary[1](self))] = secondary[0]
+
+            errors: List[BaseException] = []
+            empty: Optional[Tuple[str, Any]] = None
+            pending = set(self._tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda task: task is not primary_task):
+                    name = self._tasks[task]
+                    if task.cancelled():
+                        continue
+                    if task.exception() is not None:
+                        if self.winner == name:
+                            raise task.exception()
+                        errors.append(task.exception())
+                        continue
+                    if self.succeeded(task.result()) and self.claim(name):
+                        return name, task.result()
+                    if empty is None or task is primary_task:
+                        empty = (name, task.result())
+            if errors and empty is None:
+                raise errors[0]
+            return empty if empty is not None else (primary[0], None)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -3,14 +3,22 @@
 """
 RSS новостной парсер - простой и надёжный
 Берёт свежие новости из РИА, ТАСС и других RSS-лент
+Ленты обновляются в фоне, ответы бота читают готовый снимок из памяти
+Неизменившаяся лента стоит одного ответа 304 (ETag / Last-Modified), изменившаяся читается потоком
+и разбирается по мере загрузки: как только набрано нужное число новостей, загрузка прекращается
 """
 
+import asyncio
 import logging
+import os
+import re
+from collections import deque
 from datetime import datetime
-from typing import List, Dict
-import requests
+from typing import Deque, List, Dict, Optional
 from xml.etree import ElementTree as ET
 
+from http_client import get_http_client
+
 logger = logging.getLogger(__name__)
 
 RSS_FEEDS = {
@@ -18,69 +26,288 @@ RSS_FEEDS = {
     'tass': 'https://tass.ru/rss/v2.xml',
     'interfax': 'https://www.interfax.ru/rss.asp',
 }
+# Переопределение адресов лент: "ria=http://...,tass=http://..." (например, для нагрузочного теста)
+RSS_FEEDS.update(
+    item.strip().split('=', 1) for item in os.getenv("RSS_FEED_URLS", "").split(',') if '=' in item
+)
+
+# Интервалы фонового обновления лент (в секундах)
+RSS_REFRESH_INTERVALS = {
+    'ria': 120,
+    'tass': 120,
+    'interfax': 180,
+}
+DEFAULT_REFRESH_INTERVAL = 120
+
+# Сколько последних новостей каждой ленты держим в памяти
+RSS_BUFFER_SIZE = 20
+
+# По сколько байт подаём ленту разборщику: разбор останавливается на границе части после max_items новостей
+FEED_CHUNK_SIZE = 16 * 1024
+
+# HTML-теги в описаниях новостей
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def parse_item(item: ET.Element, source_name: str) -> Dict[str, str]:
+    """Превращает элемент <item> в новость"""
+    title = item.findtext('title') or "Без заголовка"
+    link = item.findtext('link') or ""
+    desc = item.findtext('description') or ""
+    pub_date = item.findtext('pubDate') or ""
+
+    # Убираем HTML теги из описания
+    if desc:
+        desc = _HTML_TAG_RE.sub('', desc).strip()
+
+    return {
+        'title': title,
+        'description': desc[:300],  # Ограничиваем длину
+        'link': link,
+        'source': source_name.upper(),
+        'date': pub_date
+    }
+
+
+class FeedParser:
+    """Инкрементальный разбор RSS 2.0: лента подаётся по частям, разбор заканчивается после max_items новостей"""
+
+    def __init__(self, source_name: str, max_items: int = 5):
+        self.source_name = source_name
+        self.max_items = max_items
+        self.items: List[Dict[str, str]] = []
+        self._parser = ET.XMLPullParser(events=('end',))
+
+    @property
+    def done(self) -> bool:
+        return len(self.items) >= self.max_items
+
+    def feed(self, data: bytes) -> bool:
+        """Разбирает очередную часть ленты; True — нужное число новостей уже набрано"""
+        if self.done:
+            return True
+        self._parser.feed(data)
+        for _, element in self._parser.read_events():
+            if element.tag != 'item':
+                continue
+            self.items.append(parse_item(element, self.source_name))
+            # Разобранная новость больше не нужна в дереве
+            element.clear()
+            if self.done:
+                break
+        return self.done
+
+    def close(self) -> List[Dict[str, str]]:
+        """Завершает разбор; для ленты, прочитанной до конца, проверяет, что XML корректен"""
+        if not self.done:
+            self._parser.close()
+            for _, element in self._parser.read_events():
+                if element.tag == 'item' and not self.done:
+                    self.items.append(parse_item(element, self.source_name))
+        return self.items
+
+
+def parse_feed(content: bytes, source_name: str, max_items: int = 5) -> List[Dict[str, str]]:
+    """Разбирает RSS 2.0 и возвращает первые max_items новостей"""
+    parser = FeedParser(source_name, max_items)
+    view = memoryview(content)
+    for start in range(0, len(content), FEED_CHUNK_SIZE):
+        if parser.feed(view[start:start + FEED_CHUNK_SIZE]):
+            break
+    return parser.close()
+
+
+class FeedState:
+    """Валидаторы условного запроса и счётчики одной ленты"""
+
+    def __init__(self):
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        # Счётчики
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_received = 0
+
+    def headers(self) -> Dict[str, str]:
+        """Заголовки условного запроса по ответу на предыдущий"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+async def fetch_feed(source_name: str, feed_url: str, max_items: int = 5,
+                     state: Optional[FeedState] = None) -> List[Dict[str, str]]:
+    """Получает новости из одной RSS-ленты; с state запрос условный, для неизменившейся ленты — пустой список"""
+    news = []
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    if state:
+        headers.update(state.headers())
+        state.requests += 1
+    try:
+        logger.info(f"Запрос RSS от {source_name}: {feed_url}")
+        async with get_http_client().stream(feed_url, headers=headers) as response:
+            try:
+                if response.status_code == 304:
+                    logger.info(f"{source_name}: лента не изменилась")
+                    if state:
+                        state.not_modified += 1
+                    return news
+
+                if response.status_code != 200:
+                    logger.warning(f"{source_name} вернул {response.status_code}")
+                    return news
+
+                parser = FeedParser(source_name, max_items)
+                async for chunk in response.aiter_bytes(FEED_CHUNK_SIZE):
+                    if parser.feed(chunk):
+                        # Нужные новости в начале ленты уже разобраны — остаток не скачиваем
+                        break
+                news = parser.close()
+            finally:
+                if state:
+                    state.bytes_received += response.num_bytes_downloaded
+
+        # Валидаторы запоминаем только после успешного разбора, иначе следующий запрос получил бы 304
+        if state:
+            state.etag = response.headers.get('ETag')
+            state.last_modified = response.headers.get('Last-Modified')
+        logger.info(f"Получено {len(news)} новостей от {source_name}, {response.num_bytes_downloaded} байт")
 
-def fetch_rss_news(max_items: int = 5) -> List[Dict[str, str]]:
+    except Exception as e:
+        logger.error(f"Ошибка при получении RSS от {source_name}: {e}")
+
+    return news
+
+
+async def fetch_rss_news(max_items: int = 5) -> List[Dict[str, str]]:
     """Получает новости из RSS-лент"""
     all_news = []
-    
+
     for source_name, feed_url in RSS_FEEDS.items():
-        try:
-            logger.info(f"Запрос RSS от {source_name}: {feed_url}")
-            response = requests.get(feed_url, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
-            
-            if response.status_code != 200:
-                logger.warning(f"{source_name} вернул {response.status_code}")
-                continue
-            
-            # Парсим XML
-            root = ET.fromstring(response.content)
-            
-            # RSS 2.0 формат
-            items = root.findall('.//item')[:max_items]
-            
-            for item in items:
-                title_el = item.find('title')
-                link_el = item.find('link')
-                desc_el = item.find('description')
-                date_el = item.find('pubDate')
-                
-                title = title_el.text if title_el is not None and title_el.text else "Без заголовка"
-                link = link_el.text if link_el is not None and link_el.text else ""
-                desc = desc_el.text if desc_el is not None and desc_el.text else ""
-                pub_date = date_el.text if date_el is not None and date_el.text else ""
-                
-                # Убираем HTML теги из описания
-                if desc:
-                    import re
-                    desc = re.sub(r'<[^>]+>', '', desc).strip()
-                
-                all_news.append({
-                    'title': title,
-                    'description': desc[:300],  # Ограничиваем длину
-                    'link': link,
-                    'source': source_name.upper(),
-                    'date': pub_date
-                })
-                
-            logger.info(f"Получено {len(items)} новостей от {source_name}")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при получении RSS от {source_name}: {e}")
-            continue
-    
+        all_news.extend(await fetch_feed(source_name, feed_url, max_items))
+
     return all_news[:max_items * 2]  # Возвращаем топ новостей
 
 
+class RssPoller:
+    """Фоновое обновление RSS-лент со снимком последних новостей в памяти"""
+
+    def __init__(self, feeds: Optional[Dict[str, str]] = None, intervals: Optional[Dict[str, float]] = None,
+                 buffer_size: int = RSS_BUFFER_SIZE):
+        self.feeds = dict(feeds or RSS_FEEDS)
+        self.intervals = dict(intervals or RSS_REFRESH_INTERVALS)
+        self.buffer_size = buffer_size
+        # Кольцевой буфер на каждую ленту: новые новости слева, старые вытесняются справа
+        self._buffers: Dict[str, Deque[Dict[str, str]]] = {
+            name: deque(maxlen=buffer_size) for name in self.feeds
+        }
+        # Валидаторы условных запросов и счётчики трафика по лентам
+        self.states: Dict[str, FeedState] = {name: FeedState() for name in self.feeds}
+        self._tasks: List[asyncio.Task] = []
+        self.last_refresh: Dict[str, datetime] = {}
+        # Увеличивается при каждом изменении снимка
+        self.version = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self) -> None:
+        """Запускает фоновые задачи обновления (по одной на ленту)"""
+        if self.running:
+            return
+        self._tasks = [
+            asyncio.create_task(self._poll_feed(name, url), name=f"rss-poller-{name}")
+            for name, url in self.feeds.items()
+        ]
+        logger.info(f"RSS поллер запущен для {len(self._tasks)} лент")
+
+    async def stop(self) -> None:
+        """Останавливает фоновые задачи"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("RSS поллер остановлен")
+
+    async def refresh(self, source_name: str) -> int:
+        """Обновляет одну ленту, возвращает число новых новостей"""
+        items = await fetch_feed(source_name, self.feeds[source_name], self.buffer_size, self.states[source_name])
+        added = self._merge(source_name, items)
+        self.last_refresh[source_name] = datetime.now()
+        return added
+
+    async def refresh_all(self) -> None:
+        """Однократно обновляет все ленты параллельно"""
+        await asyncio.gather(*(self.refresh(name) for name in self.feeds))
+
+    async def _poll_feed(self, source_name: str, feed_url: str) -> None:
+        interval = self.intervals.get(source_name, DEFAULT_REFRESH_INTERVAL)
+        while True:
+            try:
+                added = await self.refresh(source_name)
+                if added:
+                    logger.info(f"RSS {source_name}: {added} новых новостей в снимке")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка фонового обновления RSS {source_name}: {e}")
+            await asyncio.sleep(interval)
+
+    def _merge(self, source_name: str, items: List[Dict[str, str]]) -> int:
+        buffer = self._buffers[source_name]
+        known_links = {item['link'] for item in buffer if item['link']}
+        fresh = [item for item in items if not item['link'] or item['link'] not in known_links]
+        # Лента отдаёт новости от новых к старым — добавляем с конца, чтобы сохранить порядок
+        for item in reversed(fresh):
+            buffer.appendleft(item)
+        if fresh:
+            self.version += 1
+        return len(fresh)
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики запросов к лентам для мониторинга"""
+        return {
+            'requests': sum(state.requests for state in self.states.values()),
+            'not_modified': sum(state.not_modified for state in self.states.values()),
+            'bytes_received': sum(state.bytes_received for state in self.states.values()),
+        }
+
+    def snapshot(self, max_items: int = 5) -> List[Dict[str, str]]:
+        """Возвращает последние новости из памяти без обращения к сети"""
+        news = []
+        for buffer in self._buffers.values():
+            for idx, item in enumerate(buffer):
+                if idx >= max_items:
+                    break
+                news.append(item)
+        return news[:max_items * 2]
+
+
+_rss_poller: Optional[RssPoller] = None
+
+
+def get_rss_poller() -> RssPoller:
+    """Возвращает общий RSS поллер"""
+    global _rss_poller
+    if _rss_poller is None:
+        _rss_poller = RssPoller()
+    return _rss_poller
+
+
 def get_news_context(query: str = "", max_items: int = 5) -> str:
     """Формирует текстовый контекст из новостей"""
-    news = fetch_rss_news(max_items)
-    
+    news = get_rss_poller().snapshot(max_items)
+
     if not news:
         logger.warning("RSS ленты не вернули новостей")
         return ""
-    
+
     context_lines = [f"\n📰 СВЕЖИЕ НОВОСТИ ({datetime.now().strftime('%d.%m.%Y %H:%M')}):\n"]
-    
+
     for idx, item in enumerate(news, 1):
         context_lines.append(f"\n{idx}. **{item['title']}**")
         context_lines.append(f"   Источник: {item['source']}")
@@ -90,9 +317,9 @@ def get_news_context(query: str = "", max_items: int = 5) -> str:
             context_lines.append(f"   {item['description']}")
         if item['link']:
             context_lines.append(f"   🔗 {item['link']}")
-    
+
     context_lines.append(f"\n⚠️ Актуальные новости на {datetime.now().strftime('%d.%m.%Y %H:%M')}")
-    
+
     result = "\n".join(context_lines)
     logger.info(f"Сформирован контекст из {len(news)} новостей, {len(result)} символов")
     return result
@@ -100,6 +327,6 @@ def get_news_context(query: str = "", max_items: int = 5) -> str:
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
+    asyncio.run(get_rss_poller().refresh_all())
     context = get_news_context(max_items=3)
     print(context or "Новости не найдены")
-
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Потоковый вывод ответов AI в Telegram
+Частичный текст попадает в сообщение-заглушку не чаще, чем позволяют лимиты Telegram
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста сообщения в Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Минимальный интервал между правками сообщений в одном чате (секунды)
+DEFAULT_EDIT_INTERVAL = 1.0
+# Минимальный прирост текста, ради которого стоит править сообщение
+DEFAULT_MIN_DELTA = 20
+# Сколько чатов помним для соблюдения интервала между правками
+MAX_TRACKED_CHATS = 10000
+
+
+class StreamingEditor:
+    """Объединяет частичные ответы и правит сообщение-заглушку с ограничением частоты"""
+
+    # Время последней правки по каждому чату — общее для всех потоков в чате
+    _last_edit_by_chat: Dict[int, float] = {}
+
+    def __init__(self, message, prefix: str = "", min_interval: float = DEFAULT_EDIT_INTERVAL,
+                 min_delta: int = DEFAULT_MIN_DELTA):
+        self.message = message
+        self.prefix = prefix
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self.chat_id = message.chat_id
+        self.edits = 0
+        self.first_edit_at: Optional[float] = None
+        self._started = time.monotonic()
+        self._text = ""
+        self._shown = ""
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def time_to_first_edit(self) -> Optional[float]:
+        """Время от начала генерации до первого показанного фрагмента"""
+        if self.first_edit_at is None:
+            return None
+        return self.first_edit_at - self._started
+
+    def push(self, text: str) -> None:
+        """Передаёт накопленный текст ответа; правка будет выполнена позже"""
+        self._text = text
+        self._changed.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def cancel(self) -> None:
+        """Останавливает потоковые правки (например, при ошибке генерации)"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def finish(self, final_text: str, **kwargs) -> None:
+        """Останавливает потоковые правки и показывает окончательный ответ"""
+        await self.cancel()
+        await self._wait_for_slot()
+        try:
+            await self.message.edit_text(final_text, **kwargs)
+        except RetryAfter as e:
+            await asyncio.sleep(float(e.retry_after))
+            await self.message.edit_text(final_text, **kwargs)
+        self._mark_edit()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            if len(self._text) - len(self._shown) < self.min_delta and self._shown:
+                continue
+            await self._wait_for_slot()
+            text = self._text
+            await self._edit(text)
+
+    async def _wait_for_slot(self) -> None:
+        last_edit = self._last_edit_by_chat.get(self.chat_id)
+        if last_edit is not None:
+            delay = self.min_interval - (time.monotonic() - last_edit)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def _mark_edit(self) -> None:
+        now = time.monotonic()
+        if len(self._last_edit_by_chat) > MAX_TRACKED_CHATS:
+            # Забываем чаты, в которых давно не было правок
+            stale = [chat_id for chat_id, ts in self._last_edit_by_chat.items() if now - ts > self.min_interval]
+            for chat_id in stale:
+                del self._last_edit_by_chat[chat_id]
+        self._last_edit_by_chat[self.chat_id] = now
+        self.edits += 1
+        if self.first_edit_at is None:
+            self.first_edit_at = now
+
+    async def _edit(self, text: str) -> None:
+        # Частичный Markdown может быть невалидным, поэтому промежуточные правки — простым текстом
+        body = (self.prefix + text + " ▌")[:TELEGRAM_MESSAGE_LIMIT]
+        try:
+            with tracer.span("telegram.stream_edit", chars=len(body)):
+                await self.message.edit_text(body)
+            self._shown = text
+            self._mark_edit()
+        except RetryAfter as e:
+            logger.warning(f"Telegram ограничил правки в чате {self.chat_id}, пауза {e.retry_after} с")
+            self._last_edit_by_chat[self.chat_id] = time.monotonic() + float(e.retry_after)
+            self._changed.set()
+        except BadRequest as e:
+            # "Message is not modified" и подобные ошибки не критичны для потока
+            logger.debug(f"Пропущена потоковая правка: {e}")
+        except TelegramError as e:
+            logger.warning(f"Ошибка потоковой правки сообщения: {e}")
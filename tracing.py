@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Лёгкая трассировка обработки сообщений
+Каждое сообщение — трасса из вложенных спанов (источники контекста, вызов модели, запросы к Telegram);
+последние трассы хранятся в кольцевом буфере и выгружаются в JSON или в OTLP-коллектор
+"""
+
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Не больше стольких спанов в одной трассе (например, при длинном потоковом ответе)
+MAX_SPANS_PER_TRACE = 200
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """Интервал работы внутри трассы"""
+
+    __slots__ = ('span_id', 'parent_id', 'trace', 'name', 'attributes', 'start', 'end', 'error')
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'offset_ms': round((self.start - self.trace.root.start) * 1000, 1),
+            'duration_ms': round(self.duration * 1000, 1),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class Trace:
+    """Все спаны обработки одного сообщения"""
+
+    __slots__ = ('trace_id', 'started_at', 'root', 'spans', 'dropped_spans')
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = os.urandom(16).hex()
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        self.root = Span(self, name, None, attributes)
+        self.spans.append(self.root)
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.root.name,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 1),
+            'attributes': self.root.attributes,
+            'error': self.root.error,
+            'dropped_spans': self.dropped_spans,
+            'spans': [span.to_dict() for span in self.spans],
+        }
+
+
+class Tracer:
+    """Создаёт трассы и спаны; завершённые трассы хранит в кольцевом буфере"""
+
+    def __init__(self, capacity: int = 500, exporter: Optional["OtlpExporter"] = None):
+        self.traces: Deque[Trace] = deque(maxlen=capacity)
+        self.exporter = exporter
+
+    def configure(self, capacity: int, exporter: Optional["OtlpExporter"] = None) -> None:
+        """Меняет размер буфера и подключает экспорт в OTLP-коллектор"""
+        self.traces = deque(self.traces, maxlen=capacity)
+        self.exporter = exporter
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Начинает новую трассу; вложенные span() попадают в неё"""
+        trace = Trace(name, attributes)
+        token = _current_span.set(trace.root)
+        try:
+            yield trace.root
+        except BaseException as e:
+            trace.root.error = repr(e)
+            raise
+        finally:
+            trace.root.end = time.perf_counter()
+            _current_span.reset(token)
+            self.traces.append(trace)
+            if self.exporter:
+                self.exporter.add(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Спан внутри текущей трассы; вне трассы ничего не записывает"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        trace = parent.trace
+        if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+            trace.dropped_spans += 1
+            yield None
+            return
+        span = Span(trace, name, parent, attributes)
+        trace.spans.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current_span.reset(token)
+
+    def record(self, name: str, start: float, end: Optional[float] = None, **attributes) -> None:
+        """Добавляет уже завершившийся интервал (время по time.perf_counter) как спан текущей трассы"""
+        parent = _current_span.get()
+        if parent is None:
+            return
+        trace = parent.trace
+        if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+            trace.dropped_spans += 1
+            return
+        span = Span(trace, name, parent, attributes)
+        span.start = start
+        span.end = end if end is not None else time.perf_counter()
+        trace.spans.append(span)
+
+    @staticmethod
+    def set_attribute(key: str, value: Any) -> None:
+        """Добавляет атрибут корневому спану текущей трассы"""
+        span = _current_span.get()
+        if span is not None:
+            span.trace.root.set_attribute(key, value)
+
+    def slowest(self, count: int = 5) -> List[Trace]:
+        """Самые долгие трассы из буфера"""
+        return sorted(self.traces, key=lambda trace: trace.duration, reverse=True)[:count]
+
+    def export_json(self) -> str:
+        """Все трассы из буфера в JSON"""
+        return json.dumps([trace.to_dict() for trace in self.traces], ensure_ascii=False, indent=2)
+
+
+def format_trace(trace: Trace) -> str:
+    """Текстовая разбивка трассы по спанам для сообщения в Telegram"""
+    started = time.strftime('%H:%M:%S', time.localtime(trace.started_at))
+    attributes = ", ".join(f"{key}={value}" for key, value in trace.root.attributes.items())
+    lines = [f"⏱ {trace.duration:.2f} с — {started} {attributes}".rstrip()]
+    if trace.root.error:
+        lines.append(f"  ❌ {trace.root.error}")
+
+    children: Dict[Optional[int], List[Span]] = {}
+    for span in trace.spans[1:]:
+        children.setdefault(span.parent_id, []).append(span)
+
+    def walk(parent_id: int, depth: int) -> None:
+        for span in sorted(children.get(parent_id, ()), key=lambda s: s.start):
+            offset = span.start - trace.root.start
+            mark = " ❌" if span.error else ""
+            lines.append(f"{'  ' * depth}• {span.name}: {span.duration:.2f} с (+{offset:.2f}){mark}")
+            walk(span.span_id, depth + 1)
+
+    walk(trace.root.span_id, 1)
+    if trace.dropped_spans:
+        lines.append(f"  … ещё {trace.dropped_spans} спанов не записано")
+    return "\n".join(lines)
+
+
+class OtlpExporter:
+    """Отправляет завершённые трассы пачками в OTLP/HTTP коллектор (JSON, /v1/traces)"""
+
+    def __init__(self, endpoint: str, service_name: str = "unified-telegram-bot", interval: float = 5.0,
+                 max_batch: int = 100, max_queue: int = 2000):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.interval = interval
+        self.max_batch = max_batch
+        self._queue: Deque[Trace] = deque(maxlen=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self.exported = 0
+        self.failed = 0
+
+    def add(self, trace: Trace) -> None:
+        self._queue.append(trace)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            # Дописываем то, что успело накопиться
+            await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        from http_client import get_http_client
+
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            try:
+                response = await get_http_client().post(self.endpoint, json=self.to_otlp(batch))
+                response.raise_for_status()
+                self.exported += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.warning(f"Не удалось отправить {len(batch)} трасс в OTLP-коллектор: {e}")
+                return
+
+    def to_otlp(self, traces: List[Trace]) -> Dict[str, Any]:
+        """Трассы в формате OTLP JSON (ExportTraceServiceRequest)"""
+        spans = []
+        for trace in traces:
+            # perf_counter не привязан к календарю, поэтому время считаем от начала трассы
+            base_ns = int(trace.started_at * 1e9)
+            for span in trace.spans:
+                end = span.end if span.end is not None else span.start
+                spans.append({
+                    'traceId': trace.trace_id,
+                    'spanId': f"{span.span_id:016x}",
+                    'parentSpanId': f"{span.parent_id:016x}" if span.parent_id else "",
+                    'name': span.name,
+                    'kind': 1,
+                    'startTimeUnixNano': str(base_ns + int((span.start - trace.root.start) * 1e9)),
+                    'endTimeUnixNano': str(base_ns + int((end - trace.root.start) * 1e9)),
+                    'attributes': [
+                        {'key': key, 'value': {'stringValue': str(value)}} for key, value in span.attributes.items()
+                    ],
+                    'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+                })
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+                'scopeSpans': [{'scope': {'name': 'unified_bot'}, 'spans': spans}],
+            }]
+        }
+
+
+# Общий трассировщик бота
+tracer = Tracer()
@@ -9,249 +9,109 @@ import os
 import time
 import logging
 import asyncio
+import io
 import json
+import re
+import importlib.util
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-try:
-    from yandex_cloud_ml_sdk import YCloudML
-    YANDEX_AVAILABLE = True
-except ImportError:
-    YCloudML = None
-    YANDEX_AVAILABLE = False
+# SDK Yandex GPT импортируется при первом запросе к модели: здесь только проверяем, что он установлен
+YANDEX_AVAILABLE = importlib.util.find_spec("yandex_cloud_ml_sdk") is not None
+if not YANDEX_AVAILABLE:
     print("⚠️ Yandex Cloud ML SDK не установлен. Yandex GPT будет недоступен.")
 
-# Импортируем модуль для работы с GigaChat
-from gigachat import GigaChat
-
-# Импорты для SSL сертификатов
-import ssl
-import certifi
-import urllib3
-
-# Отключаем предупреждения SSL
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-# Импорт для веб-поиска
-try:
-    from duckduckgo_search import DDGS
-    SEARCH_AVAILABLE = True
-except ImportError:
-    SEARCH_AVAILABLE = False
-    print("⚠️ DuckDuckGo Search не установлен. Функция поиска будет недоступна.")
-
-# Импорт мультипоиска
-try:
-    from multi_search import search_web_multi
-    MULTI_SEARCH_AVAILABLE = True
-    print("✅ Мультипоиск доступен")
-except ImportError:
-    MULTI_SEARCH_AVAILABLE = False
-    print("⚠️ Мультипоиск недоступен")
+# Провайдеры моделей: gigachat тоже импортируется лениво, при создании клиента
+from llm_providers import LLMProvider, GigaChatProvider, YandexGPTProvider, pooled_gigachat_class
+from prompts import is_refusal, render_response
+from streaming import TELEGRAM_MESSAGE_LIMIT, StreamingEditor
+from caches import SingleFlight, TTLCache, SqliteCache
+from intents import detect_intents, normalize_city_name, normalize_location, normalize_question
+from concurrency import ChatOrderedUpdateProcessor, FairLimiter, QueueFullError
+from metrics import Counter, EventLoopLagMonitor, Gauge, Histogram, MetricsServer
+from tracing import OtlpExporter, format_trace, tracer
+from routing import CLOSED, FAILOVER_POLICIES, HALF_OPEN, HedgeBudget, HedgedCall, LatencyRouter
+from logging_setup import DATE_FORMAT, LOG_FORMAT, JsonFormatter, build_file_handler, parse_sampling, setup_queue_logging
 
 # Импорт RSS новостей
 try:
-    from rss_news import get_news_context as rss_news_context
+    from rss_news import get_news_context as rss_news_context, get_rss_poller
     RSS_NEWS_AVAILABLE = True
     print("✅ RSS новости доступны (РИА, ТАСС, Интерфакс)")
 except ImportError:
     rss_news_context = None
+    get_rss_poller = None
     RSS_NEWS_AVAILABLE = False
     print("⚠️ RSS новости недоступны")
 
-# Импорт для запросов к API
-import requests
+# Общий асинхронный HTTP-клиент для запросов к API
+import httpx
+from http_client import get_http_client, close_http_client, TokenBucket
 
-def search_web(query: str, max_results: int = 3) -> str:
+async def fetch_weather(city: str, api_key: str) -> str:
     """
-    Поиск актуальной информации в интернете через DuckDuckGo
-    Использует как обычный поиск, так и новостной для максимальной актуальности
+    Запрашивает погоду в OpenWeatherMap (без кэша)
     
     Args:
-        query: поисковый запрос
-        max_results: максимальное количество результатов
+        city: Нормализованное название города
+        api_key: API ключ OpenWeatherMap
     
     Returns:
-        Строка с найденной информацией или пустая строка
-    """
-    if not SEARCH_AVAILABLE:
-        return ""
+        Строка с информацией о погоде или сообщение о ненайденном городе
     
-    context = ""
-    
-    # Улучшаем запрос для более релевантных результатов
-    improved_query = query
-    query_lower = query.lower()
+    Raises:
+        httpx.TimeoutException, RuntimeError: при временных ошибках сервиса (не кэшируются)
+    """
+    # Используем бесплатный API OpenWeatherMap
+    base_url = OPENWEATHER_API_URL
+    params = {
+        'q': city,
+        'appid': api_key,
+        'units': 'metric',  # Цельсий
+        'lang': 'ru'  # Русский язык
+    }
     
-    # Если запрос про новости/события - добавляем ключевые слова
-    if any(word in query_lower for word in ['новост', 'сейчас', 'что там', 'события', 'актуальн']):
-        improved_query = f"{query} новости 2025"
-    # Если про политиков/людей - уточняем запрос
-    elif any(name in query_lower for name in ['макрон', 'трамп', 'путин', 'байден', 'президент', 'министр']):
-        improved_query = f"{query} последние новости"
+    with tracer.span("openweather.request", city=city):
+        response = await get_http_client().get(base_url, params=params)
     
-    try:
-        # Пробуем новостной поиск для актуальных событий
-        with DDGS() as ddgs:
-            try:
-                news_results = list(ddgs.news(improved_query, max_results=max_results))
-                if news_results:
-                    logger.info(f"DuckDuckGo News вернул {len(news_results)} новостей")
-                    context += "\n📰 СВЕЖИЕ НОВОСТИ:\n"
-                    for i, result in enumerate(news_results, 1):
-                        title = result.get('title', 'Без названия')
-                        body = result.get('body', result.get('excerpt', ''))
-                        date = result.get('date', '')
-                        source = result.get('source', '')
-                        url = result.get('url', '')
-                        
-                        context += f"\n{i}. **{title}**"
-                        if date:
-                            context += f" ({date})"
-                        if source:
-                            context += f" - {source}"
-                        context += "\n"
-                        
-                        if body:
-                            # Берём до 400 символов из новости
-                            body_text = body[:400] + "..." if len(body) > 400 else body
-                            context += f"   {body_text}\n"
-                        
-                        if url:
-                            context += f"   🔗 {url}\n"
-                    
-                    context += "\n"
-                    logger.info(f"Новостной контекст сформирован: {len(context)} символов")
-            except Exception as news_error:
-                logger.warning(f"Новостной поиск не сработал: {news_error}")
-        
-        # Если новостей мало или нет, дополняем обычным поиском
-        if len(context) < 200:
-            with DDGS() as ddgs:
-                text_results = list(ddgs.text(query, max_results=max_results))
-                
-                if text_results:
-                    logger.info(f"DuckDuckGo Text вернул {len(text_results)} результатов")
-                    if not context:
-                        context = "\n🔍 НАЙДЕННАЯ ИНФОРМАЦИЯ:\n"
-                    else:
-                        context += "\n🔍 ДОПОЛНИТЕЛЬНО:\n"
-                    
-                    for i, result in enumerate(text_results, 1):
-                        title = result.get('title', 'Без названия')
-                        body = result.get('body', result.get('snippet', result.get('description', '')))
-                        href = result.get('href', '')
-                        
-                        context += f"\n{i}. **{title}**\n"
-                        if body:
-                            # Берём до 400 символов
-                            body_text = body[:400] + "..." if len(body) > 400 else body
-                            context += f"   {body_text}\n"
-                        if href:
-                            context += f"   🔗 {href}\n"
-                    
-                    context += "\n"
-        
-        if context:
-            logger.info(f"✅ Итоговый контекст: {len(context)} символов")
-            # Добавляем инструкцию для AI
-            context += "\n⚠️ ВАЖНО: Используй ЭТУ информацию для ответа! Она актуальная!\n"
-            return context
-        else:
-            logger.warning("Поиск не вернул никаких результатов")
-            return ""
-            
-    except Exception as e:
-        logger.error(f"Критическая ошибка поиска в DuckDuckGo: {e}", exc_info=True)
-        return ""
-
+    if response.status_code == 200:
+        data = response.json()
+        
+        # Извлекаем данные
+        temp = data['main']['temp']
+        feels_like = data['main']['feels_like']
+        humidity = data['main']['humidity']
+        pressure = data['main']['pressure']
+        description = data['weather'][0]['description']
+        wind_speed = data['wind']['speed']
+        
+        weather_info = f"""
+🌡️ **ПОГОДА В {city.upper()}:**
 
-async def get_browser_news_context(query: str, max_results: int = 3) -> str:
-    """Асинхронно получает новостной контекст через headless-браузер (запускает синхронный Playwright в отдельном потоке)."""
-    if not BROWSER_SEARCH_AVAILABLE or not browser_news_context:
-        return ""
-    try:
-        # Запускаем синхронный browser_news_context в отдельном потоке (правильный способ для Windows)
-        context = await asyncio.to_thread(browser_news_context, query, max_results)
-        if context:
-            logger.info(f"Браузерный поиск новостей вернул контекст из {len(context)} символов")
-        return context
-    except Exception as e:
-        logger.error(f"Ошибка браузерного поиска новостей: {e}", exc_info=True)
-        return ""
+🌤️ Сейчас: {description}
+🌡️ Температура: {temp}°C (ощущается как {feels_like}°C)
+💧 Влажность: {humidity}%
+🎐 Давление: {pressure} гПа
+💨 Ветер: {wind_speed} м/с
 
-def normalize_city_name(city: str) -> str:
-    """
-    Нормализует название города, убирая падежные окончания
-    
-    Args:
-        city: Название города (может быть в любом падеже)
-    
-    Returns:
-        Нормализованное название города в именительном падеже
-    """
-    # Словарь частых городов с вариантами написания
-    city_variations = {
-        'москве': 'Moscow',
-        'москвы': 'Moscow',
-        'москву': 'Moscow',
-        'москва': 'Moscow',
-        'петербурге': 'Saint Petersburg',
-        'питере': 'Saint Petersburg',
-        'питер': 'Saint Petersburg',
-        'новосибирске': 'Novosibirsk',
-        'новосибирска': 'Novosibirsk',
-        'новосибирск': 'Novosibirsk',
-        'екатеринбурге': 'Yekaterinburg',
-        'екатеринбург': 'Yekaterinburg',
-        'казани': 'Kazan',
-        'казань': 'Kazan',
-        'нижнем': 'Nizhny Novgorod',
-        'красноярске': 'Krasnoyarsk',
-        'красноярск': 'Krasnoyarsk',
-        'лондоне': 'London',
-        'лондон': 'London',
-        'париже': 'Paris',
-        'париж': 'Paris',
-        'берлине': 'Berlin',
-        'берлин': 'Berlin',
-        'нью-йорке': 'New York',
-        'вашингтоне': 'Washington',
-        'вашингтон': 'Washington',
-        'токио': 'Tokyo',
-        'пекине': 'Beijing',
-        'пекин': 'Beijing',
-    }
-    
-    city_lower = city.lower().strip()
-    
-    # Проверяем словарь
-    if city_lower in city_variations:
-        return city_variations[city_lower]
-    
-    # Для неизвестных городов пробуем убрать типичные окончания
-    # Предложный падеж: -е, -ске
-    if city_lower.endswith('ске'):
-        return city[:-2]  # новосибирск
-    elif city_lower.endswith('не'):
-        return city[:-1]  # лондон
-    elif city_lower.endswith('е') and len(city) > 3:
-        # Проверяем, не заканчивается ли на -ие (в таких случаях -е не убираем)
-        if not city_lower.endswith('ие'):
-            return city[:-1]
-    
-    # Родительный падеж: -ы, -а
-    if city_lower.endswith('ы') and len(city) > 3:
-        return city[:-1]
-    
-    # Возвращаем как есть, если не смогли нормализовать
-    return city
+📅 Данные актуальны на {datetime.now().strftime('%H:%M, %d.%m.%Y')}
+"""
+        logger.info(f"Получена погода для {city}: {temp}°C")
+        return weather_info
+    elif response.status_code == 404:
+        logger.warning(f"Город не найден: {city}")
+        return f"❌ Город '{city}' не найден. Проверьте написание."
+    else:
+        raise RuntimeError(f"Ошибка API погоды: {response.status_code}")
 
 
-def get_weather(city: str, api_key: str = None) -> str:
+async def get_weather(city: str, api_key: str = None) -> str:
     """
     Получает актуальную погоду для указанного города через OpenWeatherMap API
+    Ответы кэшируются по нормализованному названию города
     
     Args:
         city: Название города (на русском или английском)
@@ -280,59 +140,65 @@ def get_weather(city: str, api_key: str = None) -> str:
 """
     
     try:
-        # Используем бесплатный API OpenWeatherMap
-        base_url = "http://api.openweathermap.org/data/2.5/weather"
-        params = {
-            'q': city,
-            'appid': api_key,
-            'units': 'metric',  # Цельсий
-            'lang': 'ru'  # Русский язык
-        }
-        
-        response = requests.get(base_url, params=params, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Извлекаем данные
-            temp = data['main']['temp']
-            feels_like = data['main']['feels_like']
-            humidity = data['main']['humidity']
-            pressure = data['main']['pressure']
-            description = data['weather'][0]['description']
-            wind_speed = data['wind']['speed']
-            
-            weather_info = f"""
-🌡️ **ПОГОДА В {city.upper()}:**
-
-🌤️ Сейчас: {description}
-🌡️ Температура: {temp}°C (ощущается как {feels_like}°C)
-💧 Влажность: {humidity}%
-🎐 Давление: {pressure} гПа
-💨 Ветер: {wind_speed} м/с
-
-📅 Данные актуальны на {datetime.now().strftime('%H:%M, %d.%m.%Y')}
-"""
-            logger.info(f"Получена погода для {city}: {temp}°C")
-            return weather_info
-        elif response.status_code == 404:
-            logger.warning(f"Город не найден: {city}")
-            return f"❌ Город '{city}' не найден. Проверьте написание."
-        else:
-            logger.error(f"Ошибка API погоды: {response.status_code}")
-            return ""
-            
-    except requests.Timeout:
+        # Одновременные запросы одного города ждут один ответ OpenWeatherMap
+        return await weather_cache.get_or_load(city.lower(), lambda: fetch_weather(city, api_key))
+    except httpx.TimeoutException:
         logger.error("Timeout при запросе погоды")
         return "⏱️ Превышено время ожидания ответа от сервиса погоды"
     except Exception as e:
         logger.error(f"Ошибка получения погоды: {e}", exc_info=True)
         return ""
 
-def get_maps_info(location: str) -> str:
+async def geocode(location: str):
+    """
+    Запрашивает координаты в Nominatim (без кэша, с глобальным ограничением частоты)
+    
+    Args:
+        location: Название места для поиска
+    
+    Returns:
+        Словарь с lat, lon и display_name или None, если место не найдено
+    
+    Raises:
+        asyncio.TimeoutError, httpx.TimeoutException, RuntimeError: при временных ошибках (не кэшируются)
+    """
+    # Политика Nominatim — не больше 1 запроса в секунду на всё приложение
+    with tracer.span("nominatim.rate_limit"):
+        await asyncio.wait_for(nominatim_limiter.acquire(), timeout=NOMINATIM_QUEUE_TIMEOUT)
+    
+    # Используем бесплатный Nominatim API
+    base_url = NOMINATIM_URL
+    params = {
+        'q': location,
+        'format': 'json',
+        'limit': 1,
+        'addressdetails': 1
+    }
+    headers = {
+        'User-Agent': 'TelegramBot/1.0'  # Обязательно для Nominatim
+    }
+    
+    with tracer.span("nominatim.request"):
+        response = await get_http_client().get(base_url, params=params, headers=headers, verify=False)
+    
+    if response.status_code != 200:
+        raise RuntimeError(f"Ошибка API карт: {response.status_code}")
+    
+    data = response.json()
+    if not data:
+        return None
+    place = data[0]
+    return {
+        'lat': place.get('lat'),
+        'lon': place.get('lon'),
+        'display_name': place.get('display_name'),
+    }
+
+
+async def get_maps_info(location: str) -> str:
     """
     Получает информацию о местоположении с картами
-    Использует бесплатный API Nominatim (OpenStreetMap)
+    Использует бесплатный API Nominatim (OpenStreetMap) через постоянный кэш геокодирования
     
     Args:
         location: Название места для поиска
@@ -341,38 +207,24 @@ def get_maps_info(location: str) -> str:
         Строка с информацией о местоположении
     """
     try:
-        # Отключаем предупреждения SSL для этого запроса
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        # Используем бесплатный Nominatim API
-        base_url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': location,
-            'format': 'json',
-            'limit': 1,
-            'addressdetails': 1
-        }
-        headers = {
-            'User-Agent': 'TelegramBot/1.0'  # Обязательно для Nominatim
-        }
-        
-        response = requests.get(base_url, params=params, headers=headers, timeout=5, verify=False)
+        place = await geocode_cache.get_or_load(
+            normalize_location(location),
+            lambda: geocode(location),
+            # Ненайденные места кэшируем на меньший срок
+            ttl_for=lambda result: GEOCODE_CACHE_TTL if result else GEOCODE_NEGATIVE_TTL,
+        )
         
-        if response.status_code == 200:
-            data = response.json()
+        if place:
+            lat = place['lat']
+            lon = place['lon']
+            display_name = place['display_name']
             
-            if data:
-                place = data[0]
-                lat = place.get('lat')
-                lon = place.get('lon')
-                display_name = place.get('display_name')
-                
-                # Формируем ссылки на карты
-                osm_link = f"https://www.openstreetmap.org/?mlat={lat}&mlon={lon}&zoom=15"
-                google_maps_link = f"https://www.google.com/maps?q={lat},{lon}"
-                yandex_maps_link = f"https://yandex.ru/maps/?ll={lon}%2C{lat}&z=15&l=map"
-                
-                maps_info = f"""
+            # Формируем ссылки на карты
+            osm_link = f"https://www.openstreetmap.org/?mlat={lat}&mlon={lon}&zoom=15"
+            google_maps_link = f"https://www.google.com/maps?q={lat},{lon}"
+            yandex_maps_link = f"https://yandex.ru/maps/?ll={lon}%2C{lat}&z=15&l=map"
+            
+            maps_info = f"""
 🗺️ **ИНФОРМАЦИЯ О МЕСТОПОЛОЖЕНИИ:**
 
 📍 {display_name}
@@ -386,16 +238,16 @@ def get_maps_info(location: str) -> str:
 
 📅 Данные актуальны на {datetime.now().strftime('%H:%M, %d.%m.%Y')}
 """
-                logger.info(f"Найдено местоположение: {display_name}")
-                return maps_info
-            else:
-                logger.warning(f"Nominatim не нашёл местоположение: {location}. Веб-поиск будет использован вместо карт.")
-                return ""  # Возвращаем пустую строку - веб-поиск сработает
+            logger.info(f"Найдено местоположение: {display_name}")
+            return maps_info
         else:
-            logger.error(f"Ошибка API карт: {response.status_code}")
-            return ""
+            logger.warning(f"Nominatim не нашёл местоположение: {location}. Веб-поиск будет использован вместо карт.")
+            return ""  # Возвращаем пустую строку - веб-поиск сработает
             
-    except requests.Timeout:
+    except asyncio.TimeoutError:
+        logger.warning(f"Очередь запросов к Nominatim слишком длинная, пропускаем карты для: {location}")
+        return ""
+    except httpx.TimeoutException:
         logger.error("Timeout при запросе карт")
         return "⏱️ Превышено время ожидания ответа от сервиса карт"
     except Exception as e:
@@ -430,40 +282,73 @@ def setup_russian_certificates():
     logger.info(f"Сертификаты обнаружены: {main_cert}")
     return True
 
+def load_yandex_sdk():
+    """Импортирует SDK Yandex Cloud ML (занимает заметное время, поэтому только при первом запросе)"""
+    from yandex_cloud_ml_sdk import AsyncYCloudML
+    return AsyncYCloudML
+
+def create_yandex_model():
+    """Создаёт модель YandexGPT; вызывается провайдером при первом запросе"""
+    # Приоритет методов аутентификации:
+    # 1. API Key (бессрочный, строка)
+    # 2. IAM токен (временный, строка)
+    sdk = load_yandex_sdk()(
+        folder_id=YANDEX_FOLDER_ID,
+        auth=YANDEX_API_KEY or YANDEX_AUTH_TOKEN,  # Передаем ключ или IAM токен как строку
+    )
+    return sdk.models.completions("yandexgpt")
+
+def create_giga_client():
+    """Создаёт клиент GigaChat; вызывается провайдером при первом запросе"""
+    return pooled_gigachat_class()(
+        credentials=GIGACHAT_CREDENTIALS,
+        scope=GIGACHAT_SCOPE,
+        verify_ssl_certs=False,
+        max_connections=GIGACHAT_MAX_CONNECTIONS,
+    )
+
 # Загружаем переменные окружения
 load_dotenv()
 
 # Настройка расширенного логирования
+# Настройки логирования (нужны раньше остальной конфигурации)
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size").lower()  # size, time или none
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+LOG_JSON = os.getenv("LOG_JSON", "0").lower() in ("1", "true", "yes")
+# Прореживание болтливых логгеров: "логгер=N" — в лог попадает каждая N-я запись уровня INFO и ниже
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "llm_providers.poll=20")
+
 def setup_logging():
     """Настройка системы логирования"""
     # Создаем папку для логов если её нет
     if not os.path.exists('logs'):
         os.makedirs('logs')
     
-    # Формат логов с временными метками
-    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    date_format = '%Y-%m-%d %H:%M:%S'
+    text_formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+    file_formatter = JsonFormatter() if LOG_JSON else text_formatter
+    
+    # Лог в файл с ротацией
+    main_handler = build_file_handler('logs/unified_bot.log', LOG_ROTATION, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ROTATE_WHEN)
+    main_handler.setFormatter(file_formatter)
+    
+    # Отдельный лог для ошибок
+    error_handler = build_file_handler('logs/errors.log', LOG_ROTATION, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ROTATE_WHEN)
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(file_formatter)
     
-    # Настройка корневого логгера
-    logging.basicConfig(
+    # Лог в консоль
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(text_formatter)
+    
+    # Запись на диск и в консоль идёт в фоновом потоке, цикл событий только ставит записи в очередь
+    setup_queue_logging(
+        [main_handler, error_handler, console_handler],
         level=logging.INFO,
-        format=log_format,
-        datefmt=date_format,
-        handlers=[
-            # Лог в файл с ротацией по дням
-            logging.FileHandler('logs/unified_bot.log', encoding='utf-8'),
-            # Лог в консоль
-            logging.StreamHandler()
-        ]
+        sampling=parse_sampling(LOG_SAMPLING),
     )
     
-    # Создаем отдельный логгер для ошибок
-    error_logger = logging.getLogger('ErrorLogger')
-    error_logger.setLevel(logging.ERROR)
-    error_handler = logging.FileHandler('logs/errors.log', encoding='utf-8')
-    error_handler.setFormatter(logging.Formatter(log_format, date_format))
-    error_logger.addHandler(error_handler)
-    
     # Создаем логгер для бота
     logger = logging.getLogger('UnifiedBot')
     logger.setLevel(logging.INFO)
@@ -483,12 +368,160 @@ logger, user_logger, api_logger = setup_logging()
 
 # Конфигурация из переменных окружения
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN")
+# Адрес Bot API (например, локальный telegram-bot-api сервер); по умолчанию — api.telegram.org
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")
+# Режим получения обновлений: polling (long polling) или webhook (встроенный HTTP-сервер)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "10"))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный адрес, который сообщаем Telegram (обязателен для webhook)
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Обработка обновлений: разные чаты параллельно (не больше UPDATE_WORKERS обработчиков),
+# обновления одного чата — строго по порядку; MAX_PENDING_UPDATES ограничивает принятые в работу
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "32"))
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "1024"))
 YANDEX_FOLDER_ID = os.getenv("YANDEX_FOLDER_ID")
 YANDEX_AUTH_TOKEN = os.getenv("YANDEX_AUTH_TOKEN")
 YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")  # Бессрочный API ключ (приоритет)
 # Поддержка двух вариантов переменных GigaChat
 GIGACHAT_CREDENTIALS = os.getenv("GIGA_KEY") or os.getenv("GIGACHAT_CREDENTIALS")
 GIGACHAT_SCOPE = os.getenv("GIGA_SCOPE", "GIGACHAT_API_PERS")
+# Ограничения для асинхронных запросов к GigaChat
+GIGACHAT_MAX_CONCURRENCY = int(os.getenv("GIGACHAT_MAX_CONCURRENCY", "10"))
+GIGACHAT_MAX_CONNECTIONS = int(os.getenv("GIGACHAT_MAX_CONNECTIONS", "20"))
+GIGACHAT_TIMEOUT = float(os.getenv("GIGACHAT_TIMEOUT", "60"))
+# Ограничения для асинхронных запросов к Yandex GPT
+YANDEX_MAX_CONCURRENCY = int(os.getenv("YANDEX_MAX_CONCURRENCY", "10"))
+YANDEX_TIMEOUT = float(os.getenv("YANDEX_TIMEOUT", "120"))
+# Очередь запросов к моделям: общий размер, запросов на пользователя и максимальное ожидание (секунды)
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "100"))
+LLM_MAX_PER_USER = int(os.getenv("LLM_MAX_PER_USER", "2"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+# Переключение на другую модель, если выбранная отключена предохранителем:
+# ask — по согласию пользователя (кнопка), auto — автоматически, off — не переключать
+LLM_FAILOVER = os.getenv("LLM_FAILOVER", "ask").lower()
+if LLM_FAILOVER not in FAILOVER_POLICIES:
+    LLM_FAILOVER = "ask"
+# Предохранитель модели: доля ошибок за окно (секунды) при минимуме запросов и пауза до пробного запроса
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_MIN_REQUESTS = int(os.getenv("CIRCUIT_MIN_REQUESTS", "5"))
+CIRCUIT_WINDOW = float(os.getenv("CIRCUIT_WINDOW", "60"))
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", "30"))
+# Дублирование запросов пользователей без выбранной модели: если основная модель не ответила за свой p90
+# (или за HEDGE_DELAY секунд, пока нет статистики), тот же запрос уходит во вторую; используется первый ответ.
+# HEDGE_BUDGET — доля запросов, которую можно продублировать (общий бюджет на всех пользователей)
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "0").lower() in ("1", "true", "yes")
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "10"))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+# Объединение одинаковых одновременных запросов к модели (тот же вопрос и тот же контекст):
+# модель вызывается один раз, ответ получают все ожидающие чаты
+LLM_COALESCE = os.getenv("LLM_COALESCE", "1").lower() in ("1", "true", "yes")
+# Потоковый вывод ответов (частичный текст появляется по мере генерации)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1").lower() in ("1", "true", "yes")
+# Модели с потоковым выводом. Yandex GPT по умолчанию отвечает через отложенные операции:
+# потоковый run_stream обходит общий поллер с адаптивным расписанием опроса
+STREAM_PROVIDERS = {name.strip() for name in os.getenv("STREAM_PROVIDERS", "giga").split(",") if name.strip()}
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+# Кэш погоды: время жизни записи (секунды) и максимальное число городов
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "256"))
+# Кэш ответов моделей на вопросы о погоде и новостях: ключ включает отпечаток снимка погоды/RSS,
+# поэтому записи перестают находиться, как только снимок обновился. 0 — не кэшировать
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "300"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+# Адреса внешних сервисов переопределяются для нагрузочного теста с локальными заглушками
+OPENWEATHER_API_URL = os.getenv("OPENWEATHER_API_URL", "http://api.openweathermap.org/data/2.5/weather")
+
+weather_cache = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_CACHE_TTL, name="weather")
+answer_cache = TTLCache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, name="answers")
+
+# Постоянный кэш геокодирования (общий для обеих моделей) и ограничение частоты Nominatim
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "cache/geocode.sqlite3")
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL = float(os.getenv("GEOCODE_NEGATIVE_TTL", str(24 * 3600)))
+NOMINATIM_RATE = float(os.getenv("NOMINATIM_RATE", "1.0"))
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_QUEUE_TIMEOUT = float(os.getenv("NOMINATIM_QUEUE_TIMEOUT", "10"))
+
+geocode_cache = SqliteCache(GEOCODE_CACHE_PATH, maxsize=GEOCODE_CACHE_SIZE, ttl=GEOCODE_CACHE_TTL, name="geocode")
+nominatim_limiter = TokenBucket(rate=NOMINATIM_RATE)
+
+# Таймауты источников контекста (секунды): источники опрашиваются одновременно,
+# медленный источник не задерживает ответ дольше своего таймаута
+ENRICHMENT_TIMEOUTS = {
+    'weather': float(os.getenv("WEATHER_LOOKUP_TIMEOUT", "6")),
+    'maps': float(os.getenv("MAPS_LOOKUP_TIMEOUT", "16")),
+    'rss': float(os.getenv("NEWS_LOOKUP_TIMEOUT", "2")),
+}
+# Если найдено несколько источников, в промпт попадает первый по приоритету
+ENRICHMENT_PRIORITY = ('weather', 'maps', 'rss')
+
+# Метрики в формате Prometheus: эндпоинт /metrics и перцентили в /status
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 — не запускать эндпоинт
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+# Трассировка сообщений: последние трассы в памяти, /slow и /traces для администраторов
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")  # Например, http://localhost:4318/v1/traces
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if user_id}
+tracer.configure(TRACE_BUFFER_SIZE, OtlpExporter(TRACE_OTLP_ENDPOINT) if TRACE_OTLP_ENDPOINT else None)
+
+MESSAGES_TOTAL = Counter("bot_messages_total", "Обработанные текстовые сообщения")
+LLM_REQUESTS_TOTAL = Counter("bot_llm_requests_total", "Успешные ответы моделей", ["provider"])
+ERRORS_TOTAL = Counter("bot_errors_total", "Ошибки обработки запросов (error, timeout, empty)", ["provider", "kind"])
+BUSY_REJECTIONS_TOTAL = Counter("bot_busy_rejections_total", "Запросы, отклонённые из-за переполненной очереди", ["provider"])
+ENRICHMENT_TIMEOUTS_TOTAL = Counter("bot_enrichment_timeouts_total", "Источники контекста, не ответившие вовремя", ["source"])
+STAGE_SECONDS = Histogram("bot_stage_seconds", "Длительность этапов обработки сообщения", ["stage"])
+REQUEST_SECONDS = Histogram("bot_request_seconds", "Полное время ответа на сообщение", ["provider"])
+LLM_QUEUE_DEPTH = Gauge("bot_llm_queue_depth", "Запросы, ожидающие очереди к модели", ["provider"])
+LLM_ACTIVE = Gauge("bot_llm_active_requests", "Выполняющиеся запросы к модели", ["provider"])
+LLM_UP = Gauge("bot_llm_up", "Модель прошла фоновую проверку при запуске (1) или нет (0)", ["provider"])
+CIRCUIT_STATE = Gauge("bot_llm_circuit_state", "Предохранитель модели: 0 — замкнут, 1 — пробный запрос, 2 — разомкнут", ["provider"])
+CIRCUIT_REJECTIONS_TOTAL = Counter("bot_llm_circuit_rejections_total", "Запросы, не отправленные в отключённую модель", ["provider"])
+FAILOVERS_TOTAL = Counter("bot_llm_failovers_total", "Переключения на другую модель", ["from", "to"])
+LLM_COALESCED_TOTAL = Counter("bot_llm_coalesced_total", "Запросы, получившие ответ уже выполнявшегося одинакового запроса", ["provider"])
+LLM_INFLIGHT_UNIQUE = Gauge("bot_llm_inflight_unique", "Различные запросы, выполняющиеся в модели", ["provider"])
+HEDGED_TOTAL = Counter("bot_llm_hedged_total", "Продублированные запросы: win — быстрее ответила вторая модель", ["provider", "result"])
+UPDATES_PENDING = Gauge("bot_updates_pending", "Обновления Telegram, ожидающие обработчика")
+UPDATE_WORKERS_BUSY = Gauge("bot_update_workers_busy", "Занятые обработчики обновлений")
+CACHE_HITS = Counter("bot_cache_hits_total", "Попадания в кэш (включая объединённые запросы)", ["cache"])
+CACHE_MISSES = Counter("bot_cache_misses_total", "Промахи кэша", ["cache"])
+CACHE_HIT_RATIO = Gauge("bot_cache_hit_ratio", "Доля попаданий в кэш", ["cache"])
+RSS_REQUESTS_TOTAL = Counter("bot_rss_requests_total", "Запросы к RSS-лентам: not_modified — ответ 304", ["feed", "result"])
+RSS_BYTES_TOTAL = Counter("bot_rss_bytes_total", "Байт получено от RSS-лент", ["feed"])
+NOMINATIM_QUEUE = Gauge("bot_nominatim_queue_depth", "Запросы, ожидающие ограничителя частоты Nominatim")
+LOOP_LAG_SECONDS = Histogram("bot_event_loop_lag_seconds", "Задержка пробуждения задач в цикле событий",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+# Названия этапов для /status
+STAGE_TITLES = {
+    'telegram_send': 'отправка заглушки',
+    'intent': 'определение намерений',
+    'weather': 'погода',
+    'maps': 'карты',
+    'rss': 'RSS',
+    'queue': 'очередь к модели',
+    'llm': 'ответ модели',
+    'telegram_edit': 'правка сообщения',
+}
+LOOP_LAG_LAST = Gauge("bot_event_loop_lag_last_seconds", "Последнее измерение задержки цикла событий")
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """Этап обработки сообщения: попадает в гистограмму этапов и спаном в трассу сообщения"""
+    with STAGE_SECONDS.time(name), tracer.span(name, **attributes):
+        yield
+
+for _cache in (weather_cache, geocode_cache, answer_cache):
+    CACHE_HITS.set_function(lambda cache=_cache: cache.hits + cache.coalesced, _cache.name)
+    CACHE_MISSES.set_function(lambda cache=_cache: cache.misses, _cache.name)
+    CACHE_HIT_RATIO.set_function(lambda cache=_cache: cache.stats()['hit_ratio'], _cache.name)
+NOMINATIM_QUEUE.set_function(lambda: nominatim_limiter.waiting)
 
 # Логируем загрузку конфигурации
 logger.info("=" * 50)
@@ -502,6 +535,26 @@ if not TELEGRAM_TOKEN:
 
 logger.info(f"Telegram токен загружен: {TELEGRAM_TOKEN[:10]}...")
 
+# Проверяем настройки режима получения обновлений
+if BOT_MODE not in ("polling", "webhook"):
+    logger.error(f"Неизвестный BOT_MODE '{BOT_MODE}', допустимо: polling, webhook")
+    raise ValueError(f"Неизвестный BOT_MODE '{BOT_MODE}', допустимо: polling, webhook")
+
+if BOT_MODE == "webhook":
+    # Telegram принимает секрет из 1-256 символов A-Z, a-z, 0-9, _ и -
+    if WEBHOOK_SECRET and not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', WEBHOOK_SECRET):
+        logger.error("WEBHOOK_SECRET может содержать только A-Z, a-z, 0-9, _ и - (до 256 символов)")
+        raise ValueError("WEBHOOK_SECRET может содержать только A-Z, a-z, 0-9, _ и - (до 256 символов)")
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET не задан - входящие запросы webhook не проверяются")
+    if not WEBHOOK_URL:
+        # Без адреса PTB регистрирует в Telegram адрес из listen/port/url_path, недоступный снаружи
+        logger.error("WEBHOOK_URL обязателен в режиме webhook: бот регистрирует этот адрес в Telegram при запуске")
+        raise ValueError("WEBHOOK_URL обязателен в режиме webhook: бот регистрирует этот адрес в Telegram при запуске")
+    logger.info(f"Режим webhook: {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}, до {WEBHOOK_MAX_CONNECTIONS} соединений")
+else:
+    logger.info(f"Режим long polling: таймаут {POLLING_TIMEOUT} с")
+
 # Проверяем наличие конфигурации для Yandex
 if not YANDEX_FOLDER_ID or (not YANDEX_API_KEY and not YANDEX_AUTH_TOKEN):
     logger.warning("Yandex GPT не настроен - отсутствуют YANDEX_FOLDER_ID и (YANDEX_API_KEY или YANDEX_AUTH_TOKEN)")
@@ -526,64 +579,105 @@ class UnifiedBot:
         """Инициализация бота"""
         logger.info("Инициализация UnifiedBot...")
         
-        self.application = Application.builder().token(TELEGRAM_TOKEN).build()
+        # Медленный ответ модели в одном чате не задерживает остальные чаты
+        self.update_processor = ChatOrderedUpdateProcessor(max_workers=UPDATE_WORKERS, max_pending=MAX_PENDING_UPDATES)
+        
+        builder = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .concurrent_updates(self.update_processor)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+        )
+        if TELEGRAM_API_BASE_URL:
+            builder = builder.base_url(TELEGRAM_API_BASE_URL)
+        self.application = builder.build()
         
-        # Инициализация Yandex GPT
-        self.yandex_sdk = None
-        self.yandex_model = None
+        # Инициализация Yandex GPT: SDK импортируется и клиент создаётся при первом запросе или прогреве
+        self.yandex_provider = None
         if YANDEX_AVAILABLE and YANDEX_FOLDER_ID and (YANDEX_API_KEY or YANDEX_AUTH_TOKEN):
-            try:
-                logger.info("Инициализация Yandex GPT SDK...")
-                # Приоритет методов аутентификации:
-                # 1. API Key (бессрочный, строка)
-                # 2. IAM токен (временный, строка)
-                if YANDEX_API_KEY:
-                    logger.info(f"Использую бессрочный API ключ: {YANDEX_API_KEY[:10]}...")
-                    self.yandex_sdk = YCloudML(
-                        folder_id=YANDEX_FOLDER_ID,
-                        auth=YANDEX_API_KEY,  # Передаем API ключ как строку
-                    )
-                elif YANDEX_AUTH_TOKEN:
-                    logger.info(f"Использую временный IAM токен: {YANDEX_AUTH_TOKEN[:10]}...")
-                    self.yandex_sdk = YCloudML(
-                        folder_id=YANDEX_FOLDER_ID,
-                        auth=YANDEX_AUTH_TOKEN,  # Передаем IAM токен как строку
-                    )
-                else:
-                    raise ValueError("Нет доступных методов аутентификации для Yandex GPT")
-                self.yandex_model = self.yandex_sdk.models.completions("yandexgpt")
-                logger.info("✅ Yandex GPT инициализирован успешно")
-            except Exception as e:
-                logger.error(f"❌ Ошибка инициализации Yandex GPT: {e}", exc_info=True)
+            if YANDEX_API_KEY:
+                logger.info(f"Использую бессрочный API ключ: {YANDEX_API_KEY[:10]}...")
+            else:
+                logger.info(f"Использую временный IAM токен: {YANDEX_AUTH_TOKEN[:10]}...")
+            self.yandex_provider = YandexGPTProvider(
+                create_yandex_model,
+                temperature=0.5,
+                max_concurrent=YANDEX_MAX_CONCURRENCY,
+                timeout=YANDEX_TIMEOUT,
+                preload=load_yandex_sdk,
+            )
+            logger.info("✅ Yandex GPT настроен")
         elif not YANDEX_AVAILABLE:
             logger.warning("❌ Yandex GPT недоступен - SDK не установлен")
         
-        # Инициализация GigaChat
-        self.giga_client = None
+        # Инициализация GigaChat: клиент создаётся при первом запросе или прогреве
+        self.giga_provider = None
         if GIGACHAT_CREDENTIALS:
-            try:
-                logger.info("Инициализация GigaChat клиента...")
-                # Настраиваем российские сертификаты
-                setup_russian_certificates()
-                # Инициализируем GigaChat напрямую
-                self.giga_client = GigaChat(
-                    credentials=GIGACHAT_CREDENTIALS,
-                    scope=GIGACHAT_SCOPE,
-                    verify_ssl_certs=False
-                )
-                logger.info("✅ GigaChat клиент создан успешно")
-            except Exception as e:
-                logger.error(f"❌ Ошибка инициализации GigaChat: {e}", exc_info=True)
-        
-        # Статистика
-        self.stats = {
-            'messages_processed': 0,
-            'yandex_requests': 0,
-            'giga_requests': 0,
-            'errors': 0,
-            'start_time': datetime.now()
+            # Настраиваем российские сертификаты
+            setup_russian_certificates()
+            self.giga_provider = GigaChatProvider(
+                create_giga_client,
+                max_concurrent=GIGACHAT_MAX_CONCURRENCY,
+                timeout=GIGACHAT_TIMEOUT,
+            )
+            logger.info(f"✅ GigaChat настроен (до {GIGACHAT_MAX_CONCURRENCY} одновременных запросов)")
+        
+        # Результат фоновой проверки моделей для /status: None — проверка ещё идёт
+        self.provider_health: Dict[str, Optional[bool]] = {}
+        self.health_task: Optional[asyncio.Task] = None
+        
+        # Доступные модели по короткому имени
+        self.providers: Dict[str, LLMProvider] = {
+            provider.name: provider for provider in (self.yandex_provider, self.giga_provider) if provider
+        }
+        # Справедливая очередь к каждой модели: не больше max_concurrent одновременных вызовов
+        self.limiters: Dict[str, FairLimiter] = {
+            name: FairLimiter(
+                provider.label,
+                max_concurrent=provider.max_concurrent,
+                max_queue=LLM_QUEUE_SIZE,
+                max_per_user=LLM_MAX_PER_USER,
+                max_wait=LLM_QUEUE_TIMEOUT,
+            )
+            for name, provider in self.providers.items()
         }
         
+        # Выбор модели по скользящей статистике и предохранители; первой по умолчанию идёт Yandex GPT
+        self.router = LatencyRouter(
+            self.providers,
+            policy=LLM_FAILOVER,
+            window=CIRCUIT_WINDOW,
+            error_threshold=CIRCUIT_ERROR_RATE,
+            min_requests=CIRCUIT_MIN_REQUESTS,
+            cooldown=CIRCUIT_COOLDOWN,
+        )
+        self.hedge_budget = HedgeBudget(HEDGE_BUDGET)
+        # Выполняющиеся запросы к каждой модели по ключу (вопрос, контекст)
+        self.llm_flights = {name: SingleFlight() for name in self.providers}
+        
+        # Метрики очередей и планировщика читаются в момент запроса /metrics
+        for name, limiter in self.limiters.items():
+            LLM_QUEUE_DEPTH.set_function(lambda limiter=limiter: limiter.queued, name)
+            LLM_ACTIVE.set_function(lambda limiter=limiter: limiter.active, name)
+            LLM_UP.set_function(lambda name=name: float(self.provider_health.get(name) is True), name)
+            LLM_COALESCED_TOTAL.set_function(lambda flight=self.llm_flights[name]: flight.coalesced, name)
+            LLM_INFLIGHT_UNIQUE.set_function(lambda flight=self.llm_flights[name]: flight.inflight, name)
+            CIRCUIT_STATE.set_function(
+                lambda breaker=self.router.breakers[name]: {CLOSED: 0.0, HALF_OPEN: 1.0}.get(breaker.state, 2.0), name)
+        if RSS_NEWS_AVAILABLE:
+            for name, feed_state in get_rss_poller().states.items():
+                RSS_REQUESTS_TOTAL.set_function(lambda state=feed_state: state.requests - state.not_modified, name, "fetched")
+                RSS_REQUESTS_TOTAL.set_function(lambda state=feed_state: state.not_modified, name, "not_modified")
+                RSS_BYTES_TOTAL.set_function(lambda state=feed_state: state.bytes_received, name)
+        UPDATES_PENDING.set_function(lambda: self.update_processor.pending)
+        UPDATE_WORKERS_BUSY.set_function(lambda: self.update_processor.active)
+        self.metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+        if self.metrics_server:
+            self.metrics_server.add_route("/traces", "application/json; charset=utf-8", tracer.export_json)
+        self.loop_lag_monitor = EventLoopLagMonitor(LOOP_LAG_SECONDS, LOOP_LAG_LAST, interval=LOOP_LAG_INTERVAL)
+        self.started_at = datetime.now()
+        
         logger.info("Статистика инициализирована")
         
         # Настройка обработчиков
@@ -596,6 +690,8 @@ class UnifiedBot:
         self.application.add_handler(CommandHandler("help", self.help_command))
         self.application.add_handler(CommandHandler("status", self.status_command))
         self.application.add_handler(CommandHandler("select_model", self.select_model_command))
+        self.application.add_handler(CommandHandler("slow", self.slow_command))
+        self.application.add_handler(CommandHandler("traces", self.traces_command))
         self.application.add_handler(CallbackQueryHandler(self.button_callback))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         self.application.add_error_handler(self.error_handler)
@@ -695,36 +791,180 @@ class UnifiedBot:
         
         user_logger.info(f"Команда /status от пользователя {username} (ID: {user_id})")
         
-        uptime = datetime.now() - self.stats['start_time']
+        uptime = datetime.now() - self.started_at
         uptime_str = str(uptime).split('.')[0]  # Убираем микросекунды
         
         status_text = f"""
 📊 **Статистика бота**
 
 ⏱️ **Время работы:** {uptime_str}
-💬 **Обработано сообщений:** {self.stats['messages_processed']}
-🔵 **Запросов к Yandex GPT:** {self.stats['yandex_requests']}
-🟢 **Запросов к GigaChat:** {self.stats['giga_requests']}
-❌ **Ошибок:** {self.stats['errors']}
+💬 **Обработано сообщений:** {MESSAGES_TOTAL.get():.0f}
+🔵 **Запросов к Yandex GPT:** {LLM_REQUESTS_TOTAL.get('yandex'):.0f}
+🟢 **Запросов к GigaChat:** {LLM_REQUESTS_TOTAL.get('giga'):.0f}
+❌ **Ошибок:** {ERRORS_TOTAL.total():.0f}
 
 🔧 **Статус моделей:**
 """
         
-        # Статус Yandex GPT
-        if self.yandex_model:
-            status_text += "🔵 Yandex GPT: ✅ Активна\n"
-        else:
-            status_text += "🔵 Yandex GPT: ❌ Недоступна\n"
+        # Статус моделей по результату фоновой проверки
+        for name, label in (('yandex', "🔵 Yandex GPT"), ('giga', "🟢 GigaChat")):
+            if name not in self.providers:
+                status_text += f"{label}: ❌ Недоступна\n"
+            elif self.provider_health.get(name) is None:
+                status_text += f"{label}: ⏳ Проверяется\n"
+            elif self.provider_health[name]:
+                status_text += f"{label}: ✅ Активна\n"
+            else:
+                status_text += f"{label}: ⚠️ Не прошла проверку при запуске\n"
         
-        # Статус GigaChat
-        if self.giga_client:
-            status_text += f"🟢 GigaChat: ✅ Активна\n"
-        else:
-            status_text += "🟢 GigaChat: ❌ Недоступна\n"
+        # Предохранители и скользящая статистика маршрутизатора
+        for name, breaker in self.router.breakers.items():
+            p50 = breaker.latency(0.5)
+            state = "⚡ отключена" if not breaker.available else ("🧪 пробный запрос" if breaker.state == HALF_OPEN else "✅")
+            status_text += (
+                f"🛡 {self.providers[name].label}: {state}, ошибок {breaker.error_rate:.0%} из {breaker.requests} "
+                f"за {CIRCUIT_WINDOW:.0f} с, медиана {f'{p50:.1f} с' if p50 is not None else '—'}"
+                f"{f', ещё {breaker.retry_after:.0f} с' if not breaker.available else ''}\n"
+            )
+        if self.router.failovers:
+            status_text += f"🔀 Переключений на другую модель: {self.router.failovers} (политика {LLM_FAILOVER})\n"
+        if HEDGE_REQUESTS:
+            budget = self.hedge_budget
+            status_text += (
+                f"👯 Дублирование: {budget.hedged} из {budget.requests} запросов, "
+                f"вторая модель ответила быстрее {sum(HEDGED_TOTAL.get(name, 'win') for name in self.providers):.0f} раз, "
+                f"не хватило бюджета {budget.denied}\n"
+            )
+        coalesced = sum(flight.coalesced for flight in self.llm_flights.values())
+        if coalesced:
+            answered = sum(LLM_REQUESTS_TOTAL.get(name) for name in self.providers)
+            status_text += f"🔗 Объединено одинаковых запросов: {coalesced} ({coalesced / max(answered, 1):.0%} ответов)\n"
+        
+        # Экономия задержки за счёт адаптивного опроса Yandex GPT
+        if self.yandex_provider and self.yandex_provider.completed_operations:
+            status_text += (
+                f"⚡ Опрос Yandex GPT: сэкономлено {self.yandex_provider.poll_time_saved:.1f} с "
+                f"(в среднем {self.yandex_provider.average_time_saved:.1f} с на запрос, "
+                f"{self.yandex_provider.poller.status_calls} проверок статуса за {self.yandex_provider.poller.rounds} раундов)\n"
+            )
+        if self.yandex_provider and self.yandex_provider.streamed_responses:
+            status_text += (
+                f"⚡ Потоковые ответы Yandex GPT: {self.yandex_provider.streamed_responses}, первый фрагмент "
+                f"в среднем через {self.yandex_provider.average_first_chunk:.1f} с\n"
+            )
+        
+        # Кэш погоды
+        weather_stats = weather_cache.stats()
+        status_text += (
+            f"🌤️ Кэш погоды: {weather_stats['hits']} попаданий, {weather_stats['misses']} промахов, "
+            f"{weather_stats['stale']} устаревших, {weather_stats['coalesced']} объединённых "
+            f"({weather_stats['hit_ratio']:.0%})\n"
+        )
+        
+        # Кэш ответов моделей
+        if ANSWER_CACHE_TTL > 0:
+            answer_stats = answer_cache.stats()
+            status_text += (
+                f"💾 Кэш ответов: {answer_stats['hits']} попаданий, {answer_stats['misses']} промахов, "
+                f"{answer_stats['size']} записей ({answer_stats['hit_ratio']:.0%})\n"
+            )
+        
+        # Трафик RSS-лент
+        if RSS_NEWS_AVAILABLE:
+            rss_stats = get_rss_poller().stats()
+            status_text += (
+                f"📰 RSS: {rss_stats['requests']} запросов, {rss_stats['not_modified']} без изменений (304), "
+                f"получено {rss_stats['bytes_received'] / 1024:.0f} КБ\n"
+            )
+        
+        # Кэш геокодирования
+        geocode_stats = geocode_cache.stats()
+        status_text += (
+            f"🗺️ Кэш карт: {geocode_stats['hits']} попаданий, {geocode_stats['misses']} промахов, "
+            f"{geocode_stats['coalesced']} объединённых ({geocode_stats['hit_ratio']:.0%}), "
+            f"в очереди к Nominatim: {nominatim_limiter.waiting}\n"
+        )
+        
+        # Планировщик обновлений
+        scheduler_stats = self.update_processor.stats()
+        status_text += (
+            f"🧵 Обработчики: {scheduler_stats['active']}/{scheduler_stats['workers']} заняты, "
+            f"{scheduler_stats['pending']} обновлений ждут в {scheduler_stats['busy_chats']} чатах\n"
+        )
+        
+        # Очереди к моделям
+        for limiter in self.limiters.values():
+            queue_stats = limiter.stats()
+            status_text += (
+                f"⏳ Очередь {queue_stats['name']}: {queue_stats['active']} в работе, {queue_stats['queued']} ждут "
+                f"(максимум {queue_stats['max_queued']}), отклонено {queue_stats['rejected'] + queue_stats['timed_out']}\n"
+            )
+        
+        # Перцентили задержек по тем же гистограммам, что отдаются на /metrics
+        latency_lines = []
+        for labels in REQUEST_SECONDS.label_sets():
+            provider = self.providers.get(labels[0])
+            title = f"весь запрос ({provider.label if provider else labels[0]})"
+            latency_lines.append(self.format_percentiles(title, REQUEST_SECONDS, *labels))
+        for labels in STAGE_SECONDS.label_sets():
+            latency_lines.append(self.format_percentiles(STAGE_TITLES.get(labels[0], labels[0]), STAGE_SECONDS, *labels))
+        if LOOP_LAG_SECONDS.count():
+            latency_lines.append(self.format_percentiles("задержка цикла событий", LOOP_LAG_SECONDS))
+        if latency_lines:
+            status_text += "\n⏱️ **Задержки (p50 / p95 / p99):**\n" + "\n".join(latency_lines) + "\n"
         
         await update.message.reply_text(status_text, parse_mode='Markdown')
         logger.info(f"Статистика отправлена пользователю {username}")
     
+    @staticmethod
+    def format_percentiles(title: str, histogram: Histogram, *labels: str) -> str:
+        """Строка с p50/p95/p99 гистограммы для /status"""
+        p50, p95, p99 = (histogram.quantile(q, *labels) for q in (0.5, 0.95, 0.99))
+        return f"• {title}: {p50:.3f} / {p95:.3f} / {p99:.3f} с ({histogram.count(*labels)})"
+    
+    async def check_admin(self, update: Update, command: str) -> bool:
+        """Пропускает только администраторов из ADMIN_IDS"""
+        user_id = update.effective_user.id
+        username = update.effective_user.username or "Unknown"
+        user_logger.info(f"Команда /{command} от пользователя {username} (ID: {user_id})")
+        if user_id in ADMIN_IDS:
+            return True
+        await update.message.reply_text("⛔ Команда доступна только администраторам")
+        logger.warning(f"Пользователь {username} (ID: {user_id}) без прав администратора вызвал /{command}")
+        return False
+    
+    async def slow_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Обработчик команды /slow [N] - самые медленные недавние запросы с разбивкой по этапам"""
+        if not await self.check_admin(update, "slow"):
+            return
+        
+        try:
+            count = min(max(int(context.args[0]), 1), 10) if context.args else 3
+        except ValueError:
+            count = 3
+        
+        traces = tracer.slowest(count)
+        if not traces:
+            await update.message.reply_text("Трасс пока нет")
+            return
+        
+        # Без parse_mode: в именах спанов и атрибутах встречаются символы разметки Markdown
+        for trace in traces:
+            await update.message.reply_text(format_trace(trace)[:TELEGRAM_MESSAGE_LIMIT])
+        logger.info(f"Отправлено {len(traces)} медленных трасс из {len(tracer.traces)}")
+    
+    async def traces_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Обработчик команды /traces - все трассы из буфера файлом JSON"""
+        if not await self.check_admin(update, "traces"):
+            return
+        
+        document = io.BytesIO(tracer.export_json().encode('utf-8'))
+        await update.message.reply_document(
+            document,
+            filename=f"traces_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            caption=f"Трасс в буфере: {len(tracer.traces)}",
+        )
+    
     async def select_model_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработчик команды /select_model"""
         user_id = update.effective_user.id
@@ -739,13 +979,13 @@ class UnifiedBot:
         keyboard = []
         
         # Кнопка для Yandex GPT
-        if self.yandex_model:
+        if self.yandex_provider:
             keyboard.append([InlineKeyboardButton("🔵 Yandex GPT", callback_data="model_yandex")])
         else:
             keyboard.append([InlineKeyboardButton("🔵 Yandex GPT (недоступна)", callback_data="model_unavailable")])
         
         # Кнопка для GigaChat
-        if self.giga_client:
+        if self.giga_provider:
             keyboard.append([InlineKeyboardButton("🟢 GigaChat", callback_data="model_giga")])
         else:
             keyboard.append([InlineKeyboardButton("🟢 GigaChat (недоступна)", callback_data="model_unavailable")])
@@ -753,7 +993,7 @@ class UnifiedBot:
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         text = "🤖 **Выберите модель для общения:**\n\n"
-        if not self.yandex_model and not (self.giga_client):
+        if not self.yandex_provider and not self.giga_provider:
             text += "❌ **Внимание:** Ни одна модель не доступна. Проверьте конфигурацию."
         
         await update.message.reply_text(text, parse_mode='Markdown', reply_markup=reply_markup)
@@ -764,13 +1004,13 @@ class UnifiedBot:
         keyboard = []
         
         # Кнопка для Yandex GPT
-        if self.yandex_model:
+        if self.yandex_provider:
             keyboard.append([InlineKeyboardButton("🔵 Yandex GPT", callback_data="model_yandex")])
         else:
             keyboard.append([InlineKeyboardButton("🔵 Yandex GPT (недоступна)", callback_data="model_unavailable")])
         
         # Кнопка для GigaChat
-        if self.giga_client:
+        if self.giga_provider:
             keyboard.append([InlineKeyboardButton("🟢 GigaChat", callback_data="model_giga")])
         else:
             keyboard.append([InlineKeyboardButton("🟢 GigaChat (недоступна)", callback_data="model_unavailable")])
@@ -778,7 +1018,7 @@ class UnifiedBot:
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         text = "🤖 **Выберите модель для общения:**\n\n"
-        if not self.yandex_model and not (self.giga_client):
+        if not self.yandex_provider and not self.giga_provider:
             text += "❌ **Внимание:** Ни одна модель не доступна. Проверьте конфигурацию."
         
         await query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
@@ -795,7 +1035,7 @@ class UnifiedBot:
         user_logger.info(f"Нажатие кнопки '{query.data}' от пользователя {username} (ID: {user_id})")
         
         if query.data == "model_yandex":
-            if self.yandex_model:
+            if self.yandex_provider:
                 context.user_data['selected_model'] = 'yandex'
                 keyboard = [[InlineKeyboardButton("🔄 Вернуться к выбору модели", callback_data="back_to_menu")]]
                 reply_markup = InlineKeyboardMarkup(keyboard)
@@ -808,7 +1048,7 @@ class UnifiedBot:
                 logger.warning(f"Пользователь {username} попытался выбрать недоступную Yandex GPT")
         
         elif query.data == "model_giga":
-            if self.giga_client:
+            if self.giga_provider:
                 context.user_data['selected_model'] = 'giga'
                 keyboard = [[InlineKeyboardButton("🔄 Вернуться к выбору модели", callback_data="back_to_menu")]]
                 reply_markup = InlineKeyboardMarkup(keyboard)
@@ -826,6 +1066,9 @@ class UnifiedBot:
             await query.edit_message_text("❌ **Модель недоступна**\n\nПроверьте конфигурацию в .env файле.", parse_mode='Markdown', reply_markup=reply_markup)
             logger.warning(f"Пользователь {username} попытался выбрать недоступную модель")
         
+        elif query.data.startswith(("failover_", "autofailover_")):
+            await self.handle_failover(query, context, username)
+        
         elif query.data == "back_to_menu":
             await self.show_model_selection_from_callback(query, context)
             logger.info(f"Пользователь {username} вернулся к выбору модели")
@@ -839,36 +1082,65 @@ class UnifiedBot:
         # Логируем входящее сообщение
         user_logger.info(f"Сообщение от {username} (ID: {user_id}): {user_message[:100]}{'...' if len(user_message) > 100 else ''}")
         
+        # Трасса сообщения: этапы, источники контекста, вызовы модели и Telegram
+        with tracer.trace("message", user_id=user_id, username=username):
+            await self.respond(update, context, user_message, username)
+    
+    async def respond(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_message: str, username: str) -> None:
+        """Выбор модели, заглушка и обработка запроса"""
         # Увеличиваем счетчик сообщений
-        self.stats['messages_processed'] += 1
+        MESSAGES_TOTAL.inc()
         
         # Определяем выбранную модель
         selected_model = context.user_data.get('selected_model')
+        # Запросы пользователей, не выбравших модель сами, можно дублировать во вторую модель
+        hedge = HEDGE_REQUESTS and not selected_model
+        
+        if not self.providers:
+            await update.message.reply_text("❌ **Ошибка:** Ни одна модель не доступна. Проверьте конфигурацию.")
+            logger.error(f"Ни одна модель не доступна для пользователя {username}")
+            return
+        
+        # Определяем тип запроса и извлекаем город/местоположение за один проход
+        with stage("intent"):
+            intent = detect_intents(user_message)
+        
+        # Вопрос о погоде или новостях, на который уже отвечали по тому же снимку, — ответ без модели
+        if await self.reply_cached(update, user_message, username, selected_model, intent):
+            return
         
-        # Если модель не выбрана, используем доступную по умолчанию
         if not selected_model:
-            if self.yandex_model:
-                selected_model = 'yandex'
-                logger.info(f"Автоматически выбрана Yandex GPT для пользователя {username}")
-            elif self.giga_client:
-                selected_model = 'giga'
-                logger.info(f"Автоматически выбрана GigaChat для пользователя {username}")
+            # Модель не выбрана: самая быстрая из тех, что не отключены предохранителем
+            selected_model = self.router.choose()
+            if selected_model is None:
+                await self.reply_unavailable(update, user_message)
+                return
+            logger.info(f"Автоматически выбрана {self.providers[selected_model].label} для пользователя {username}")
+        elif selected_model in self.providers and not self.router.allow(selected_model):
+            # Выбранная модель отключена предохранителем: не ждём заведомо неудачный ответ
+            CIRCUIT_REJECTIONS_TOTAL.inc(selected_model)
+            alternative = self.router.alternative(selected_model) if LLM_FAILOVER != "off" else None
+            auto = LLM_FAILOVER == "auto" or context.user_data.get('auto_failover')
+            if alternative and auto and self.router.allow(alternative):
+                self.record_failover(selected_model, alternative, username)
+                selected_model = alternative
             else:
-                await update.message.reply_text("❌ **Ошибка:** Ни одна модель не доступна. Проверьте конфигурацию.")
-                logger.error(f"Ни одна модель не доступна для пользователя {username}")
+                await self.reply_unavailable(update, user_message, selected_model)
                 return
+        tracer.set_attribute("model", selected_model)
         
         # Отправляем сообщение о том, что бот обрабатывает запрос
-        processing_message = await update.message.reply_text("🤔 Обрабатываю ваш запрос...")
+        with stage("telegram_send"):
+            processing_message = await update.message.reply_text("🤔 Обрабатываю ваш запрос...")
         
         try:
-            if selected_model == 'yandex':
-                await self.handle_yandex_request(update, processing_message, user_message, username)
-            elif selected_model == 'giga':
-                await self.handle_giga_request(update, processing_message, user_message, username)
+            provider = self.providers.get(selected_model)
+            if provider:
+                await self.process_request(provider, processing_message, user_message, username, update.effective_user.id,
+                                           hedge, intent)
             else:
-                await processing_message.edit_text("❌ Неизвестная модель")
-                logger.error(f"Неизвестная модель '{selected_model}' для пользователя {username}")
+                await processing_message.edit_text("❌ Выбранная модель недоступна")
+                logger.error(f"Модель '{selected_model}' недоступна для пользователя {username}")
                 
         except Exception as e:
             error_message = f"❌ Произошла ошибка при обработке запроса: {str(e)}"
@@ -876,348 +1148,437 @@ class UnifiedBot:
             reply_markup = InlineKeyboardMarkup(keyboard)
             await processing_message.edit_text(error_message, reply_markup=reply_markup)
             logger.error(f"Ошибка для пользователя {username}: {e}", exc_info=True)
-            self.stats['errors'] += 1
+            ERRORS_TOTAL.inc("bot", "error")
+    
     
-    async def handle_yandex_request(self, update: Update, processing_message, user_message: str, username: str) -> None:
-        """Обработка запроса к Yandex GPT"""
-        if not self.yandex_model:
-            await processing_message.edit_text("❌ Yandex GPT недоступна")
-            logger.error(f"Попытка использовать недоступную Yandex GPT для пользователя {username}")
+    async def reply_unavailable(self, update: Update, user_message: str, failed: Optional[str] = None) -> None:
+        """Быстрый ответ, когда модель отключена предохранителем, с предложением ответить через другую"""
+        if failed:
+            text = (f"⚡ {self.providers[failed].label} сейчас не отвечает: слишком много ошибок за последние минуты. "
+                    f"Повторная попытка через {self.router.breakers[failed].retry_after:.0f} с.")
+        else:
+            text = f"⚡ Все модели сейчас не отвечают. Попробуйте через {self.router.retry_after():.0f} с."
+        await update.message.reply_text(text, reply_markup=self.failover_markup(update.effective_user.id, user_message, failed))
+        logger.warning(f"Запрос пользователя {update.effective_user.username or 'Unknown'} не отправлен: {text}")
+    
+    def failover_markup(self, user_id: int, user_message: str, failed: Optional[str]) -> InlineKeyboardMarkup:
+        """Кнопки под ошибкой модели: ответить через исправную модель (с согласия пользователя) и вернуться в меню"""
+        alternative = self.router.alternative(failed) if failed and LLM_FAILOVER != "off" else None
+        if not alternative:
+            return self.back_to_menu_markup()
+        # Текст запроса нужен, чтобы повторить его после нажатия кнопки
+        self.application.user_data[user_id]['failover'] = (failed, user_message)
+        provider = self.providers[alternative]
+        keyboard = [[InlineKeyboardButton(f"{provider.emoji} Ответить через {provider.label}", callback_data=f"failover_{alternative}")]]
+        if LLM_FAILOVER == "ask":
+            keyboard.append([InlineKeyboardButton("🔀 Переключать автоматически", callback_data=f"autofailover_{alternative}")])
+        keyboard.append([InlineKeyboardButton("🔄 Вернуться к выбору модели", callback_data="back_to_menu")])
+        return InlineKeyboardMarkup(keyboard)
+    
+    def record_failover(self, failed: str, alternative: str, username: str) -> None:
+        self.router.failovers += 1
+        FAILOVERS_TOTAL.inc(failed, alternative)
+        tracer.set_attribute("failover_from", failed)
+        logger.warning(f"Запрос пользователя {username} переключён с {self.providers[failed].label} "
+                       f"на {self.providers[alternative].label}")
+    
+    async def handle_failover(self, query, context: ContextTypes.DEFAULT_TYPE, username: str) -> None:
+        """Повтор запроса через другую модель по кнопке под сообщением об ошибке"""
+        action, _, name = query.data.partition('_')
+        failed, user_message = context.user_data.pop('failover', (None, None))
+        provider = self.providers.get(name)
+        if not user_message or not provider:
+            await query.edit_message_text("⌛ Запрос устарел, отправьте сообщение ещё раз.", reply_markup=self.back_to_menu_markup())
+            return
+        if action == "autofailover":
+            context.user_data['auto_failover'] = True
+            logger.info(f"Пользователь {username} разрешил автоматическое переключение моделей")
+        if not self.router.allow(name):
+            CIRCUIT_REJECTIONS_TOTAL.inc(name)
+            await query.edit_message_text(f"⚡ {provider.label} тоже сейчас не отвечает. Попробуйте через {self.router.retry_after():.0f} с.",
+                                          reply_markup=self.back_to_menu_markup())
             return
         
+        with tracer.trace("message", user_id=query.from_user.id, username=username):
+            tracer.set_attribute("model", name)
+            if failed:
+                self.record_failover(failed, name, username)
+            await query.edit_message_text("🤔 Обрабатываю ваш запрос...")
+            await self.process_request(provider, query.message, user_message, username, query.from_user.id)
+    
+    async def process_request(self, provider: LLMProvider, processing_message, user_message: str, username: str,
+                              user_id: int, hedge: bool = False, intent=None) -> None:
+        """Конвейер обработки запроса: намерения → контекст → промпт → модель → ответ
+        
+        intent — уже определённые намерения сообщения, если их определил вызывающий
+        """
+        editor = None
+        started = time.perf_counter()
         try:
-            api_logger.info(f"Отправка запроса в Yandex GPT для пользователя {username}")
-            
-            # Формируем сообщения для Yandex GPT с актуальной датой
-            from datetime import datetime
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            current_year = datetime.now().year
-            
-            # Проверяем тип запроса
-            weather_keywords = ['погод', 'температур', 'градус', 'тепло', 'холодно', 'дожд', 'снег']
-            map_keywords = ['карт', 'адрес', 'координат', 'местоположен', 'как добраться', 'где находится', 'где ', 'остановк', 'магазин', 'универмаг']
-            # Расширенный список для веб-поиска - включаем больше случаев
-            search_keywords = [
-                'сейчас', 'новост', 'актуальн', 'текущ', 'последн',
-                'что там', 'как там', 'что с', 'что происходит', 
-                'где', 'когда', 'кто', 'какой', 'какая', 'какие',
-                '2024', '2025', 'год', 'месяц',
-                'президент', 'правительств', 'министр', 'выбор', 'победил',
-                'эмануэль', 'макрон', 'трамп', 'путин', 'байден',
-                'франц', 'росси', 'америк', 'сша', 'украин',
-                'событи', 'ситуаци', 'положени', 'состояни',
-                'подал', 'ушел', 'уволи', 'назначи', 'избра'
-            ]
-            
-            needs_weather = any(keyword in user_message.lower() for keyword in weather_keywords)
-            needs_map = any(keyword in user_message.lower() for keyword in map_keywords)
-            needs_search = any(keyword in user_message.lower() for keyword in search_keywords)
-            
-            web_context = ""
-            
-            # Проверяем погоду
-            if needs_weather:
-                api_logger.info(f"🌤️ Запрос погоды для Yandex GPT: {user_message}")
-                # Пытаемся извлечь название города
-                import re
-                city_match = re.search(r'в\s+([А-Яа-яA-Za-z\-]+)', user_message)
-                if not city_match:
-                    city_match = re.search(r'погод[аые]\s+([А-Яа-яA-Za-z\-]+)', user_message)
-                
-                if city_match:
-                    city = city_match.group(1)
-                    weather_info = get_weather(city)
-                    if weather_info:
-                        web_context = weather_info
-                        api_logger.info(f"✅ Получена погода для {city}")
-            
-            # Проверяем карты
-            if needs_map and not web_context:
-                api_logger.info(f"🗺️ Запрос карт для Yandex GPT: {user_message}")
-                import re
-                location_match = re.search(r'(?:карт[аыу]|адрес|координат[ыа]|где находится|как добраться|где)\s+(.+)', user_message, re.IGNORECASE)
-                if location_match:
-                    location = location_match.group(1).strip('?!.')
-                    maps_info = get_maps_info(location)
-                    if maps_info:
-                        web_context = maps_info
-                        api_logger.info(f"✅ Найдено местоположение на карте: {location}")
-                    else:
-                        api_logger.info(f"⚠️ Nominatim не нашёл местоположение, будет использован веб-поиск")
+            api_logger.info(f"Отправка запроса в {provider.label} для пользователя {username}")
             
-            # Для новостных запросов приоритет — RSS ленты (быстро и надёжно)
-            if needs_search and not web_context:
-                if RSS_NEWS_AVAILABLE:
-                    api_logger.info(f"📰 ПРИОРИТЕТ: Получаем свежие новости из RSS для Yandex GPT")
-                    rss_context = await asyncio.to_thread(rss_news_context, user_message, 5)
-                    if rss_context:
-                        web_context = rss_context
-                        api_logger.info("✅ Получены СВЕЖИЕ новости из RSS-лент (РИА, ТАСС)")
-                    else:
-                        api_logger.warning("⚠️ RSS ленты не вернули новостей")
-                else:
-                    api_logger.warning("⚠️ RSS модуль недоступен")
+            # Определяем тип запроса и извлекаем город/местоположение за один проход
+            if intent is None:
+                with stage("intent"):
+                    intent = detect_intents(user_message)
             
-            system_prompt = f"Ты — профессиональный умный помощник. Сейчас {current_date} ({current_year} год). Отвечай кратко и понятно."
+            # Собираем актуальный контекст из всех нужных источников одновременно; отпечаток снимка,
+            # из которого он собран, — ключ кэша ответов (снимок может обновиться, пока отвечает модель)
+            web_context, fingerprint = await self.gather_context(user_message, intent)
+            tracer.set_attribute("context", bool(web_context))
             
-            if web_context:
-                system_prompt += f"\n\n📰 АКТУАЛЬНАЯ ИНФОРМАЦИЯ ИЗ ИНТЕРНЕТА (24 ноября 2025 года):\n{web_context}\n\n🎯 КРИТИЧЕСКИ ВАЖНО:\n"
-                system_prompt += "1. Выше — САМЫЕ СВЕЖИЕ новости на 24 ноября 2025 года из реального интернета\n"
-                system_prompt += "2. Твои знания устарели (2023 год). Используй ТОЛЬКО информацию выше\n"
-                system_prompt += "3. ОБЯЗАТЕЛЬНО отвечай на основе этих новостей, игнорируй свои старые данные\n"
-                system_prompt += "4. Укажи источники и даты из данных выше\n"
-                system_prompt += "5. Если в новостях нет ответа на вопрос — честно скажи об этом\n"
-                system_prompt += "6. Отвечай кратко, максимум 500 символов\n"
+            # Без выбранной модели запрос дублируется во вторую модель, если основная задерживается
+            secondary = self.hedge_partner(provider) if hedge else None
+            if secondary:
+                provider, response_text, editor = await self.hedged_call(
+                    provider, secondary, processing_message, user_message, username, user_id, web_context)
             else:
-                system_prompt += "\n\n⚠️ ВАЖНО: Твои знания ограничены 2023 годом. Для актуальных новостей 2024-2025 года рекомендуй проверить достоверные источники (РИА, ТАСС, Коммерсантъ)."
-            
-            messages = [
-                {
-                    "role": "system",
-                    "text": system_prompt,
-                },
-                {
-                    "role": "user",
-                    "text": user_message,
-                },
-            ]
-            
-            # Отправляем запрос в Yandex GPT
-            operation = self.yandex_model.configure(temperature=0.5).run_deferred(messages)
-            
-            # Проверяем статус операции
-            status = operation.get_status()
-            api_logger.info(f"Начальный статус операции Yandex GPT: {status}")
+                response_text, editor = await self.call_provider(
+                    provider, processing_message, user_message, username, user_id, web_context)
             
-            # Ожидаем завершения операции
-            while status.is_running:
-                api_logger.info("Операция Yandex GPT выполняется, ждем 5 секунд...")
-                await asyncio.sleep(5)
-                status = operation.get_status()
-                api_logger.info(f"Статус операции Yandex GPT: {status}")
-            
-            # Получаем результат
-            api_logger.info("Операция Yandex GPT завершена, получаем результат")
-            result = operation.get_result()
-            
-            # Извлекаем текст ответа
-            if result.alternatives and len(result.alternatives) > 0:
-                response_text = result.alternatives[0].text
-                api_logger.info(f"Получен ответ от Yandex GPT для пользователя {username}: {response_text[:100]}{'...' if len(response_text) > 100 else ''}")
-                
-                # Проверяем, не отказался ли AI отвечать (цензура)
-                refusal_phrases = [
-                    "не могу обсуждать",
-                    "не могу помочь с этим",
-                    "не могу ответить",
-                    "не буду обсуждать",
-                    "давайте поговорим о чём-нибудь"
-                ]
-                
-                is_refusal = any(phrase in response_text.lower() for phrase in refusal_phrases)
+            if response_text:
+                api_logger.info(f"Получен ответ от {provider.label} для пользователя {username}: {response_text[:100]}{'...' if len(response_text) > 100 else ''}")
                 
-                # Если AI отказался и у нас есть контекст с новостями - показываем их напрямую
-                if is_refusal and web_context:
-                    api_logger.warning(f"Yandex GPT отказался отвечать, показываем сырые данные")
-                    response_text = f"🔵 **Актуальная информация:**\n\n{web_context}\n\n_AI отказался обрабатывать этот запрос, поэтому показаны найденные данные напрямую._"
-                else:
-                    # Добавляем префикс модели
-                    response_text = f"🔵 **Yandex GPT:**\n\n{response_text}"
+                # Если AI отказался отвечать (цензура), показываем найденные данные напрямую
+                if web_context and is_refusal(response_text):
+                    api_logger.warning(f"{provider.label} отказался отвечать, показываем сырые данные")
+                response_text = render_response(provider.emoji, provider.label, response_text, web_context)
+                self.store_answer(provider.name, user_message, fingerprint, response_text)
                 
-                # Создаем кнопку возврата в меню
-                keyboard = [[InlineKeyboardButton("🔄 Вернуться к выбору модели", callback_data="back_to_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                # Отправляем ответ пользователю с кнопкой
-                await processing_message.edit_text(response_text, parse_mode='Markdown', reply_markup=reply_markup)
-                self.stats['yandex_requests'] += 1
-                logger.info(f"Ответ Yandex GPT отправлен пользователю {username}")
+                # Отправляем ответ пользователю с кнопкой возврата в меню
+                with stage("telegram_edit"):
+                    if editor:
+                        await editor.finish(response_text, parse_mode='Markdown', reply_markup=self.back_to_menu_markup())
+                    else:
+                        await processing_message.edit_text(response_text, parse_mode='Markdown', reply_markup=self.back_to_menu_markup())
+                LLM_REQUESTS_TOTAL.inc(provider.name)
+                REQUEST_SECONDS.observe(time.perf_counter() - started, provider.name)
+                logger.info(f"Ответ {provider.label} отправлен пользователю {username}")
             else:
-                error_message = "❌ Извините, не удалось получить ответ от Yandex GPT. Попробуйте еще раз."
-                keyboard = [[InlineKeyboardButton("🔄 Вернуться к выбору модели", callback_data="back_to_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await processing_message.edit_text(error_message, reply_markup=reply_markup)
-                logger.error(f"Пустой ответ от Yandex GPT для пользователя {username}")
+                if editor:
+                    await editor.cancel()
+                error_message = f"❌ Извините, не удалось получить ответ от {provider.label}. Попробуйте еще раз."
+                await processing_message.edit_text(error_message, reply_markup=self.failover_markup(user_id, user_message, provider.name))
+                logger.error(f"Пустой ответ от {provider.label} для пользователя {username}")
+                ERRORS_TOTAL.inc(provider.name, "empty")
                 
+        except QueueFullError as e:
+            # Модель перегружена: сразу отвечаем, а не копим запросы, которые не дождутся ответа
+            busy_message = f"⏳ {provider.label} сейчас перегружена, попробуйте через минуту."
+            await processing_message.edit_text(busy_message, reply_markup=self.back_to_menu_markup())
+            logger.warning(f"Запрос пользователя {username} к {provider.label} отклонён: {e}")
+            BUSY_REJECTIONS_TOTAL.inc(provider.name)
         except Exception as e:
-            error_message = f"❌ Ошибка при работе с Yandex GPT: {str(e)}"
-            keyboard = [[InlineKeyboardButton("🔄 Вернуться к выбору модели", callback_data="back_to_menu")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await processing_message.edit_text(error_message, reply_markup=reply_markup)
-            logger.error(f"Ошибка Yandex GPT для пользователя {username}: {e}", exc_info=True)
-            self.stats['errors'] += 1
-    
-    async def handle_giga_request(self, update: Update, processing_message, user_message: str, username: str) -> None:
-        """Обработка запроса к GigaChat"""
-        if not self.giga_client:
-            await processing_message.edit_text("❌ GigaChat недоступен")
-            logger.error(f"Попытка использовать недоступную GigaChat для пользователя {username}")
-            return
+            if editor:
+                await editor.cancel()
+            error_message = f"❌ Ошибка при работе с {provider.label}: {str(e)}"
+            await processing_message.edit_text(error_message, reply_markup=self.failover_markup(user_id, user_message, provider.name))
+            logger.error(f"Ошибка {provider.label} для пользователя {username}: {e}", exc_info=True)
+            ERRORS_TOTAL.inc(provider.name, "timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+    
+    async def call_provider(self, provider: LLMProvider, processing_message, user_message: str, username: str,
+                            user_id: int, web_context: str,
+                            hedge: Optional[HedgedCall] = None) -> Tuple[str, Optional[StreamingEditor]]:
+        """Запрос к модели; одинаковые одновременные запросы разделяют один вызов модели
         
-        try:
-            api_logger.info(f"Отправка запроса в GigaChat для пользователя {username}")
-            
-            # Формируем промпт для GigaChat с актуальной датой
-            from datetime import datetime
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            current_year = datetime.now().year
-            
-            # Проверяем тип запроса
-            weather_keywords = ['погод', 'температур', 'градус', 'тепло', 'холодно', 'дожд', 'снег']
-            map_keywords = ['карт', 'адрес', 'координат', 'местоположен', 'как добраться', 'где находится', 'где ', 'остановк', 'магазин', 'универмаг']
-            # Расширенный список для веб-поиска - включаем больше случаев
-            search_keywords = [
-                'сейчас', 'новост', 'актуальн', 'текущ', 'последн',
-                'что там', 'как там', 'что с', 'что происходит', 
-                'где', 'когда', 'кто', 'какой', 'какая', 'какие',
-                '2024', '2025', 'год', 'месяц',
-                'президент', 'правительств', 'министр', 'выбор', 'победил',
-                'эмануэль', 'макрон', 'трамп', 'путин', 'байден',
-                'франц', 'росси', 'америк', 'сша', 'украин',
-                'событи', 'ситуаци', 'положени', 'состояни',
-                'подал', 'ушел', 'уволи', 'назначи', 'избра'
-            ]
-            
-            needs_weather = any(keyword in user_message.lower() for keyword in weather_keywords)
-            needs_map = any(keyword in user_message.lower() for keyword in map_keywords)
-            needs_search = any(keyword in user_message.lower() for keyword in search_keywords)
-            
-            web_context = ""
-            
-            # Проверяем погоду
-            if needs_weather:
-                api_logger.info(f"🌤️ Запрос погоды для GigaChat: {user_message}")
-                # Пытаемся извлечь название города
-                import re
-                # Ищем "в [город]" или "погода [город]"
-                city_match = re.search(r'в\s+([А-Яа-яA-Za-z\-]+)', user_message)
-                if not city_match:
-                    city_match = re.search(r'погод[аые]\s+([А-Яа-яA-Za-z\-]+)', user_message)
-                
-                if city_match:
-                    city = city_match.group(1)
-                    weather_info = get_weather(city)
-                    if weather_info:
-                        web_context = weather_info
-                        api_logger.info(f"✅ Получена погода для {city}")
-            
-            # Проверяем карты
-            if needs_map and not web_context:
-                api_logger.info(f"🗺️ Запрос карт для GigaChat: {user_message}")
-                # Пытаемся извлечь местоположение
-                import re
-                location_match = re.search(r'(?:карт[аыу]|адрес|координат[ыа]|где находится|как добраться|где)\s+(.+)', user_message, re.IGNORECASE)
-                if location_match:
-                    location = location_match.group(1).strip('?!.')
-                    maps_info = get_maps_info(location)
-                    if maps_info:
-                        web_context = maps_info
-                        api_logger.info(f"✅ Найдено местоположение на карте: {location}")
-                    else:
-                        api_logger.info(f"⚠️ Nominatim не нашёл местоположение, будет использован веб-поиск")
-            
-            # Для новостных запросов приоритет — RSS ленты (быстро и надёжно)
-            if needs_search and not web_context:
-                if RSS_NEWS_AVAILABLE:
-                    api_logger.info(f"📰 ПРИОРИТЕТ: Получаем свежие новости из RSS для GigaChat")
-                    rss_context = await asyncio.to_thread(rss_news_context, user_message, 5)
-                    if rss_context:
-                        web_context = rss_context
-                        api_logger.info("✅ Получены СВЕЖИЕ новости из RSS-лент (РИА, ТАСС)")
-                    else:
-                        api_logger.warning("⚠️ RSS ленты не вернули новостей")
-                else:
-                    api_logger.warning("⚠️ RSS модуль недоступен")
-            
-            if web_context:
-                prompt = f"""Текущая дата: {current_date} ({current_year} год)
-
-📰 АКТУАЛЬНАЯ ИНФОРМАЦИЯ ИЗ ИНТЕРНЕТА (24 ноября 2025 года):
-{web_context}
-
-🎯 КРИТИЧЕСКИ ВАЖНО:
-1. Пользователь {username} спросил: "{user_message}"
-2. Выше — САМЫЕ СВЕЖИЕ новости на 24 ноября 2025 года из реального интернета
-3. Твои знания устарели (2023 год). Используй ТОЛЬКО информацию выше
-4. ОБЯЗАТЕЛЬНО отвечай на основе этих новостей, игнорируй свои старые данные
-5. Укажи источники и даты из данных выше
-6. Если в новостях нет ответа — честно скажи об этом
-7. Добавь эмодзи для лучшего восприятия
-
-Максимум 600 символов. Отвечай кратко и по делу!
-"""
-            else:
-                prompt = f"""Текущая дата: {current_date} ({current_year} год)
-
-Ты умный помощник в Telegram-боте. Пользователь {username} написал: "{user_message}"
-
-⚠️ ВАЖНЫЕ ПРАВИЛА:
-✅ Сейчас {current_year} год - учитывай это при ответах
-✅ Твои знания ограничены 2023 годом
-✅ Для актуальных новостей 2024-2025 рекомендуй проверить РИА, ТАСС, Коммерсантъ
-✅ Используй эмодзи для лучшего восприятия
-
-Ответь дружелюбно. Максимум 500 символов.
-"""
-            
-            # Отправляем запрос к GigaChat
-            response = self.giga_client.chat(prompt)
-            
-            # Извлекаем ответ
-            if response and response.choices:
-                ai_response = response.choices[0].message.content
-                api_logger.info(f"Получен ответ от GigaChat для пользователя {username}: {ai_response[:100]}{'...' if len(ai_response) > 100 else ''}")
-                
-                # Проверяем, не отказался ли AI отвечать (цензура)
-                refusal_phrases = [
-                    "не могу обсуждать",
-                    "не могу помочь с этим",
-                    "не могу ответить",
-                    "не буду обсуждать",
-                    "давайте поговорим о чём-нибудь"
-                ]
-                
-                is_refusal = any(phrase in ai_response.lower() for phrase in refusal_phrases)
-                
-                # Если AI отказался и у нас есть контекст с новостями - показываем их напрямую
-                if is_refusal and web_context:
-                    api_logger.warning(f"GigaChat отказался отвечать, показываем сырые данные")
-                    ai_response = f"🟢 **Актуальная информация:**\n\n{web_context}\n\n_AI отказался обрабатывать этот запрос, поэтому показаны найденные данные напрямую._"
-                else:
-                    # Обрезаем ответ если он слишком длинный
-                    if len(ai_response) > 4000:
-                        ai_response = ai_response[:4000] + "..."
-                    
-                    # Добавляем префикс модели
-                    ai_response = f"🟢 **GigaChat:**\n\n{ai_response}"
-                
-                # Создаем кнопку возврата в меню
-                keyboard = [[InlineKeyboardButton("🔄 Вернуться к выбору модели", callback_data="back_to_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await processing_message.edit_text(ai_response, parse_mode='Markdown', reply_markup=reply_markup)
-                self.stats['giga_requests'] += 1
-                logger.info(f"Ответ GigaChat отправлен пользователю {username}")
+        Ведущий запрос занимает очередь и показывает потоковый ответ в своей заглушке, остальные ждут
+        его готовый ответ (редактор у них None — ответ выводится целиком)
+        """
+        if not LLM_COALESCE:
+            return await self.query_provider(provider, processing_message, user_message, username, user_id,
+                                             web_context, hedge)
+        
+        editor = None
+        leader = False
+        
+        async def load() -> str:
+            nonlocal editor, leader
+            leader = True
+            response_text, editor = await self.query_provider(provider, processing_message, user_message, username,
+                                                              user_id, web_context, hedge)
+            return response_text
+        
+        key = (normalize_question(user_message), hash(web_context))
+        response_text = await self.llm_flights[provider.name].do(key, load)
+        if not leader:
+            tracer.set_attribute("coalesced", provider.name)
+            api_logger.info(f"Запрос пользователя {username} к {provider.label} объединён с таким же выполняющимся")
+        return response_text, editor
+    
+    async def query_provider(self, provider: LLMProvider, processing_message, user_message: str, username: str,
+                             user_id: int, web_context: str,
+                             hedge: Optional[HedgedCall] = None) -> Tuple[str, Optional[StreamingEditor]]:
+        """Очередь к модели и генерация ответа; при дублировании сообщение-заглушку правит только победитель"""
+        # Промпт в формате конкретной модели
+        request = provider.build_request(user_message, username, web_context)
+        
+        # Ждём своей очереди к модели; позиция показывается в сообщении-заглушке
+        queue_shown = False
+        
+        async def show_position(position: int) -> None:
+            nonlocal queue_shown
+            if hedge and hedge.winner not in (None, provider.name):
+                return
+            queue_shown = True
+            await processing_message.edit_text(f"⏳ Вы в очереди к {provider.label}: {position}-й")
+        
+        editor = None
+        queue_started = time.perf_counter()
+        async with self.limiters[provider.name].slot(user_id, on_position=show_position):
+            STAGE_SECONDS.observe(time.perf_counter() - queue_started, "queue")
+            tracer.record("queue", queue_started, provider=provider.name)
+            if queue_shown and (hedge is None or hedge.winner in (None, provider.name)):
+                await processing_message.edit_text("🤔 Обрабатываю ваш запрос...")
+            if STREAM_RESPONSES and provider.name in STREAM_PROVIDERS:
+                # Потоковый режим: частичный ответ сразу появляется в сообщении-заглушке
+                editor = StreamingEditor(processing_message, prefix=f"{provider.emoji} {provider.label}:\n\n",
+                                         min_interval=STREAM_EDIT_INTERVAL)
+            with stage("llm", provider=provider.name):
+                llm_started = time.perf_counter()
+                try:
+                    response_text = await self.generate(provider, request, editor, hedge)
+                except asyncio.CancelledError:
+                    # Проигравший дубль отменён — это не ошибка модели
+                    if editor:
+                        await editor.cancel()
+                    raise
+                except Exception:
+                    if editor:
+                        await editor.cancel()
+                    # Ошибки и таймауты модели учитывает предохранитель
+                    self.router.record(provider.name, time.perf_counter() - llm_started, False)
+                    raise
+            self.router.record(provider.name, time.perf_counter() - llm_started, bool(response_text))
+        return response_text, editor
+    
+    def context_fingerprint(self, intent) -> Optional[Tuple]:
+        """Отпечаток снимка погоды или RSS, из которого будет собран контекст, без обращения к сети
+        
+        None — ответ не кэшируется: вопрос без контекста, про карты или снимка ещё нет в памяти
+        """
+        if intent.needs_map and intent.location:
+            return None
+        if intent.needs_weather and intent.city:
+            found, weather = weather_cache.get(normalize_city_name(intent.city).lower())
+            return ('weather', hash(weather)) if found and weather else None
+        if intent.needs_search and RSS_NEWS_AVAILABLE and get_rss_poller().version:
+            return ('rss', get_rss_poller().version)
+        return None
+    
+    def answer_key(self, provider_name: str, user_message: str, fingerprint: Optional[Tuple]) -> Optional[Tuple]:
+        """Ключ кэша ответов: модель, нормализованный вопрос и отпечаток снимка"""
+        if ANSWER_CACHE_TTL <= 0 or not fingerprint:
+            return None
+        return provider_name, normalize_question(user_message), fingerprint
+    
+    async def reply_cached(self, update: Update, user_message: str, username: str, selected_model: Optional[str],
+                           intent) -> bool:
+        """Отвечает из кэша ответов; без выбранной модели подходит ответ любой модели"""
+        if ANSWER_CACHE_TTL <= 0:
+            return False
+        fingerprint = self.context_fingerprint(intent)
+        if not fingerprint:
+            return False
+        names = [name for name in ([selected_model] if selected_model else self.providers) if name in self.providers]
+        keys = [self.answer_key(name, user_message, fingerprint) for name in names]
+        if not keys:
+            return False
+        key, response_text = answer_cache.lookup(keys)
+        if key is None:
+            return False
+        label = self.providers[key[0]].label
+        tracer.set_attribute("answer_cache", key[0])
+        with stage("telegram_send"):
+            await update.message.reply_text(response_text, parse_mode='Markdown', reply_markup=self.back_to_menu_markup())
+        logger.info(f"Ответ {label} для пользователя {username} взят из кэша ответов")
+        return True
+    
+    def store_answer(self, provider_name: str, user_message: str, fingerprint: Optional[Tuple], response_text: str) -> None:
+        """Сохраняет готовый ответ под отпечатком снимка, по которому собран контекст"""
+        key = self.answer_key(provider_name, user_message, fingerprint)
+        if key is not None:
+            answer_cache.set(key, response_text)
+    
+    def hedge_partner(self, provider: LLMProvider) -> Optional[LLMProvider]:
+        """Вторая модель для дублирования запроса, если она исправна"""
+        alternative = self.router.alternative(provider.name)
+        return self.providers[alternative] if alternative else None
+    
+    async def hedged_call(self, primary: LLMProvider, secondary: LLMProvider, processing_message, user_message: str,
+                          username: str, user_id: int, web_context: str) -> Tuple[LLMProvider, str, Optional[StreamingEditor]]:
+        """Запрос к основной модели; если она не ответила за свой p90, тот же запрос уходит во вторую"""
+        delay = self.router.breakers[primary.name].latency(0.9) or HEDGE_DELAY
+        
+        def allow_hedge() -> bool:
+            # Дубль тратит бюджет и должен пройти предохранитель второй модели
+            return self.hedge_budget.try_spend() and self.router.allow(secondary.name)
+        
+        def attempt(provider: LLMProvider):
+            return lambda hedge: self.call_provider(provider, processing_message, user_message, username, user_id,
+                                                    web_context, hedge)
+        
+        self.hedge_budget.on_request()
+        # Попытка возвращает (текст, редактор): успех — непустой текст
+        hedge = HedgedCall(delay, allow_hedge, succeeded=lambda result: bool(result and result[0]))
+        winner, result = await hedge.run((primary.name, attempt(primary)), (secondary.name, attempt(secondary)))
+        if hedge.hedged:
+            HEDGED_TOTAL.inc(primary.name, "win" if winner == secondary.name else "loss")
+            tracer.set_attribute("hedged", winner)
+            logger.info(f"Запрос пользователя {username} продублирован в {secondary.label} через {delay:.1f} с, "
+                        f"ответила {self.providers[winner].label}")
+        response_text, editor = result if result else ("", None)
+        return self.providers[winner], response_text, editor
+    
+    async def gather_context(self, user_message: str, intent) -> Tuple[str, Optional[Tuple]]:
+        """Опрашивает нужные источники контекста одновременно и выбирает самый приоритетный ответ
+        
+        Возвращает (контекст, отпечаток снимка погоды или RSS, из которого он собран); для карт
+        и без контекста отпечаток None — такой ответ не кэшируется
+        """
+        lookups = {}
+        news_version = None
+        if intent.needs_weather:
+            api_logger.info(f"🌤️ Запрос погоды: {user_message}")
+            if intent.city:
+                lookups['weather'] = lambda: get_weather(intent.city)
+        if intent.needs_map:
+            api_logger.info(f"🗺️ Запрос карт: {user_message}")
+            if intent.location:
+                lookups['maps'] = lambda: get_maps_info(intent.location)
+        # Для новостных запросов — RSS ленты: снимок держит в памяти фоновый поллер
+        if intent.needs_search:
+            if RSS_NEWS_AVAILABLE:
+                async def load_news() -> str:
+                    nonlocal news_version
+                    # Версия читается в том же шаге цикла событий, что и снимок
+                    news_version = get_rss_poller().version
+                    return await self.get_news_context(user_message)
                 
+                lookups['rss'] = load_news
             else:
-                keyboard = [[InlineKeyboardButton("🔄 Вернуться к выбору модели", callback_data="back_to_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await processing_message.edit_text("❌ Не удалось получить ответ от GigaChat. Попробуйте еще раз.", reply_markup=reply_markup)
-                logger.error(f"Пустой ответ от GigaChat для пользователя {username}")
-                self.stats['errors'] += 1
-                
+                api_logger.warning("⚠️ RSS модуль недоступен")
+        
+        if not lookups:
+            return "", None
+        
+        results = await asyncio.gather(*(self.lookup_source(source, loader) for source, loader in lookups.items()))
+        found = dict(zip(lookups, results))
+        
+        for source in ENRICHMENT_PRIORITY:
+            if found.get(source):
+                api_logger.info(f"✅ Контекст для ответа получен из источника {source}")
+                if source == 'weather':
+                    # Отпечаток — только для погоды из кэша погоды: ответы без ключа API и сообщения об ошибках
+                    # в кэш не попадают, context_fingerprint для них отпечатка не даст
+                    fingerprint = ('weather', hash(found[source]))
+                    return found[source], fingerprint if self.context_fingerprint(intent) == fingerprint else None
+                if source == 'rss' and news_version:
+                    return found[source], ('rss', news_version)
+                return found[source], None
+        
+        if 'maps' in found:
+            api_logger.info(f"⚠️ Nominatim не нашёл местоположение: {intent.location}")
+        if 'rss' in found:
+            api_logger.warning("⚠️ RSS ленты не вернули новостей")
+        return "", None
+    
+    async def lookup_source(self, source: str, loader) -> str:
+        """Запрашивает один источник со своим таймаутом; сбой источника не мешает остальным"""
+        timeout = ENRICHMENT_TIMEOUTS[source]
+        try:
+            with stage(source):
+                return await asyncio.wait_for(loader(), timeout=timeout) or ""
+        except asyncio.TimeoutError:
+            api_logger.warning(f"⏱️ Источник {source} не ответил за {timeout} с")
+            ENRICHMENT_TIMEOUTS_TOTAL.inc(source)
         except Exception as e:
-            error_message = f"❌ Ошибка при работе с GigaChat: {str(e)}"
-            keyboard = [[InlineKeyboardButton("🔄 Вернуться к выбору модели", callback_data="back_to_menu")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await processing_message.edit_text(error_message, reply_markup=reply_markup)
-            logger.error(f"Ошибка GigaChat для пользователя {username}: {e}", exc_info=True)
-            self.stats['errors'] += 1
+            api_logger.warning(f"⚠️ Ошибка источника {source}: {e}")
+        return ""
+    
+    async def get_news_context(self, user_message: str) -> str:
+        """Свежие новости из снимка RSS-лент"""
+        return rss_news_context(user_message, 5)
+    
+    async def generate(self, provider: LLMProvider, request, editor: Optional[StreamingEditor] = None,
+                       hedge: Optional[HedgedCall] = None) -> str:
+        """Получает ответ модели; при потоковом выводе показывает частичный текст в заглушке"""
+        if editor is None:
+            response_text = await provider.complete(request)
+            api_logger.info(f"Запрос к {provider.label} завершён, получен результат")
+            return response_text
+        
+        response_text = ""
+        async for response_text in provider.stream(request):
+            # При дублировании показывать ответ может только первая начавшая отвечать модель
+            if hedge is None or hedge.claim(provider.name):
+                editor.push(response_text)
+        api_logger.info(f"Потоковый ответ {provider.label} завершён, первый фрагмент через {editor.time_to_first_edit or 0:.2f} с")
+        return response_text
+    
+    @staticmethod
+    def back_to_menu_markup() -> InlineKeyboardMarkup:
+        """Кнопка возврата к выбору модели под ответом"""
+        keyboard = [[InlineKeyboardButton("🔄 Вернуться к выбору модели", callback_data="back_to_menu")]]
+        return InlineKeyboardMarkup(keyboard)
+    
+    async def post_init(self, application: Application) -> None:
+        """Запуск фоновых задач после инициализации приложения"""
+        if RSS_NEWS_AVAILABLE:
+            get_rss_poller().start()
+        # Эндпоинт метрик и измерение задержки цикла событий
+        if self.metrics_server:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logger.error(f"❌ Не удалось запустить эндпоинт метрик на порту {METRICS_PORT}: {e}")
+        self.loop_lag_monitor.start()
+        if tracer.exporter:
+            tracer.exporter.start()
+            logger.info(f"Трассы отправляются в OTLP-коллектор {TRACE_OTLP_ENDPOINT}")
+        # Проверка моделей идёт в фоне: бот уже принимает обновления
+        self.health_task = asyncio.create_task(self.check_providers(), name="llm-health-probe")
+    
+    async def check_providers(self) -> None:
+        """Фоновая проверка всех моделей параллельно"""
+        await asyncio.gather(*(self.check_provider(name, provider) for name, provider in self.providers.items()))
+    
+    async def check_provider(self, name: str, provider: LLMProvider) -> None:
+        """Создаёт клиент модели заранее и проверяет её способом, который задаёт сама модель"""
+        self.provider_health[name] = None
+        started = time.perf_counter()
+        try:
+            await provider.health_check()
+            self.provider_health[name] = True
+            logger.info(f"✅ {provider.label} доступен и работает (проверка {time.perf_counter() - started:.2f} с)")
+        except Exception as e:
+            self.provider_health[name] = False
+            self.router.record(name, time.perf_counter() - started, False)
+            logger.warning(f"❌ {provider.label} недоступен: {e}")
+    
+    async def post_shutdown(self, application: Application) -> None:
+        """Освобождение ресурсов при остановке бота"""
+        if self.health_task:
+            self.health_task.cancel()
+            await asyncio.gather(self.health_task, return_exceptions=True)
+        if RSS_NEWS_AVAILABLE:
+            await get_rss_poller().stop()
+        await self.loop_lag_monitor.stop()
+        if tracer.exporter:
+            await tracer.exporter.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self.giga_provider:
+            await self.giga_provider.aclose()
+        if self.yandex_provider:
+            await self.yandex_provider.aclose()
+        await close_http_client()
+        geocode_cache.close()
+        logger.info("Ресурсы бота освобождены")
     
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработчик ошибок"""
         logger.error(f"Произошла ошибка: {context.error}", exc_info=context.error)
-        self.stats['errors'] += 1
+        ERRORS_TOTAL.inc("bot", "error")
     
     def run(self):
         """Запуск бота"""
@@ -1225,27 +1586,8 @@ class UnifiedBot:
         logger.info("ЗАПУСК ОБЪЕДИНЕННОГО TELEGRAM БОТА")
         logger.info("=" * 50)
         
-        # Проверяем доступность моделей
-        if self.yandex_model:
-            logger.info("✅ Yandex GPT доступен")
-        else:
-            logger.warning("❌ Yandex GPT недоступен")
-        
-        # Для GigaChat проверяем наличие клиента и пытаемся сделать тестовый запрос
-        gigachat_available = False
-        if self.giga_client:
-            try:
-                # Пытаемся сделать простой тестовый запрос
-                test_response = self.giga_client.chat("тест")
-                gigachat_available = True
-                logger.info("✅ GigaChat доступен и работает")
-            except Exception as e:
-                logger.warning(f"❌ GigaChat недоступен: {e}")
-                gigachat_available = False
-        else:
-            logger.warning("❌ GigaChat недоступен - клиент не инициализирован")
-        
-        if not self.yandex_model and not gigachat_available:
+        # Модели проверяются в фоне после запуска (post_init), чтобы не задерживать приём обновлений
+        if not self.providers:
             logger.error("❌ Ни одна модель не доступна!")
         
         logger.info("Бот запущен и готов к работе!")
@@ -1253,8 +1595,19 @@ class UnifiedBot:
         print("✅ Конфигурация загружена")
         print("📝 Логи сохраняются в папку logs/")
         
-        # Запускаем бота
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        # Запускаем бота: оба режима передают обновления в одну и ту же очередь обработчиков
+        if BOT_MODE == "webhook":
+            self.application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET or None,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        else:
+            self.application.run_polling(allowed_updates=Update.ALL_TYPES, timeout=POLLING_TIMEOUT)
 
 def main():
     """Основная функция"""